@@ -0,0 +1,6 @@
+"""
+This package contains the performance benchmarks for the application.
+
+Each benchmark is a module that can be run from the ``src`` directory, e.g.
+``python -m bench.concurrency``.
+"""
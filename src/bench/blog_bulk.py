@@ -0,0 +1,65 @@
+"""
+Bulk blog creation benchmark
+
+This module measures blog creation throughput with one ``create_blog``
+call (and so one transaction) per blog versus ``create_blogs``, which
+inserts every blog in one transaction with chunked executemany INSERTs.
+
+Usage:
+    python -m bench.blog_bulk [--blogs 10000] [--chunk-size 1000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["ENV"] = "dev"
+os.environ["DEV_DB_URI"] = f"sqlite:///{DB_FILE}"
+
+import data
+from data import blog, user
+from model.blog import BlogCreate
+from model.user import UserCreate
+
+
+async def main(blogs: int, chunk_size: int):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        blogs (int): number of blogs created by each method
+        chunk_size (int): number of rows per INSERT statement
+    """
+    await data.init_db()
+    author = await user.create_user(
+        UserCreate(username="bench", password="benchmark")
+    )
+    new_blogs = [
+        BlogCreate(user_id=author.id, title=f"Bench {i}", content="Benchmark")
+        for i in range(blogs)
+    ]
+
+    start = time.perf_counter()
+    for new_blog in new_blogs:
+        await blog.create_blog(new_blog)
+    before = blogs / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await blog.create_blogs(new_blogs, chunk_size=chunk_size)
+    after = blogs / (time.perf_counter() - start)
+
+    print(f"{blogs} blogs, chunk size {chunk_size}")
+    print(f"  before (create_blog):   {before:10.1f} blogs/s")
+    print(f"  after  (create_blogs):  {after:10.1f} blogs/s")
+    print(f"  speedup:                {after / before:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--blogs", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.blogs, args.chunk_size))
@@ -0,0 +1,146 @@
+"""
+Blog search benchmark
+
+This module builds a corpus of generated posts and measures the latency
+of ranked full-text searches (``search_blogs``) against the only search
+available before, a ``LIKE`` scan of every post.
+
+Usage:
+    python -m bench.blog_search [--posts 1000000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["ENV"] = "dev"
+os.environ["DEV_DB_URI"] = f"sqlite:///{DB_FILE}"
+
+from sqlmodel import func, select
+
+import data
+from data import blog, unit_of_work, user
+from data.blog import Blog
+from model.blog import BlogCreate
+from model.user import UserCreate
+
+VOCABULARY = [f"word{i}" for i in range(20000)]
+# Zipf-like frequencies: a few very common words and a long tail
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+QUERIES = {
+    "common word": "word1",
+    "mid word": "word500",
+    "rare word": "word19000",
+    "two words": "word3 word40",
+}
+SEED_CHUNK = 50000
+
+
+def text(words: int) -> str:
+    """
+    Generate text from the vocabulary
+
+    Args:
+        words (int): number of words
+
+    Returns:
+        str: generated text
+    """
+    return " ".join(random.choices(VOCABULARY, WEIGHTS, k=words))
+
+
+async def seed(posts: int, user_id: str):
+    """
+    Insert ``posts`` generated posts, indexed by the search triggers
+
+    Args:
+        posts (int): number of posts
+        user_id (str): id of their author
+    """
+    for start in range(0, posts, SEED_CHUNK):
+        await blog.create_blogs(
+            [
+                BlogCreate(user_id=user_id, title=text(6), content=text(80))
+                for _ in range(min(SEED_CHUNK, posts - start))
+            ]
+        )
+
+
+async def timed(search, repeat: int) -> tuple[float, float]:
+    """
+    Time a search
+
+    Args:
+        search (Callable[[], Awaitable]): search to run
+        repeat (int): number of runs
+
+    Returns:
+        tuple[float, float]: median and worst latency in milliseconds
+    """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await search()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), max(latencies)
+
+
+async def like_scan(query: str):
+    """
+    Search with the pre-index method, a LIKE scan of every post; like a
+    ranked search it has to find every match, not just the first page
+
+    Args:
+        query (str): words to search
+    """
+    statement = select(func.count()).select_from(Blog)
+    for word in query.split():
+        statement = statement.where(
+            Blog.title.contains(word) | Blog.content.contains(word)
+        )
+    async with unit_of_work() as session:
+        (await session.exec(statement)).one()
+
+
+async def main(posts: int, repeat: int):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        posts (int): number of posts in the corpus
+        repeat (int): number of runs of each search
+    """
+    await data.init_db()
+    random.seed(0)
+    author = await user.create_user(
+        UserCreate(username="bench", password="benchmark")
+    )
+    start = time.perf_counter()
+    await seed(posts, author.id)
+    print(
+        f"{posts} posts inserted and indexed in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+    print(
+        f"  {'query':<12} {'search p50/max (ms)':>22} {'LIKE p50/max (ms)':>22}"
+    )
+    for name, query in QUERIES.items():
+        search = await timed(lambda: blog.search_blogs(query), repeat)
+        scan = await timed(lambda: like_scan(query), max(repeat // 10, 1))
+        print(
+            f"  {name:<12} {search[0]:>12.1f} / {search[1]:>7.1f} "
+            f"{scan[0]:>12.1f} / {scan[1]:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.posts, args.repeat))
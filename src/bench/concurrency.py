@@ -0,0 +1,143 @@
+"""
+Concurrency benchmark
+
+This module measures the throughput of concurrent blog reads when the
+handler blocks the event loop with a synchronous ``Session`` (the old data
+layer) versus when it awaits the ``AsyncSession`` based data layer.
+
+Every SQL statement is given the same artificial latency (``--latency-ms``)
+so the numbers model a database that takes time to answer, which is where
+blocking the event loop hurts.
+
+Usage:
+    python -m bench.concurrency [--requests 200] [--latency-ms 5]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["ENV"] = "dev"
+os.environ["DEV_DB_URI"] = f"sqlite:///{DB_FILE}"
+# Every read goes to the database, as in the blocking app
+os.environ["RESPONSE_CACHE_BYTES"] = "0"
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.util import await_only
+from sqlmodel import Session, select
+
+import data
+from data import blog, user
+from data.blog import Blog
+from model.blog import BlogCreate
+from model.user import UserCreate
+from web import create_app
+
+LATENCY = 0.005
+
+
+def _slow_statement(statement: str):
+    """
+    Trace callback that delays every statement by ``LATENCY`` seconds
+    """
+    time.sleep(LATENCY)
+
+
+def blocking_app(db_uri: str) -> FastAPI:
+    """
+    Create an app whose blog read handler uses a synchronous Session
+
+    Args:
+        db_uri (str): database URI
+
+    Returns:
+        FastAPI: A FastAPI app
+    """
+    sync_engine = create_engine(db_uri)
+
+    @event.listens_for(sync_engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(_slow_statement)
+
+    app = FastAPI()
+
+    @app.get("/api/blog/{blog_id}")
+    async def read_blog(blog_id: str):
+        with Session(sync_engine) as session:
+            return session.exec(select(Blog).where(Blog.id == blog_id)).first()
+
+    return app
+
+
+async def run(app: FastAPI, blog_id: str, requests: int) -> float:
+    """
+    Fire ``requests`` concurrent blog reads at ``app``
+
+    Args:
+        app (FastAPI): app under test
+        blog_id (str): id of the blog to read
+        requests (int): number of concurrent requests
+
+    Returns:
+        float: requests per second
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(client.get(f"/api/blog/{blog_id}") for _ in range(requests))
+        )
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    return requests / elapsed
+
+
+async def main(requests: int):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        requests (int): number of concurrent requests
+    """
+    await data.init_db()
+    author = await user.create_user(
+        UserCreate(username="bench", password="benchmark")
+    )
+    created = await blog.create_blog(
+        BlogCreate(user_id=author.id, title="Bench", content="Benchmark")
+    )
+
+    @event.listens_for(data.engine.sync_engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        await_only(
+            dbapi_connection.driver_connection.set_trace_callback(
+                _slow_statement
+            )
+        )
+
+    await data.engine.dispose()
+
+    before = await run(blocking_app(data.DB_URI), created.id, requests)
+    after = await run(create_app(), created.id, requests)
+    print(
+        f"{requests} concurrent GET /api/blog/{{id}}, "
+        f"{LATENCY * 1000:g} ms/statement"
+    )
+    print(f"  before (sync Session):  {before:10.1f} req/s")
+    print(f"  after  (AsyncSession):  {after:10.1f} req/s")
+    print(f"  speedup:                {after / before:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    args = parser.parse_args()
+    LATENCY = args.latency_ms / 1000
+    asyncio.run(main(args.requests))
@@ -0,0 +1,99 @@
+"""
+Id insert benchmark
+
+This module measures blog insert throughput with random UUIDv4 ids versus
+time-ordered UUIDv7 ids, on a database much larger than the page cache,
+where random primary key positions turn into page splits and cache misses.
+
+Usage:
+    python -m bench.id_insert [--rows 1000000] [--batch 1000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+os.environ["ENV"] = "dev"
+
+from sqlalchemy import create_engine, event, insert
+from sqlmodel import SQLModel
+
+import data
+from data.blog import Blog
+from data.ids import new_id
+
+GENERATORS = {
+    "uuid4": lambda: str(uuid.uuid4()),
+    "uuid7": new_id,
+}
+
+
+def run(generate, rows: int, batch: int) -> tuple[float, int]:
+    """
+    Insert ``rows`` blogs in transactions of ``batch`` rows
+
+    Args:
+        generate (Callable[[], str]): id generator
+        rows (int): number of blogs
+        batch (int): number of blogs per transaction
+
+    Returns:
+        tuple[float, int]: rows per second and database size in bytes
+    """
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        # 2 MB page cache, the SQLite default, far below the table size
+        dbapi_connection.execute("PRAGMA cache_size = -2000")
+
+    SQLModel.metadata.create_all(engine, tables=[Blog.__table__])
+    now = data.utcnow()
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        with engine.begin() as connection:
+            connection.execute(
+                insert(Blog),
+                [
+                    {
+                        "id": generate(),
+                        "user_id": "bench",
+                        "title": "Bench",
+                        "content": "Benchmark",
+                        "time_created": now,
+                        "time_updated": now,
+                    }
+                    for _ in range(min(batch, rows - offset))
+                ],
+            )
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    return rows / elapsed, os.path.getsize(path)
+
+
+def main(rows: int, batch: int):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        rows (int): number of blogs inserted with each generator
+        batch (int): number of blogs per transaction
+    """
+    print(f"{rows} blogs, {batch} per transaction")
+    results = {}
+    for name, generate in GENERATORS.items():
+        results[name] = run(generate, rows, batch)
+        rate, size = results[name]
+        print(f"  {name}:  {rate:10.1f} rows/s  {size / 2**20:8.1f} MiB")
+    print(f"  speedup: {results['uuid7'][0] / results['uuid4'][0]:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.rows, args.batch)
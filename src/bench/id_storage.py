@@ -0,0 +1,152 @@
+"""
+Id storage benchmark
+
+This module compares the size of the blog table and its indexes, and the
+speed of primary key and foreign key lookups, with ids stored as
+36-character TEXT versus 16-byte BLOB (``UUIDBlob``).
+
+Usage:
+    python -m bench.id_storage [--users 10000] [--blogs 500000]
+        [--lookups 20000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ["ENV"] = "dev"
+
+from sqlalchemy import (
+    MetaData,
+    String,
+    bindparam,
+    create_engine,
+    insert,
+    select,
+)
+from sqlmodel import SQLModel
+
+import data
+from data.blog import Blog
+from data.ids import new_id
+
+
+def blog_table(storage: str):
+    """
+    Get the blog table with ids stored as ``storage``
+
+    Args:
+        storage (str): ``text`` or ``blob``
+
+    Returns:
+        Table: blog table
+    """
+    if storage == "blob":
+        return Blog.__table__
+    metadata = MetaData()
+    for table in SQLModel.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    table = metadata.tables["blog"]
+    for name in ("id", "user_id"):
+        table.c[name].type = String()
+    return table
+
+
+def run(storage: str, user_ids: list[str], blog_ids: list[str], lookups: int):
+    """
+    Fill a new database and time lookups on it
+
+    Args:
+        storage (str): ``text`` or ``blob``
+        user_ids (list[str]): ids of the authors
+        blog_ids (list[str]): ids of the blogs
+        lookups (int): number of lookups of each kind
+
+    Returns:
+        tuple[dict[str, int], float, float]: bytes per table and index,
+            and primary key and foreign key lookups per second
+    """
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    table = blog_table(storage)
+    table.metadata.create_all(engine, tables=[table])
+    now = data.utcnow()
+    with engine.begin() as connection:
+        for start in range(0, len(blog_ids), 10000):
+            connection.execute(
+                insert(table),
+                [
+                    {
+                        "id": id,
+                        "user_id": random.choice(user_ids),
+                        "title": "Bench",
+                        "content": "Benchmark",
+                        "time_created": now,
+                        "time_updated": now,
+                    }
+                    for id in blog_ids[start : start + 10000]
+                ],
+            )
+    with engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+        sizes = dict(
+            connection.exec_driver_sql(
+                "SELECT name, sum(pgsize) FROM dbstat "
+                "WHERE name NOT LIKE 'sqlite_%' GROUP BY name"
+            ).all()
+        )
+        by_id = select(table.c.title).where(table.c.id == bindparam("id"))
+        by_user = (
+            select(table.c.id)
+            .where(table.c.user_id == bindparam("id"))
+            .limit(10)
+        )
+        rates = []
+        for statement, ids in ((by_id, blog_ids), (by_user, user_ids)):
+            sample = random.choices(ids, k=lookups)
+            start = time.perf_counter()
+            for id in sample:
+                connection.execute(statement, {"id": id}).all()
+            rates.append(lookups / (time.perf_counter() - start))
+    engine.dispose()
+    return sizes, *rates
+
+
+def main(users: int, blogs: int, lookups: int):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        users (int): number of authors
+        blogs (int): number of blogs
+        lookups (int): number of lookups of each kind
+    """
+    user_ids = [new_id() for _ in range(users)]
+    blog_ids = [new_id() for _ in range(blogs)]
+    print(f"{blogs} blogs by {users} users, {lookups} lookups of each kind")
+    results = {
+        s: run(s, user_ids, blog_ids, lookups) for s in ("text", "blob")
+    }
+    for name in results["text"][0]:
+        text, blob = results["text"][0][name], results["blob"][0][name]
+        print(
+            f"  {name:32} text {text / 2**20:7.1f} MiB"
+            f"  blob {blob / 2**20:7.1f} MiB  ({blob / text:4.0%})"
+        )
+    for i, kind in ((1, "by id"), (2, "by user_id")):
+        text, blob = results["text"][i], results["blob"][i]
+        print(
+            f"  lookups {kind:23} text {text:9.0f}/s"
+            f"  blob {blob:9.0f}/s  ({blob / text:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--blogs", type=int, default=500000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.users, args.blogs, args.lookups)
@@ -0,0 +1,246 @@
+"""
+Serialization benchmark
+
+This module measures the cost of turning database rows into response bytes
+for each read endpoint, in microseconds and peak bytes allocated per
+object, with the old path (dump the row to a dict and validate it into the
+data model, dump that and validate it into the response model, then let
+FastAPI validate the returned model again, dump it to a dict of JSON types
+and encode the dict with ``json.dumps``) versus the fast path (build the
+response model from the row attributes with ``from_row`` and render it
+with ``ModelResponse``).
+
+Usage:
+    python -m bench.serialization [--page 100] [--repeat 200]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable
+
+os.environ["ENV"] = "dev"
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from data import utcnow
+from data.blog import Blog
+from data.ids import new_id
+from data.user import User
+from model import from_row
+from model.blog import BlogInDB, BlogOut, BlogPage, BlogSearchHit
+from model.blog import BlogSearchPage
+from model.user import UserOut, UserPage, UserWithRole
+from web.responses import model_response
+
+
+def blog_row() -> Blog:
+    """
+    Get a blog row as read from the database
+
+    Returns:
+        Blog: Blog object
+    """
+    now = utcnow()
+    return Blog(
+        id=new_id(),
+        user_id=new_id(),
+        title="A benchmark blog title",
+        content="Lorem ipsum dolor sit amet. " * 40,
+        time_created=now,
+        time_updated=now,
+        version=1,
+    )
+
+
+def user_row() -> User:
+    """
+    Get a user row as read from the database
+
+    Returns:
+        User: User object
+    """
+    now = utcnow()
+    return User(
+        id=new_id(),
+        username=f"bench-{new_id()}",
+        password_hash="x" * 60,
+        role_id=new_id(),
+        time_created=now,
+        time_updated=now,
+    )
+
+
+_response_fields: dict[type, Any] = {}
+
+
+async def fastapi_body(model: type, content: Any) -> bytes:
+    """
+    Render a returned value the way FastAPI does for a response model
+
+    Args:
+        model (type): response model of the route
+        content (Any): value returned by the endpoint
+
+    Returns:
+        bytes: body of the response
+    """
+    # FastAPI creates the response field once, with the route
+    if model not in _response_fields:
+        _response_fields[model] = create_model_field(
+            "Response", model, mode="serialization"
+        )
+    return JSONResponse(
+        await serialize_response(
+            field=_response_fields[model], response_content=content
+        )
+    ).body
+
+
+def endpoints(page_size: int) -> dict[str, tuple[int, Callable, Callable]]:
+    """
+    Get the old and fast serialization of each read endpoint
+
+    Args:
+        page_size (int): number of rows in a page
+
+    Returns:
+        dict[str, tuple[int, Callable, Callable]]: per endpoint, the number
+            of objects in a response and the old and fast coroutines
+            rendering it
+    """
+    blog = blog_row()
+    blogs = [blog_row() for _ in range(page_size)]
+    snippet = "dolor <b>sit</b> amet"
+    user, role = user_row(), "user"
+    users = [user_row() for _ in range(page_size)]
+
+    def old_blog(b: Blog) -> BlogOut:
+        return BlogOut(**BlogInDB(**b.model_dump()).model_dump())
+
+    def old_user(u: User) -> UserOut:
+        return UserOut(
+            **UserWithRole(**u.model_dump(), role=role).model_dump()
+        )
+
+    async def old_read_blog():
+        return await fastapi_body(BlogOut, old_blog(blog))
+
+    async def fast_read_blog():
+        return model_response(from_row(BlogOut, blog)).body
+
+    async def old_read_all_blogs():
+        page = BlogPage(items=[old_blog(b) for b in blogs], next_cursor="c")
+        return await fastapi_body(BlogPage, page)
+
+    async def fast_read_all_blogs():
+        page = BlogPage(
+            items=[from_row(BlogOut, b) for b in blogs], next_cursor="c"
+        )
+        return model_response(page).body
+
+    async def old_search_blogs():
+        page = BlogSearchPage(
+            items=[
+                BlogSearchHit(**b.model_dump(), snippet=snippet) for b in blogs
+            ],
+            next_cursor="c",
+        )
+        return await fastapi_body(BlogSearchPage, page)
+
+    async def fast_search_blogs():
+        page = BlogSearchPage(
+            items=[from_row(BlogSearchHit, b, snippet=snippet) for b in blogs],
+            next_cursor="c",
+        )
+        return model_response(page).body
+
+    async def old_read_user():
+        return await fastapi_body(UserOut, old_user(user))
+
+    async def fast_read_user():
+        return model_response(
+            from_row(UserOut, from_row(UserWithRole, user, role=role))
+        ).body
+
+    async def old_read_all_users():
+        page = UserPage(items=[old_user(u) for u in users], next_cursor="c")
+        return await fastapi_body(UserPage, page)
+
+    async def fast_read_all_users():
+        page = UserPage(
+            items=[
+                from_row(UserOut, from_row(UserWithRole, u, role=role))
+                for u in users
+            ],
+            next_cursor="c",
+        )
+        return model_response(page).body
+
+    return {
+        "GET /blog/{id}": (1, old_read_blog, fast_read_blog),
+        "GET /blog/all": (page_size, old_read_all_blogs, fast_read_all_blogs),
+        "GET /blog/search": (page_size, old_search_blogs, fast_search_blogs),
+        "GET /user/{id}": (1, old_read_user, fast_read_user),
+        "GET /user/all": (page_size, old_read_all_users, fast_read_all_users),
+    }
+
+
+async def measure(
+    render: Callable[[], Awaitable[bytes]], objects: int, repeat: int
+) -> tuple[float, float]:
+    """
+    Measure a rendering
+
+    Args:
+        render (Callable[[], Awaitable[bytes]]): renders a response
+        objects (int): number of objects in the response
+        repeat (int): number of timed renderings
+
+    Returns:
+        tuple[float, float]: microseconds and peak bytes allocated per
+            object
+    """
+    await render()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await render()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await render()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return seconds / repeat / objects * 1e6, peak / objects
+
+
+async def main(page_size: int, repeat: int):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        page_size (int): number of rows in a page
+        repeat (int): number of timed renderings per endpoint and path
+    """
+    print(f"pages of {page_size}, {repeat} renderings per path")
+    for name, (objects, old, fast) in endpoints(page_size).items():
+        old_us, old_bytes = await measure(old, objects, repeat)
+        fast_us, fast_bytes = await measure(fast, objects, repeat)
+        assert await old() == await fast(), name
+        print(
+            f"  {name:16} old {old_us:6.1f} us/obj {old_bytes:7.0f} B/obj"
+            f"  fast {fast_us:6.1f} us/obj {fast_bytes:7.0f} B/obj"
+            f"  ({old_us / fast_us:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.page, args.repeat))
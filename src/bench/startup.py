@@ -0,0 +1,80 @@
+"""
+Startup benchmark
+
+This module measures the cold start of a worker: the time to import the
+app (which must do no database I/O) and the time of ``init_db`` on a new
+database and on an already set up one, each in a fresh interpreter.
+
+Usage:
+    python -m bench.startup [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+STEP = """
+import time
+start = time.perf_counter()
+from web import create_app
+app = create_app()
+imported = time.perf_counter()
+from data import init_db, run_sync
+run_sync(init_db())
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def measure(db_file: str) -> tuple[float, float]:
+    """
+    Start a fresh interpreter on ``db_file`` and time its startup
+
+    Args:
+        db_file (str): path of the SQLite database
+
+    Returns:
+        tuple[float, float]: seconds to import the app and to run init_db
+    """
+    env = dict(
+        os.environ, ENV="dev", DEV_DB_URI=f"sqlite:///{db_file}", DB_ECHO="0"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", STEP],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    imported, initialized = out.split()
+    return float(imported), float(initialized)
+
+
+def main(runs: int):
+    """
+    Run the benchmark and print the median of ``runs`` runs
+
+    Args:
+        runs (int): number of runs of each case
+    """
+    cold, warm = [], []
+    for _ in range(runs):
+        db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+        cold.append(measure(db_file))
+        warm.append(measure(db_file))
+    for name, results in (("new database", cold), ("existing", warm)):
+        imported = statistics.median(r[0] for r in results) * 1000
+        initialized = statistics.median(r[1] for r in results) * 1000
+        print(
+            f"  {name:<13} import {imported:8.1f} ms  "
+            f"init_db {initialized:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    main(args.runs)
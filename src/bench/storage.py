@@ -0,0 +1,200 @@
+"""
+Storage profile benchmark
+
+This module measures the throughput of a mixed read/write workload on the
+blog API for each SQLite storage profile: concurrent clients read single
+blogs and pages of blogs and create and update blogs, with the response
+cache disabled so every request reaches the database. Each profile runs in
+a fresh process on a fresh database file, so no connection, role cache or
+page cache is shared between the runs.
+
+Usage:
+    python -m bench.storage [--clients 16] [--requests 200] [--writes 0.2]
+        [--dir /var/tmp]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ["ENV"] = "dev"
+# Every read goes to the database
+os.environ["RESPONSE_CACHE_BYTES"] = "0"
+
+from httpx import ASGITransport, AsyncClient
+
+from data.storage import STORAGE_PROFILES
+
+BLOGS = 500
+
+
+async def client(
+    ac: AsyncClient,
+    user_id: str,
+    blog_ids: list[str],
+    requests: int,
+    writes: float,
+    latencies: list[float],
+) -> tuple[int, int]:
+    """
+    Send a random mix of reads and writes, one request at a time
+
+    Args:
+        ac (AsyncClient): client of the app
+        user_id (str): id of the author of the created blogs
+        blog_ids (list[str]): ids of the blogs to read and update
+        requests (int): number of requests
+        writes (float): share of the requests that write
+        latencies (list[float]): latencies in seconds, appended to
+
+    Returns:
+        tuple[int, int]: number of failed requests and of writes sent
+    """
+    failed = written = 0
+    for _ in range(requests):
+        blog_id = random.choice(blog_ids)
+        # One draw picks the request: half of the writes create a blog and
+        # half update one, a tenth of the reads list a page
+        draw = random.random()
+        start = time.perf_counter()
+        if draw < writes / 2:
+            response = await ac.post(
+                "/api/blog/",
+                json={"user_id": user_id, "title": "New", "content": "..."},
+            )
+        elif draw < writes:
+            response = await ac.patch(
+                f"/api/blog/{blog_id}",
+                json={"id": blog_id, "content": "Updated " * 20},
+            )
+        elif draw < writes + (1 - writes) * 0.1:
+            response = await ac.get("/api/blog/all", params={"limit": 20})
+        else:
+            response = await ac.get(f"/api/blog/{blog_id}")
+        latencies.append(time.perf_counter() - start)
+        failed += response.is_error
+        written += draw < writes
+    return failed, written
+
+
+async def run(clients: int, requests: int, writes: float) -> dict:
+    """
+    Set up a database and run the workload on it
+
+    Args:
+        clients (int): number of concurrent clients
+        requests (int): number of requests per client
+        writes (float): share of the requests that write
+
+    Returns:
+        dict: requests per second, latency percentiles in milliseconds,
+            share of the requests that wrote and number of failed requests
+    """
+    import data
+    from data import blog, user
+    from model.blog import BlogCreate
+    from model.user import UserCreate
+    from web import create_app
+
+    await data.init_db()
+    author = await user.create_user(
+        UserCreate(username="bench", password="benchmark")
+    )
+    blog_ids = await blog.create_blogs(
+        [
+            BlogCreate(user_id=author.id, title=f"Bench {i}", content="...")
+            for i in range(BLOGS)
+        ]
+    )
+    latencies: list[float] = []
+    async with AsyncClient(
+        transport=ASGITransport(app=create_app(), raise_app_exceptions=False),
+        base_url="http://bench",
+    ) as ac:
+        start = time.perf_counter()
+        counts = await asyncio.gather(
+            *(
+                client(ac, author.id, blog_ids, requests, writes, latencies)
+                for _ in range(clients)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    await data.engine.dispose()
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "writes": sum(w for _, w in counts) / len(latencies),
+        "failed": sum(f for f, _ in counts),
+    }
+
+
+def run_profile(
+    profile: str, directory: str, clients: int, requests: int, writes: float
+) -> dict:
+    """
+    Run the workload with a storage profile on a new database file
+
+    Args:
+        profile (str): name of the storage profile
+        directory (str): directory of the database file
+        clients (int): number of concurrent clients
+        requests (int): number of requests per client
+        writes (float): share of the requests that write
+
+    Returns:
+        dict: results of ``run``
+    """
+    path = os.path.join(tempfile.mkdtemp(dir=directory), "bench.db")
+    os.environ["DEV_DB_URI"] = f"sqlite:///{path}"
+    os.environ["DB_STORAGE_PROFILE"] = profile
+    return asyncio.run(run(clients, requests, writes))
+
+
+def main(clients: int, requests: int, writes: float, directory: str):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        clients (int): number of concurrent clients
+        requests (int): number of requests per client
+        writes (float): share of the requests that write
+        directory (str): directory of the database files
+    """
+    print(
+        f"{clients} clients x {requests} requests, {writes:.0%} writes, "
+        f"databases in {directory}"
+    )
+    results = {}
+    for profile in STORAGE_PROFILES:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results[profile] = r = executor.submit(
+                run_profile, profile, directory, clients, requests, writes
+            ).result()
+        print(
+            f"  {profile:10} {r['rps']:8.1f} req/s  p50 {r['p50']:7.1f} ms"
+            f"  p99 {r['p99']:7.1f} ms  {r['writes']:4.0%} writes"
+            f"  {r['failed']} failed"
+        )
+    print(
+        "  speedup:  "
+        f"{results['production']['rps'] / results['default']['rps']:8.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--writes", type=float, default=0.2)
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+    main(args.clients, args.requests, args.writes, args.dir)
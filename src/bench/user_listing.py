@@ -0,0 +1,130 @@
+"""
+User listing benchmark
+
+This module measures the time to list every user, page by page, with the
+old N+1 role lookup (one query per user on top of the page query) versus
+the joined user+role read path (one query per page).
+
+Usage:
+    python -m bench.user_listing [--sizes 1000,10000,100000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["ENV"] = "dev"
+os.environ["DEV_DB_URI"] = f"sqlite:///{DB_FILE}"
+
+from sqlmodel import select
+
+import data
+from data import user, unit_of_work, utcnow
+from data.pagination import MAX_PAGE_SIZE
+from data.user import User
+from data.user_role import get_user_role_by_name
+
+
+async def seed(count: int):
+    """
+    Insert users until there are ``count`` of them
+
+    Args:
+        count (int): number of users wanted
+    """
+    role_id = (await get_user_role_by_name("user")).id
+    async with data.engine.begin() as connection:
+        existing = len((await connection.execute(select(User.id))).all())
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "username": f"bench-{existing + i}",
+                "password_hash": "x" * 60,
+                "role_id": role_id,
+                "time_created": utcnow(),
+                "time_updated": utcnow(),
+            }
+            for i in range(count - existing)
+        ]
+        if rows:
+            await connection.execute(User.__table__.insert(), rows)
+
+
+async def list_n_plus_one() -> int:
+    """
+    List every user, looking up each role with its own query
+
+    Returns:
+        int: number of queries
+    """
+    queries, cursor = 0, None
+    async with unit_of_work() as session:
+        while True:
+            users, cursor = await user.get_all_users(
+                cursor, MAX_PAGE_SIZE, session=session
+            )
+            queries += 1
+            for u in users:
+                (
+                    await session.exec(
+                        select(User.role_id).where(User.id == u.id)
+                    )
+                ).first()
+                queries += 1
+            if cursor is None:
+                return queries
+
+
+async def list_joined() -> int:
+    """
+    List every user with the joined user+role read path
+
+    Returns:
+        int: number of queries
+    """
+    queries, cursor = 0, None
+    async with unit_of_work() as session:
+        while True:
+            users, cursor = await user.get_all_users_with_role(
+                cursor, MAX_PAGE_SIZE, session=session
+            )
+            queries += 1
+            if cursor is None:
+                return queries
+
+
+async def main(sizes: list[int]):
+    """
+    Run the benchmark and print the results
+
+    Args:
+        sizes (list[int]): numbers of users to list
+    """
+    await data.init_db()
+    print(
+        f"{'users':>8} {'N+1 (s)':>10} {'queries':>8} "
+        f"{'joined (s)':>11} {'queries':>8} {'speedup':>8}"
+    )
+    for size in sorted(sizes):
+        await seed(size)
+        start = time.perf_counter()
+        before_queries = await list_n_plus_one()
+        before = time.perf_counter() - start
+        start = time.perf_counter()
+        after_queries = await list_joined()
+        after = time.perf_counter() - start
+        print(
+            f"{size:>8} {before:>10.3f} {before_queries:>8} "
+            f"{after:>11.3f} {after_queries:>8} {before / after:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+    asyncio.run(main([int(s) for s in args.sizes.split(",")]))
@@ -0,0 +1,3 @@
+"""
+This package contains the command line entry points.
+"""
@@ -0,0 +1,75 @@
+"""
+User import command
+
+This module imports users from an NDJSON file, one UserCreate object per
+line, and reports the import throughput.
+
+Usage:
+    python -m cli.import_users users.ndjson [--batch-size 1000] [--workers N]
+    python -m cli.import_users - < users.ndjson
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import AsyncIterator, TextIO
+
+from data import init_db
+from data.hashing import HashingExecutor, shutdown_hasher
+from model.user import UserCreate
+from service import user as user_service
+
+
+async def read_users(file: TextIO) -> AsyncIterator[UserCreate]:
+    """
+    Parse an NDJSON file into users, line by line
+
+    Args:
+        file (TextIO): NDJSON file
+
+    Yields:
+        UserCreate: UserCreate object
+    """
+    for line in file:
+        if line.strip():
+            yield UserCreate.model_validate_json(line)
+
+
+async def main(path: str, batch_size: int, workers: int):
+    """
+    Import the users and print the result
+
+    Args:
+        path (str): path of the NDJSON file, ``-`` for stdin
+        batch_size (int): number of users per transaction
+        workers (int): number of hashing processes, IMPORT_HASH_WORKERS by
+            default
+    """
+    await init_db()
+    hasher = (
+        HashingExecutor(workers, batch_size, processes=True)
+        if workers
+        else None
+    )
+    try:
+        with sys.stdin if path == "-" else open(path) as file:
+            result = await user_service.import_users(
+                read_users(file), batch_size=batch_size, hasher=hasher
+            )
+    finally:
+        if hasher:
+            hasher.shutdown()
+        shutdown_hasher()
+    print(
+        f"created {result.created}, skipped {result.skipped} "
+        f"in {result.seconds:.1f} s ({result.users_per_second:.1f} users/s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.batch_size, args.workers))
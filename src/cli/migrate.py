@@ -0,0 +1,35 @@
+"""
+Migrate command
+
+This module brings the schema of the configured database up to date in
+place, and recreates the blog search index if a migration dropped it,
+without seeding the database.
+
+Usage:
+    python -m cli.migrate
+"""
+
+import asyncio
+
+from data import get_engine
+from data.blog import create_search_index
+from data.migrations import migrate, schema_version
+
+
+async def main():
+    """
+    Apply the pending migrations and print the schema versions
+    """
+    async with get_engine().begin() as connection:
+        before = await connection.run_sync(schema_version)
+        applied = await connection.run_sync(migrate)
+        await connection.run_sync(create_search_index)
+        after = await connection.run_sync(schema_version)
+    await get_engine().dispose()
+    print(
+        f"schema version {before} -> {after}, {applied} migration(s) applied"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -31,3 +31,67 @@ class Config:
             return os.getenv("TEST_DB_URI", "sqlite:///:memory:")
         else:
             return os.getenv("PROD_DB_URI", "sqlite:///prod.db")
+
+    def get_db_echo(self) -> bool:
+        """
+        Get whether the engine logs every SQL statement
+        """
+        load_dotenv()
+        return os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+
+    def get_db_storage_profile(self) -> str:
+        """
+        Get the name of the SQLite storage profile of the engine
+        """
+        load_dotenv()
+        return os.getenv("DB_STORAGE_PROFILE", "production")
+
+    def get_hash_workers(self) -> int:
+        """
+        Get the number of passwords hashed at the same time
+        """
+        load_dotenv()
+        return int(os.getenv("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+
+    def get_hash_queue_size(self) -> int:
+        """
+        Get the number of password hashes allowed to wait for a worker
+        """
+        load_dotenv()
+        return int(os.getenv("HASH_QUEUE_SIZE", 64))
+
+    def get_import_hash_workers(self) -> int:
+        """
+        Get the number of processes hashing the passwords of user imports
+        """
+        load_dotenv()
+        return int(os.getenv("IMPORT_HASH_WORKERS", os.cpu_count() or 1))
+
+    def get_import_hash_queue_size(self) -> int:
+        """
+        Get the number of import password hashes allowed to wait for a
+        process, shared by the imports allowed to run
+        """
+        load_dotenv()
+        return int(os.getenv("IMPORT_HASH_QUEUE_SIZE", 1000))
+
+    def get_max_imports(self) -> int:
+        """
+        Get the number of user imports allowed to run at the same time
+        """
+        load_dotenv()
+        return int(os.getenv("MAX_IMPORTS", 1))
+
+    def get_response_cache_bytes(self) -> int:
+        """
+        Get the maximum total size in bytes of the cached read responses
+        """
+        load_dotenv()
+        return int(os.getenv("RESPONSE_CACHE_BYTES", 32 * 2**20))
+
+    def get_response_cache_ttl(self) -> float:
+        """
+        Get the number of seconds a read response stays cached
+        """
+        load_dotenv()
+        return float(os.getenv("RESPONSE_CACHE_TTL", 60))
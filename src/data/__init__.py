@@ -1,63 +1,239 @@
 """
 This file is used to create the database engine and to import the models.
+
+Importing the package does no I/O: the engine is created on first use and
+the schema and default rows are set up by ``init_db``, which the app runs
+from its lifespan.
 """
 
-from bcrypt import gensalt, hashpw
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from functools import cache
+from typing import AsyncIterator, Optional
+
 from config import Config
-from sqlmodel import SQLModel, Session, create_engine, select
+from data.storage import install_storage_profile
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-DB_URI = Config().get_db_uri()
+DEFAULT_ROLES = ("admin", "user", "moderator")
 
-engine = create_engine(DB_URI, echo=True)
 
-from .user_role import UserRole
-from .user import User
-from .blog import Blog
-
-SQLModel.metadata.create_all(engine)
-
-with engine.connect() as connection:
-    user_roles = [
-        UserRole(name="admin"),
-        UserRole(name="user"),
-        UserRole(name="moderator"),
-    ]
-    # Add roles if they do not exist
-    with Session(engine) as session:
-        for role in user_roles:
-            if not session.exec(
-                select(UserRole).where(UserRole.name == role.name)
-            ).first():
-                try:
-                    session.add(role)
-                    session.commit()
-                    print(f"Added role {role.name}")
-                except Exception as e:
-                    print(e)
-                    session.rollback()
-                    raise e
-            else:
-                print(f"Role {role.name} already exists")
-    print("Roles added")
-    # Add admin user if it does not exist
-    admin_role = session.exec(
-        select(UserRole).where(UserRole.name == "admin")
-    ).first()
-    if not session.exec(select(User).where(User.username == "admin")).first():
+def async_db_uri(uri: str) -> str:
+    """
+    Get the async driver version of a database URI
+
+    Args:
+        uri (str): database URI, e.g. ``sqlite:///prod.db``
+
+    Returns:
+        str: database URI using the async driver, e.g.
+            ``sqlite+aiosqlite:///prod.db``
+    """
+    url = make_url(uri)
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+@cache
+def get_engine() -> AsyncEngine:
+    """
+    Get the database engine, creating it on first use
+
+    The storage profile of the config is applied to every connection.
+
+    Returns:
+        AsyncEngine: AsyncEngine object
+    """
+    config = Config()
+    engine = create_async_engine(
+        async_db_uri(config.get_db_uri()), echo=config.get_db_echo()
+    )
+    install_storage_profile(engine, config.get_db_storage_profile())
+    return engine
+
+
+@cache
+def _sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """
+    Get the session factory bound to the engine
+
+    Objects stay usable after commit; attribute refreshes would otherwise
+    need an implicit (and in async code, impossible) lazy load.
+
+    Returns:
+        async_sessionmaker[AsyncSession]: session factory
+    """
+    return async_sessionmaker(
+        get_engine(), class_=AsyncSession, expire_on_commit=False
+    )
+
+
+def async_session() -> AsyncSession:
+    """
+    Open a new session on the engine
+
+    Returns:
+        AsyncSession: AsyncSession object
+    """
+    return _sessionmaker()()
+
+
+def __getattr__(name: str):
+    """
+    Resolve the lazily created module attributes ``engine`` and ``DB_URI``
+    """
+    if name == "engine":
+        return get_engine()
+    if name == "DB_URI":
+        return Config().get_db_uri()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def utcnow() -> datetime:
+    """
+    Get the current UTC time the way the database stores it
+
+    SQLite keeps datetimes without a timezone, so rows are written with
+    naive UTC timestamps and a freshly written row equals the same row read
+    back, without a refresh round trip.
+
+    Returns:
+        datetime: current naive UTC time
+    """
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+@asynccontextmanager
+async def unit_of_work(
+    session: Optional[AsyncSession] = None,
+) -> AsyncIterator[AsyncSession]:
+    """
+    Get the session of a unit of work
+
+    When ``session`` is given the caller owns the unit of work and it is
+    yielded as is, so nested data functions share one connection and one
+    transaction. Otherwise a new session is opened, committed when the
+    block succeeds and rolled back when it raises.
+
+    Args:
+        session (Optional[AsyncSession]): session of an enclosing unit of
+            work
+
+    Yields:
+        AsyncSession: AsyncSession object
+    """
+    if session is not None:
+        yield session
+        return
+    async with async_session() as session:
         try:
-            admin = User(
-                username="admin",
-                password_hash=hashpw(
-                    "admin".encode("utf-8"), gensalt()
-                ).decode("utf-8"),
-                role_id=admin_role.id if admin_role else "lol",
-            )
-            session.add(admin)
-            session.commit()
-            print("Added admin user")
+            yield session
+            await session.commit()
         except Exception as e:
-            print(e)
-            session.rollback()
+            await session.rollback()
             raise e
-    else:
-        print("Admin user already exists")
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """
+    Request-scoped unit of work
+
+    FastAPI dependency that gives every request one session, i.e. one
+    connection checkout and one transaction, committed before the response
+    is sent.
+
+    Yields:
+        AsyncSession: AsyncSession object
+    """
+    async with unit_of_work() as session:
+        yield session
+
+
+from . import user_role
+from .hashing import hash_password
+from .ids import new_id
+from .user_role import UserRole, load_role_cache
+from .user import User
+from .blog import Blog, create_search_index
+from .migrations import migrate
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code
+
+    The coroutine is run on a private event loop in a worker thread when
+    called from inside a running event loop, so synchronous callers never
+    deadlock that loop.
+
+    Args:
+        coro (Coroutine): coroutine to run
+
+    Returns:
+        Any: result of the coroutine
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+_initialized = False
+
+
+async def init_db():
+    """
+    Create the tables and add the default roles and admin user
+
+    Every step is idempotent and the whole setup is one transaction: the
+    schema is created or migrated to the latest version, the blog search
+    index is created (and filled) if missing, the roles are added with a
+    single ``INSERT ... ON CONFLICT DO NOTHING``, the role cache is warmed
+    with one SELECT, and the admin password is only hashed when the admin
+    user is missing. Later calls in the same process return immediately.
+    """
+    global _initialized
+    if _initialized:
+        return
+    async with unit_of_work() as session:
+        connection = await session.connection()
+        await connection.run_sync(migrate)
+        await connection.run_sync(create_search_index)
+        await session.exec(
+            insert(UserRole)
+            .values([{"id": new_id(), "name": n} for n in DEFAULT_ROLES])
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        await load_role_cache(session)
+        if not (
+            await session.exec(select(User.id).where(User.username == "admin"))
+        ).first():
+            admin_role = await user_role.get_user_role_by_name(
+                "admin", session
+            )
+            await session.exec(
+                insert(User)
+                .values(
+                    id=new_id(),
+                    username="admin",
+                    password_hash=await hash_password("admin"),
+                    role_id=admin_role.id,
+                    time_created=utcnow(),
+                    time_updated=utcnow(),
+                )
+                .on_conflict_do_nothing()
+            )
+    _initialized = True
@@ -4,12 +4,52 @@ Blog Data
 This module contains the data layer for the Blog model.
 """
 
-import uuid
-from sqlmodel import Field, SQLModel, Session, select, Relationship
-from datetime import UTC, datetime
-from model.blog import BlogCreate, BlogUpdate, BlogInDB
-from errors.errors import Missing
-from . import engine
+import re
+from typing import AsyncIterator, Optional, Sequence
+from sqlalchemy import (
+    Connection,
+    Index,
+    column,
+    func,
+    insert,
+    literal_column,
+    table,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.orm import aliased, contains_eager, load_only
+from sqlmodel import Field, SQLModel, select, Relationship
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime
+from model import from_row
+from model.blog import BlogCreate, BlogUpdate, BlogInDB, excerpt
+from errors.errors import Missing, PreconditionFailed
+from . import async_session, unit_of_work, utcnow
+from .ids import UUIDBlob, new_id
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    decode_rank_cursor,
+    encode_rank_cursor,
+    page,
+    paginate,
+)
+
+EXPORT_BATCH_SIZE = 500
+BULK_CHUNK_SIZE = 1000
+# bm25 weight of a title match relative to a content match
+SEARCH_TITLE_WEIGHT = 10.0
+SEARCH_SNIPPET_TOKENS = 16
+# Columns of the blogs listed as BlogSummary, the content is not read
+SUMMARY_COLUMNS = (
+    "id",
+    "user_id",
+    "title",
+    "excerpt",
+    "time_created",
+    "time_updated",
+    "version",
+)
 
 
 class Blog(SQLModel, table=True):
@@ -21,147 +61,545 @@ class Blog(SQLModel, table=True):
         user_id: str - foreign key
         title: str - index
         content: str
+        excerpt: str - beginning of the content, for lists
         time_created: datetime
         time_updated: datetime
+        version: int - number of writes, for optimistic concurrency
         user: User - relationship
     """
 
-    id: str = Field(
-        primary_key=True, default_factory=lambda: str(uuid.uuid4())
+    __table_args__ = (
+        Index("ix_blog_time_created_id", "time_created", "id"),
+        Index(
+            "ix_blog_user_id_time_created_id", "user_id", "time_created", "id"
+        ),
     )
-    user_id: str = Field(foreign_key="user.id")
+    id: str = Field(primary_key=True, default_factory=new_id, sa_type=UUIDBlob)
+    user_id: str = Field(foreign_key="user.id", sa_type=UUIDBlob)
     title: str = Field(min_length=2, max_length=100, index=True)
     content: str = Field(min_length=2)
+    excerpt: str = Field(default="")
     time_created: datetime = Field(default=datetime.now())
     time_updated: datetime = Field(default=datetime.now())
+    version: int = Field(default=1)
     user: "User" = Relationship(back_populates="blogs")
 
 
-def get_blog_by_id(id: str):
+# Full-text index over blog titles and contents. It is an external content
+# FTS5 table: it stores only the index and reads the text from ``blog``
+# through its rowid, and the triggers keep it in sync with every write,
+# including bulk and Core statements. VACUUM can renumber the rowids of
+# ``blog``, so run ``rebuild_search_index`` after one.
+SEARCH_INDEX_DDL = (
+    """
+    CREATE VIRTUAL TABLE blog_fts USING fts5(
+        title, content, content='blog', content_rowid='rowid',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER blog_fts_insert AFTER INSERT ON blog BEGIN
+        INSERT INTO blog_fts(rowid, title, content)
+        VALUES (new.rowid, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_fts_delete AFTER DELETE ON blog BEGIN
+        INSERT INTO blog_fts(blog_fts, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_fts_update AFTER UPDATE OF title, content ON blog
+    BEGIN
+        INSERT INTO blog_fts(blog_fts, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+        INSERT INTO blog_fts(rowid, title, content)
+        VALUES (new.rowid, new.title, new.content);
+    END
+    """,
+)
+
+blog_fts = table("blog_fts", column("rowid"), column("title"))
+
+
+def create_search_index(connection: Connection):
+    """
+    Create the full-text index of the blogs if it does not exist yet, and
+    index the blogs already in the table
+
+    Args:
+        connection (Connection): synchronous connection, e.g. from
+            ``AsyncConnection.run_sync``
+    """
+    if connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = 'blog_fts'")
+    ).first():
+        return
+    for ddl in SEARCH_INDEX_DDL:
+        connection.execute(text(ddl))
+    connection.execute(
+        text("INSERT INTO blog_fts(blog_fts) VALUES ('rebuild')")
+    )
+
+
+async def rebuild_search_index(session: Optional[AsyncSession] = None):
+    """
+    Rebuild the full-text index of the blogs from the blog table
+
+    Args:
+        session (Optional[AsyncSession]): session of the unit of work
+    """
+    async with unit_of_work(session) as session:
+        await session.exec(
+            text("INSERT INTO blog_fts(blog_fts) VALUES ('rebuild')")
+        )
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching blogs with every word
+
+    Each word is quoted, so FTS5 operators and syntax in the text are
+    searched as plain words instead of failing the query.
+
+    Args:
+        query (str): free text
+
+    Returns:
+        Optional[str]: FTS5 query, or None when the text has no word
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+async def search_blogs(
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session: Optional[AsyncSession] = None,
+) -> tuple[list[tuple[Blog, str]], Optional[str]]:
+    """
+    Search the blogs containing every word of ``query``, best match first
+
+    Results are ranked with bm25, a title match weighing
+    ``SEARCH_TITLE_WEIGHT`` times a content match, and paginated on
+    (rank, rowid).
+
+    Args:
+        query: str - words to search
+        cursor: Optional[str] - cursor returned with the previous page
+        limit: int - maximum number of blogs in the page
+        session: Optional[AsyncSession] - session of the unit of work
+
+    Returns:
+        tuple[list[tuple[Blog, str]], Optional[str]]: Blog objects with a
+            snippet of their best matching text, and the cursor of the
+            next page
+    """
+    match = _match_expression(query)
+    if match is None:
+        return [], None
+    fts = literal_column("blog_fts")
+    rank = func.bm25(fts, SEARCH_TITLE_WEIGHT, 1.0)
+    rowid = literal_column("blog.rowid")
+    statement = (
+        select(
+            Blog,
+            func.snippet(fts, -1, "<b>", "</b>", "…", SEARCH_SNIPPET_TOKENS),
+            rank,
+            rowid,
+        )
+        .join(blog_fts, blog_fts.c.rowid == rowid)
+        .where(fts.op("MATCH")(match))
+    )
+    if cursor:
+        statement = statement.where(
+            tuple_(rank, rowid) > tuple_(*decode_rank_cursor(cursor))
+        )
+    statement = statement.order_by(rank, rowid).limit(limit + 1)
+    async with unit_of_work(session) as session:
+        rows = (await session.exec(statement)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1][2], rows[-1][3])
+    return [(blog, snippet) for blog, snippet, _, _ in rows], next_cursor
+
+
+def _with_author(statement, blog, join_user: bool = True):
+    """
+    Join the authors of the blogs of a statement, with their role, and load
+    them into ``Blog.user`` and ``User.role``
+
+    Only the id, username and role of the authors are read.
+
+    Args:
+        statement (Select): select statement of blogs
+        blog: Blog or an alias of it
+        join_user (bool): whether to join the user table, False when the
+            statement already selects from it
+
+    Returns:
+        Select: select statement
+    """
+    from data import User, UserRole
+
+    if join_user:
+        statement = statement.join(User, User.id == blog.user_id)
+    return statement.join(UserRole, UserRole.id == User.role_id).options(
+        contains_eager(blog.user)
+        .load_only(User.id, User.username, User.role_id)
+        .contains_eager(User.role)
+        .load_only(UserRole.id, UserRole.name)
+    )
+
+
+async def get_blog_by_id(
+    id: str,
+    with_author: bool = False,
+    session: Optional[AsyncSession] = None,
+) -> Blog:
     """
     Get a blog by id
 
+    A blog already loaded in the unit of work is returned from its identity
+    map without a round trip, unless its author is asked for: the blog, its
+    author and the author's role are then read in one query.
+
     Args:
         id: str - id of the blog
+        with_author: bool - whether to load ``Blog.user`` and its role
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
-        BlogInDB: BlogInDB object
+        Blog: Blog row, attached to the session of the unit of work
     """
-    with Session(engine) as session:
-        blog = session.exec(select(Blog).where(Blog.id == id)).first()
+    async with unit_of_work(session) as session:
+        if with_author:
+            blog = (
+                await session.exec(
+                    _with_author(select(Blog).where(Blog.id == id), Blog)
+                )
+            ).first()
+        else:
+            blog = await session.get(Blog, id)
         if blog:
             return blog
         raise Missing(msg=f"Blog with id {id!r} not found")
 
 
-def get_blogs_by_user_id(user_id: str):
+async def get_blogs_by_ids(
+    ids: Sequence[str], session: Optional[AsyncSession] = None
+) -> list[Blog]:
     """
-    Get all blogs by user id
+    Get the blogs with any of the given ids, in one query
+
+    Args:
+        ids: Sequence[str] - ids of the blogs
+        session: Optional[AsyncSession] - session of the unit of work
+
+    Returns:
+        list[Blog]: the Blog objects found, in no particular order
+    """
+    async with unit_of_work(session) as session:
+        return list(
+            (await session.exec(select(Blog).where(Blog.id.in_(ids)))).all()
+        )
+
+
+def _load_only(statement, blog, columns: Optional[Sequence[str]]):
+    """
+    Restrict the columns of the blogs loaded by a statement
+
+    Args:
+        statement (Select): select statement of blogs
+        blog: Blog or an alias of it
+        columns (Optional[Sequence[str]]): names of the columns to load,
+            None for every column
+
+    Returns:
+        Select: select statement
+    """
+    if columns is None:
+        return statement
+    return statement.options(
+        load_only(*(getattr(blog, name) for name in columns))
+    )
+
+
+def _blogs_by_user_statement(
+    user_id: str,
+    cursor: Optional[str],
+    limit: int,
+    columns: Optional[Sequence[str]] = None,
+    with_author: bool = False,
+):
+    """
+    Select a page of blogs of a user together with the user's existence
+
+    The page is read from the (user_id, time_created, id) index newest
+    first, and outer joined to the user row: no row means no such user, a
+    single row without a blog means a user without (more) blogs.
 
     Args:
         user_id: str - id of the user
+        cursor: Optional[str] - cursor returned with the previous page
+        limit: int - maximum number of blogs in the page
+        columns: Optional[Sequence[str]] - columns of the blogs to read,
+            None for every column
+        with_author: bool - whether to load ``Blog.user`` and its role
 
     Returns:
-        List[Blog]: List of Blog objects
+        Select: select statement of (user id, Blog or None) rows
     """
-    with Session(engine) as session:
-        try:
-            from data import User
+    from data import User
+
+    inner = (
+        select(Blog)
+        if columns is None
+        else select(*(getattr(Blog, name) for name in columns))
+    )
+    blogs = aliased(
+        Blog,
+        paginate(
+            inner.where(Blog.user_id == user_id), Blog, cursor, limit
+        ).subquery(),
+    )
+    statement = (
+        select(User.id, blogs)
+        .outerjoin(blogs, blogs.user_id == User.id)
+        .where(User.id == user_id)
+        .order_by(blogs.time_created.desc(), blogs.id.desc())
+    )
+    if with_author:
+        statement = _with_author(statement, blogs, join_user=False)
+    return _load_only(statement, blogs, columns)
+
+
+async def get_blogs_by_user_id(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    columns: Optional[Sequence[str]] = None,
+    with_author: bool = False,
+    session: Optional[AsyncSession] = None,
+) -> tuple[list[Blog], Optional[str]]:
+    """
+    Get a page of blogs by user id, newest first
+
+    The page and the check that the user exists are one query.
+
+    Args:
+        user_id: str - id of the user
+        cursor: Optional[str] - cursor returned with the previous page
+        limit: int - maximum number of blogs in the page
+        columns: Optional[Sequence[str]] - columns of the blogs to read,
+            e.g. ``SUMMARY_COLUMNS``, None for every column
+        with_author: bool - whether to load ``Blog.user`` and its role
+        session: Optional[AsyncSession] - session of the unit of work
 
-            user = session.exec(select(User).where(User.id == user_id)).first()
-            if user:
-                blogs = user.blogs
-                return blogs
-            raise Missing(msg=f"Blogs with user id {user_id!r} not found")
-        except Exception as e:
-            raise e
+    Returns:
+        tuple[List[Blog], Optional[str]]: List of Blog objects and the
+            cursor of the next page
+    """
+    async with unit_of_work(session) as session:
+        rows = (
+            await session.exec(
+                _blogs_by_user_statement(
+                    user_id, cursor, limit, columns, with_author
+                )
+            )
+        ).all()
+        if rows:
+            return page([blog for _, blog in rows if blog is not None], limit)
+        raise Missing(msg=f"Blogs with user id {user_id!r} not found")
 
 
-def get_all_blogs():
+async def get_all_blogs(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    columns: Optional[Sequence[str]] = None,
+    with_author: bool = False,
+    session: Optional[AsyncSession] = None,
+) -> tuple[list[Blog], Optional[str]]:
     """
-    Get all blogs
+    Get a page of blogs, newest first
+
+    Args:
+        cursor: Optional[str] - cursor returned with the previous page
+        limit: int - maximum number of blogs in the page
+        columns: Optional[Sequence[str]] - columns of the blogs to read,
+            e.g. ``SUMMARY_COLUMNS``, None for every column
+        with_author: bool - whether to load ``Blog.user`` and its role, in
+            the same query
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
-        List[Blog]: List of Blog objects
+        tuple[List[Blog], Optional[str]]: List of Blog objects and the
+            cursor of the next page
+    """
+    statement = _load_only(select(Blog), Blog, columns)
+    if with_author:
+        statement = _with_author(statement, Blog)
+    async with unit_of_work(session) as session:
+        blogs = (
+            await session.exec(paginate(statement, Blog, cursor, limit))
+        ).all()
+        return page(blogs, limit)
+
+
+async def stream_blogs(
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[Blog]:
+    """
+    Stream all blogs, oldest first
+
+    Rows are read from a server-side cursor ``batch_size`` at a time, so
+    memory use does not depend on the number of blogs.
+
+    Args:
+        batch_size: int - number of rows fetched per round trip
+
+    Yields:
+        Blog: Blog object
     """
-    with Session(engine) as session:
-        blogs = session.exec(select(Blog)).all()
-        return blogs
+    async with async_session() as session:
+        blogs = await session.stream_scalars(
+            select(Blog)
+            .order_by(Blog.time_created, Blog.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for blog in blogs:
+            yield blog
 
 
-def create_blog(blog: BlogCreate) -> BlogInDB:
+async def create_blog(
+    blog: BlogCreate, session: Optional[AsyncSession] = None
+) -> BlogInDB:
     """
     Create a new blog
 
     Args:
         blog (BlogCreate): BlogCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         BlogInDB: BlogInDB object
     """
-    with Session(engine) as session:
-        try:
-            new_blog = Blog(
-                id=str(uuid.uuid4()),
-                time_created=datetime.now(UTC),
-                time_updated=datetime.now(UTC),
-                **blog.model_dump(),
+    async with unit_of_work(session) as session:
+        new_blog = Blog(
+            id=new_id(),
+            excerpt=excerpt(blog.content),
+            time_created=utcnow(),
+            time_updated=utcnow(),
+            **blog.model_dump(),
+        )
+        session.add(new_blog)
+        await session.flush()
+        return from_row(BlogInDB, new_blog)
+
+
+async def create_blogs(
+    blogs: list[BlogCreate],
+    chunk_size: int = BULK_CHUNK_SIZE,
+    session: Optional[AsyncSession] = None,
+) -> list[str]:
+    """
+    Create many blogs in one transaction
+
+    The rows are inserted with one executemany ``INSERT`` per chunk of
+    ``chunk_size`` blogs, without loading them into the session.
+
+    Args:
+        blogs (list[BlogCreate]): BlogCreate objects
+        chunk_size (int): number of rows per INSERT statement
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        list[str]: ids of the created blogs, in the order of ``blogs``
+    """
+    now = utcnow()
+    rows = [
+        {
+            "id": new_id(),
+            "excerpt": excerpt(blog.content),
+            "time_created": now,
+            "time_updated": now,
+            **blog.model_dump(),
+        }
+        for blog in blogs
+    ]
+    async with unit_of_work(session) as session:
+        for start in range(0, len(rows), chunk_size):
+            await session.exec(
+                insert(Blog), params=rows[start : start + chunk_size]
             )
-            session.add(new_blog)
-            session.commit()
-            session.refresh(new_blog)
-            return BlogInDB(**new_blog.model_dump())
-        except Exception as e:
-            print(e)
-            session.rollback()
-            raise e
+    return [row["id"] for row in rows]
 
 
-def update_blog(blog: BlogUpdate) -> BlogInDB:
+async def update_blog(
+    blog: BlogUpdate,
+    versions: Optional[list[int]] = None,
+    session: Optional[AsyncSession] = None,
+) -> BlogInDB:
     """
-    Update a blog
+    Update a blog, optionally only if it is still at one of ``versions``
+
+    The update is a single ``UPDATE ... RETURNING`` statement that also
+    increments the version, no row is read before it. When it matches no
+    row, the blog is only looked up to tell a missing blog from a changed
+    one.
 
     Args:
         blog (BlogUpdate): BlogUpdate object
+        versions (Optional[list[int]]): versions the update is based on,
+            None to update whatever the version
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         BlogInDB: BlogInDB object
     """
-    with Session(engine) as session:
-        try:
-            try:
-                blog_db = get_blog_by_id(blog.id)
-            except Missing as e:
-                raise Missing(msg=f"Blog with id {blog.id!r} not found")
-            if blog.title:
-                blog_db.title = blog.title
-            if blog.content:
-                blog_db.content = blog.content
-            blog_db.time_updated = datetime.now(UTC)
-            session.add(blog_db)
-            session.commit()
-            session.refresh(blog_db)
-            return BlogInDB(**blog_db.model_dump())
-        except Exception as e:
-            session.rollback()
-            raise e
-
-
-def delete_blog(blog: BlogInDB):
+    values = {"time_updated": utcnow(), "version": Blog.version + 1}
+    if blog.title:
+        values["title"] = blog.title
+    if blog.content:
+        values["content"] = blog.content
+        values["excerpt"] = excerpt(blog.content)
+    statement = update(Blog).where(Blog.id == blog.id)
+    if versions is not None:
+        statement = statement.where(Blog.version.in_(versions))
+    async with unit_of_work(session) as session:
+        blog_db = (
+            await session.exec(statement.values(**values).returning(Blog))
+        ).scalar_one_or_none()
+        if blog_db:
+            return from_row(BlogInDB, blog_db)
+        if (
+            versions is not None
+            and (
+                await session.exec(
+                    select(Blog.version).where(Blog.id == blog.id)
+                )
+            ).first()
+        ):
+            raise PreconditionFailed(
+                msg=f"Blog with id {blog.id!r} was modified"
+            )
+        raise Missing(msg=f"Blog with id {blog.id!r} not found")
+
+
+async def delete_blog(blog: BlogInDB, session: Optional[AsyncSession] = None):
     """
     Delete a blog
 
     Args:
         blog (BlogInDB): BlogInDB object
+        session (Optional[AsyncSession]): session of the unit of work
     """
-    with Session(engine) as session:
-        try:
-            try:
-                blog_db = get_blog_by_id(blog.id)
-            except Missing as e:
-                raise e
-            session.delete(blog_db)
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            raise e
+    async with unit_of_work(session) as session:
+        blog_db = await get_blog_by_id(blog.id, session=session)
+        await session.delete(blog_db)
+        await session.flush()
@@ -0,0 +1,193 @@
+"""
+Password Hashing
+
+This module contains the executor that hashes passwords off the event loop.
+
+bcrypt is deliberately slow (hundreds of milliseconds per hash) and would
+freeze every in-flight request if it ran on the event loop, so hashes run
+on a dedicated, bounded thread pool (bcrypt releases the GIL while it
+works). When the pool and its queue are full new hashes are rejected with
+``Busy`` instead of piling up behind each other. Bulk imports hash on a
+second, process wide pool of worker processes, one per core by default.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+
+from bcrypt import gensalt, hashpw
+from config import Config
+from errors.errors import Busy
+
+
+def _hash(password: str) -> tuple[str, float]:
+    """
+    Hash a password, in a worker thread
+
+    Args:
+        password (str): password to hash
+
+    Returns:
+        tuple[str, float]: bcrypt hash and seconds spent hashing
+    """
+    start = time.perf_counter()
+    password_hash = hashpw(password.encode("utf-8"), gensalt()).decode("utf-8")
+    return password_hash, time.perf_counter() - start
+
+
+class HashingExecutor:
+    """
+    Bounded executor for password hashes
+
+    Attributes:
+        max_workers (int): number of hashes computed at the same time
+        max_queue (int): number of hashes waiting for a worker
+        in_flight (int): number of hashes running or waiting
+        max_in_flight (int): highest in_flight seen
+        hashed (int): number of hashes computed
+        rejected (int): number of hashes rejected because the queue was full
+        hash_seconds (float): total time spent hashing
+        wait_seconds (float): total time from submission to result
+    """
+
+    def __init__(
+        self, max_workers: int, max_queue: int, processes: bool = False
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            max_workers (int): number of hashes computed at the same time
+            max_queue (int): number of hashes waiting for a worker
+            processes (bool): hash on worker processes instead of threads
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        if processes:
+            # spawn, not fork: the parent runs the database driver threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="hashing"
+            )
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.hashed = 0
+        self.rejected = 0
+        self.hash_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password without blocking the event loop
+
+        Args:
+            password (str): password to hash
+
+        Returns:
+            str: bcrypt hash of the password
+        """
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise Busy(msg="Too many passwords are being hashed, retry later")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            password_hash, seconds = await loop.run_in_executor(
+                self._pool, _hash, password
+            )
+        finally:
+            self.in_flight -= 1
+        self.hashed += 1
+        self.hash_seconds += seconds
+        self.wait_seconds += time.perf_counter() - start
+        return password_hash
+
+    def stats(self) -> dict[str, float]:
+        """
+        Get the executor metrics
+
+        Returns:
+            dict[str, float]: queue depth, counters and average latencies in
+                milliseconds
+        """
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.max_workers, 0),
+            "max_in_flight": self.max_in_flight,
+            "hashed": self.hashed,
+            "rejected": self.rejected,
+            "avg_hash_ms": (
+                self.hash_seconds / self.hashed * 1000 if self.hashed else 0.0
+            ),
+            "avg_wait_ms": (
+                self.wait_seconds / self.hashed * 1000 if self.hashed else 0.0
+            ),
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers once the running hashes are done
+        """
+        self._pool.shutdown(wait=True)
+
+
+@cache
+def get_hasher() -> HashingExecutor:
+    """
+    Get the process wide hashing executor, sized from the config
+
+    Returns:
+        HashingExecutor: HashingExecutor object
+    """
+    config = Config()
+    return HashingExecutor(
+        config.get_hash_workers(), config.get_hash_queue_size()
+    )
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hash a password on the process wide hashing executor
+
+    Args:
+        password (str): password to hash
+
+    Returns:
+        str: bcrypt hash of the password
+    """
+    return await get_hasher().hash(password)
+
+
+@cache
+def get_import_hasher() -> HashingExecutor:
+    """
+    Get the process wide executor hashing the passwords of user imports, on
+    worker processes, sized from the config
+
+    Returns:
+        HashingExecutor: HashingExecutor object
+    """
+    config = Config()
+    return HashingExecutor(
+        config.get_import_hash_workers(),
+        config.get_import_hash_queue_size(),
+        processes=True,
+    )
+
+
+def shutdown_hasher() -> None:
+    """
+    Stop the process wide hashing executors; the next hash starts new ones
+    """
+    for get in (get_hasher, get_import_hasher):
+        if get.cache_info().currsize:
+            get().shutdown()
+            get.cache_clear()
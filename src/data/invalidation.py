@@ -0,0 +1,93 @@
+"""
+Invalidation log
+
+This module contains the bookkeeping that keeps the in-process caches from
+storing a value read before a write committed.
+
+A cache fill reads from the database and then stores what it read, so a
+write that commits while the read is in flight drops the cache entry
+before the old value is stored, and the old value stays cached. Every
+invalidation is therefore numbered: a fill takes the current number before
+it reads and only stores a value when none of its keys was invalidated
+since.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+# Invalidations kept while reads are in flight before the ones older than
+# every read in flight are forgotten
+MAX_TRACKED_KEYS = 1024
+
+
+class InvalidationLog:
+    """
+    Number of the latest invalidation of every key
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self._number = 0
+        self._latest: dict[str, int] = {}
+        # number taken -> reads in flight that took it
+        self._reads: Counter[int] = Counter()
+
+    def invalidate(self, *keys: str) -> None:
+        """
+        Record an invalidation of keys
+
+        Args:
+            keys (str): keys invalidated
+        """
+        self._number += 1
+        for key in keys:
+            self._latest[key] = self._number
+
+    @contextmanager
+    def read(self) -> Iterator[int]:
+        """
+        Track a read whose result may be cached
+
+        Yields:
+            int: number of the latest invalidation when the read started,
+                to pass to ``invalidated_since``
+        """
+        since = self._number
+        self._reads[since] += 1
+        try:
+            yield since
+        finally:
+            self._reads[since] -= 1
+            if not self._reads[since]:
+                del self._reads[since]
+            self._forget()
+
+    def invalidated_since(self, since: int, *keys: str) -> bool:
+        """
+        Check whether any of the keys was invalidated since a read started
+
+        Args:
+            since (int): number yielded by ``read``
+            keys (str): keys of the value read
+
+        Returns:
+            bool: whether the value read may be stale
+        """
+        return any(self._latest.get(key, 0) > since for key in keys)
+
+    def _forget(self) -> None:
+        """
+        Forget the invalidations no read in flight can be affected by
+        """
+        if not self._reads:
+            self._latest.clear()
+        elif len(self._latest) > MAX_TRACKED_KEYS:
+            oldest = min(self._reads)
+            self._latest = {
+                key: number
+                for key, number in self._latest.items()
+                if number > oldest
+            }
@@ -0,0 +1,262 @@
+"""
+Migrations
+
+This module contains the schema migrations of existing SQLite databases.
+
+The schema version of a database is kept in ``PRAGMA user_version``:
+migration ``n`` (1-based, in ``MIGRATIONS``) brings a database from version
+``n - 1`` to ``n``. A new database is created from the models at the latest
+version directly. Migrations are plain SQL frozen at the time they were
+written, so they keep working whatever the models become later, and they
+rebuild tables in place with SQLite's create-copy-drop-rename procedure.
+"""
+
+from typing import Callable
+
+from sqlalchemy import Connection, inspect
+from sqlmodel import SQLModel
+
+from model.blog import excerpt
+
+from .ids import id_to_blob
+
+
+def _user_primary_key_on_id(connection: Connection):
+    """
+    Migration 1: make ``user.id`` alone the primary key of ``user``
+
+    The table used to have a composite (id, username) primary key, so
+    ``blog.user_id`` referenced a column that was not a key by itself.
+    Username uniqueness stays enforced by ``ix_user_username``.
+
+    Args:
+        connection (Connection): connection to the database
+    """
+    if inspect(connection).get_pk_constraint("user")[
+        "constrained_columns"
+    ] == ["id"]:
+        return
+    for statement in (
+        """
+        CREATE TABLE user_new (
+            id VARCHAR NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            password_hash VARCHAR NOT NULL,
+            role_id VARCHAR NOT NULL,
+            time_created DATETIME NOT NULL,
+            time_updated DATETIME NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(role_id) REFERENCES user_role (id)
+        )
+        """,
+        """
+        INSERT INTO user_new (
+            id, username, password_hash, role_id, time_created, time_updated
+        )
+        SELECT id, username, password_hash, role_id, time_created,
+            time_updated
+        FROM user
+        """,
+        "DROP TABLE user",
+        "ALTER TABLE user_new RENAME TO user",
+        "CREATE UNIQUE INDEX ix_user_username ON user (username)",
+        "CREATE INDEX ix_user_time_created_id ON user (time_created, id)",
+    ):
+        connection.exec_driver_sql(statement)
+
+
+# Table, its definition with blob ids, its id columns, its other columns
+# and its indexes, parents first
+_BLOB_ID_TABLES = (
+    (
+        "user_role",
+        """
+        CREATE TABLE user_role_new (
+            id BLOB NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """,
+        ("id",),
+        ("name",),
+        ("CREATE UNIQUE INDEX ix_user_role_name ON user_role (name)",),
+    ),
+    (
+        "user",
+        """
+        CREATE TABLE user_new (
+            id BLOB NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            password_hash VARCHAR NOT NULL,
+            role_id BLOB NOT NULL,
+            time_created DATETIME NOT NULL,
+            time_updated DATETIME NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(role_id) REFERENCES user_role (id)
+        )
+        """,
+        ("id", "role_id"),
+        ("username", "password_hash", "time_created", "time_updated"),
+        (
+            "CREATE UNIQUE INDEX ix_user_username ON user (username)",
+            "CREATE INDEX ix_user_time_created_id ON user (time_created, id)",
+        ),
+    ),
+    (
+        "blog",
+        """
+        CREATE TABLE blog_new (
+            id BLOB NOT NULL,
+            user_id BLOB NOT NULL,
+            title VARCHAR(100) NOT NULL,
+            content VARCHAR NOT NULL,
+            time_created DATETIME NOT NULL,
+            time_updated DATETIME NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )
+        """,
+        ("id", "user_id"),
+        ("title", "content", "time_created", "time_updated"),
+        (
+            "CREATE INDEX ix_blog_title ON blog (title)",
+            "CREATE INDEX ix_blog_time_created_id ON blog (time_created, id)",
+            "CREATE INDEX ix_blog_user_id_time_created_id "
+            "ON blog (user_id, time_created, id)",
+        ),
+    ),
+)
+
+
+def _id_to_blob(value):
+    """
+    SQL function ``id_to_blob`` of migration 2
+
+    Args:
+        value (Any): stored id
+
+    Returns:
+        Any: the 16 bytes of a UUID text id, any other value unchanged
+    """
+    return id_to_blob(value) if isinstance(value, str) else value
+
+
+def _ids_as_blobs(connection: Connection):
+    """
+    Migration 2: store the ids and foreign keys as 16-byte UUID blobs
+
+    Every id column held the 36-character UUID string. The tables are
+    rebuilt with ``BLOB`` id columns, the UUIDs converted to their bytes by
+    a Python SQL function (SQLite before 3.41 has no ``unhex``). The blog
+    search index reads blogs by rowid, which the rebuild renumbers, so it
+    is dropped here and recreated and refilled by ``create_search_index``.
+
+    Args:
+        connection (Connection): connection to the database
+    """
+    connection.connection.dbapi_connection.create_function(
+        "id_to_blob", 1, _id_to_blob, deterministic=True
+    )
+    connection.exec_driver_sql("DROP TABLE IF EXISTS blog_fts")
+    inspector = inspect(connection)
+    for name, create, ids, columns, indexes in _BLOB_ID_TABLES:
+        if not inspector.has_table(name):
+            continue
+        names = ", ".join(ids + columns)
+        values = ", ".join([f"id_to_blob({id})" for id in ids] + list(columns))
+        for statement in (
+            create,
+            f"INSERT INTO {name}_new ({names}) SELECT {values} FROM {name}",
+            f"DROP TABLE {name}",
+            f"ALTER TABLE {name}_new RENAME TO {name}",
+            *indexes,
+        ):
+            connection.exec_driver_sql(statement)
+
+
+def _blog_version(connection: Connection):
+    """
+    Migration 3: add the ``blog.version`` write counter
+
+    Existing blogs start at version 1, like new ones.
+
+    Args:
+        connection (Connection): connection to the database
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table("blog") or "version" in {
+        c["name"] for c in inspector.get_columns("blog")
+    }:
+        return
+    connection.exec_driver_sql(
+        "ALTER TABLE blog ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+    )
+
+
+def _blog_excerpt(connection: Connection):
+    """
+    Migration 4: add the ``blog.excerpt`` column, filled from the content
+
+    Args:
+        connection (Connection): connection to the database
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table("blog") or "excerpt" in {
+        c["name"] for c in inspector.get_columns("blog")
+    }:
+        return
+    connection.connection.dbapi_connection.create_function(
+        "excerpt", 1, excerpt, deterministic=True
+    )
+    for statement in (
+        "ALTER TABLE blog ADD COLUMN excerpt VARCHAR NOT NULL DEFAULT ''",
+        "UPDATE blog SET excerpt = excerpt(content)",
+    ):
+        connection.exec_driver_sql(statement)
+
+
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _user_primary_key_on_id,
+    _ids_as_blobs,
+    _blog_version,
+    _blog_excerpt,
+]
+
+
+def schema_version(connection: Connection) -> int:
+    """
+    Get the schema version of a database
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        int: schema version, 0 for a database older than the migrations
+    """
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(connection: Connection) -> int:
+    """
+    Bring the schema of a database up to date
+
+    A new database gets every table from the models. An existing one gets
+    its pending migrations, in order, and then any table it lacks.
+
+    Args:
+        connection (Connection): synchronous connection, e.g. from
+            ``AsyncConnection.run_sync``
+
+    Returns:
+        int: number of migrations applied
+    """
+    version = schema_version(connection)
+    pending = MIGRATIONS[version:]
+    if not inspect(connection).has_table("user"):
+        pending = []
+    for number, migration in enumerate(pending, start=version + 1):
+        migration(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+    SQLModel.metadata.create_all(connection)
+    connection.exec_driver_sql(f"PRAGMA user_version = {len(MIGRATIONS)}")
+    return len(pending)
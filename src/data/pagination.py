@@ -0,0 +1,129 @@
+"""
+Pagination
+
+This module contains the helpers for keyset (cursor) pagination.
+
+Pages are ordered newest first by ``(time_created, id)``. A cursor is the
+urlsafe base64 encoding of the sort key of the last row of a page, so the
+next page is a range scan on the ``(time_created, id)`` index that starts
+right after that row, whatever the page depth.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import tuple_
+from errors.errors import InvalidCursor
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(time_created: datetime, id: str) -> str:
+    """
+    Encode a cursor
+
+    Args:
+        time_created (datetime): time_created of the last row of the page
+        id (str): id of the last row of the page
+
+    Returns:
+        str: opaque cursor
+    """
+    raw = json.dumps([time_created.isoformat(), id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Decode a cursor
+
+    Args:
+        cursor (str): opaque cursor
+
+    Returns:
+        tuple[datetime, str]: time_created and id of the last row of the page
+    """
+    try:
+        time_created, id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(time_created), str(id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(msg=f"Invalid cursor {cursor!r}") from e
+
+
+def encode_rank_cursor(rank: float, rowid: int) -> str:
+    """
+    Encode the cursor of a page of ranked search results
+
+    Args:
+        rank (float): rank of the last row of the page
+        rowid (int): rowid of the last row of the page
+
+    Returns:
+        str: opaque cursor
+    """
+    raw = json.dumps([rank, rowid]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Decode the cursor of a page of ranked search results
+
+    Args:
+        cursor (str): opaque cursor
+
+    Returns:
+        tuple[float, int]: rank and rowid of the last row of the page
+    """
+    try:
+        rank, rowid = json.loads(base64.urlsafe_b64decode(cursor))
+        return float(rank), int(rowid)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(msg=f"Invalid cursor {cursor!r}") from e
+
+
+def paginate(statement, model, cursor: Optional[str], limit: int):
+    """
+    Apply keyset pagination to a select statement
+
+    One extra row is fetched so that ``page`` can tell whether there is a
+    next page without a second query.
+
+    Args:
+        statement (Select): select statement over ``model``
+        model (SQLModel): table model with ``time_created`` and ``id``
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of rows in the page
+
+    Returns:
+        Select: paginated select statement
+    """
+    if cursor:
+        statement = statement.where(
+            tuple_(model.time_created, model.id) < decode_cursor(cursor)
+        )
+    return statement.order_by(
+        model.time_created.desc(), model.id.desc()
+    ).limit(limit + 1)
+
+
+def page(rows: list, limit: int) -> tuple[list, Optional[str]]:
+    """
+    Split the rows of a paginated statement into a page and its next cursor
+
+    Args:
+        rows (list): rows returned by a statement built with ``paginate``
+        limit (int): maximum number of rows in the page
+
+    Returns:
+        tuple[list, Optional[str]]: rows of the page and the cursor of the
+            next page, or None if this is the last page
+    """
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    return rows, encode_cursor(rows[-1].time_created, rows[-1].id)
@@ -0,0 +1,95 @@
+"""
+SQLite storage profiles
+
+This module contains the named sets of SQLite pragmas the engine applies
+to every connection it opens, selected with ``DB_STORAGE_PROFILE``.
+
+``default`` keeps SQLite's own settings: a rollback journal, where a writer
+locks out the readers while it commits, and a sync of the database file on
+every commit. ``production`` switches to the write-ahead log, where readers
+keep reading the last committed snapshot while one writer appends to the
+log, only syncs the log at checkpoints (a commit survives a process crash,
+not necessarily a power loss), maps the database file in memory, keeps a
+larger page cache and temporary tables in memory, and waits for a lock
+instead of failing with ``database is locked``.
+"""
+
+from typing import Any, Mapping
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+STORAGE_PROFILES: dict[str, dict[str, Any]] = {
+    "default": {},
+    "production": {
+        # First, so that switching to WAL waits for the other connections
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 2**20,
+        # Negative sizes are in KiB: 64 MiB per connection
+        "cache_size": -64 * 2**10,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def get_storage_profile(name: str) -> dict[str, Any]:
+    """
+    Get the pragmas of a storage profile
+
+    Args:
+        name (str): name of the profile, e.g. ``production``
+
+    Returns:
+        dict[str, Any]: pragma names and values, in the order they are set
+
+    Raises:
+        ValueError: if there is no profile with that name
+    """
+    try:
+        return STORAGE_PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage profile {name!r}, "
+            f"expected one of {', '.join(STORAGE_PROFILES)}"
+        )
+
+
+def apply_pragmas(dbapi_connection, pragmas: Mapping[str, Any]) -> None:
+    """
+    Set pragmas on a DBAPI connection
+
+    Args:
+        dbapi_connection: DBAPI connection, as passed to the ``connect``
+            event
+        pragmas (Mapping[str, Any]): pragma names and values
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def install_storage_profile(engine: AsyncEngine, name: str) -> None:
+    """
+    Apply a storage profile to every connection an engine opens
+
+    Engines on other databases than SQLite are left as they are.
+
+    Args:
+        engine (AsyncEngine): AsyncEngine object
+        name (str): name of the profile, e.g. ``production``
+
+    Raises:
+        ValueError: if there is no profile with that name
+    """
+    pragmas = get_storage_profile(name)
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
@@ -4,14 +4,22 @@ User data access module.
 This module contains the data access functions for the User model.
 """
 
-from datetime import UTC, datetime
-import uuid
-from sqlmodel import Field, SQLModel, Session, select, Relationship
-from model.user import UserCreate, UserInDB, UserUpdate
-from bcrypt import hashpw, checkpw, gensalt
+import asyncio
+from datetime import datetime
+from typing import Optional, Sequence
+from sqlalchemy import Index, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, SQLModel, select, Relationship
+from sqlmodel.ext.asyncio.session import AsyncSession
+from model import from_row
+from model.user import UserCreate, UserInDB, UserUpdate, UserWithRole
 
 from errors.errors import Duplicate, Missing
-from data import engine
+from data import unit_of_work, utcnow
+from data.hashing import HashingExecutor, hash_password
+from data.ids import UUIDBlob, new_id
+from data.pagination import DEFAULT_PAGE_SIZE, page, paginate
 from model.user_role import UserRoleCreate, UserRoleInDB, UserRoleUpdate
 
 
@@ -21,244 +29,480 @@ class User(SQLModel, table=True):
 
     Attributes:
         id: str - primary key
-        username: str - unique, index
+        username: str - unique index
         password_hash: str
         time_created: datetime
         time_updated: datetime
         blogs: list[Blog] - relationship
     """
 
-    id: str = Field(
-        primary_key=True, default_factory=lambda: str(uuid.uuid4())
-    )
+    __table_args__ = (Index("ix_user_time_created_id", "time_created", "id"),)
+    id: str = Field(primary_key=True, default_factory=new_id, sa_type=UUIDBlob)
     username: str = Field(
-        primary_key=True, unique=True, index=True, min_length=2, max_length=100
+        unique=True, index=True, min_length=2, max_length=100
     )
     password_hash: str = Field(min_length=2)
-    role_id: str = Field(min_length=2, foreign_key="user_role.id")
+    role_id: str = Field(
+        min_length=2, foreign_key="user_role.id", sa_type=UUIDBlob
+    )
     time_created: datetime = Field(default=datetime.now())
     time_updated: datetime = Field(default=datetime.now())
     blogs: list["Blog"] = Relationship(back_populates="user")
     role: "UserRole" = Relationship(back_populates="users")
 
 
-def get_user_by_username(username: str) -> UserInDB:
+def _username_taken(error: IntegrityError) -> bool:
+    """
+    Check whether an integrity error is the unique index on username
+    rejecting a taken username, rather than e.g. a missing value
+
+    Args:
+        error (IntegrityError): error raised by an INSERT or UPDATE of users
+
+    Returns:
+        bool: whether the username is taken
+    """
+    return "UNIQUE constraint failed: user.username" in str(error.orig)
+
+
+async def get_user_by_username(
+    username: str, session: Optional[AsyncSession] = None
+) -> UserInDB:
     """
     Get a user by username
 
     Args:
         username (str): username of the user
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
-    with Session(engine) as session:
-        user = session.exec(
-            select(User).where(User.username == username)
+    async with unit_of_work(session) as session:
+        user = (
+            await session.exec(select(User).where(User.username == username))
         ).first()
         if user:
-            return UserInDB(**user.model_dump())
+            return from_row(UserInDB, user)
         raise Missing(msg=f"User with username {username!r} not found")
 
 
-def get_user_by_id(id: str):
+async def get_user_by_id(
+    id: str, session: Optional[AsyncSession] = None
+) -> User:
     """
     Get a user by id
 
     Args:
         id (str): id of the user
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
-        UserInDB: UserInDB object
+        User: User row, attached to the session of the unit of work
     """
-    with Session(engine) as session:
-        user = session.exec(select(User).where(User.id == id)).first()
+    async with unit_of_work(session) as session:
+        user = (await session.exec(select(User).where(User.id == id))).first()
         if user:
             return user
         raise Missing(msg=f"User with id {id!r} not found")
 
 
-def get_all_users() -> list[UserInDB]:
+async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session: Optional[AsyncSession] = None,
+) -> tuple[list[UserInDB], Optional[str]]:
+    """
+    Get a page of users, newest first
+
+    Args:
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of users in the page
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        tuple[List[UserInDB], Optional[str]]: List of UserInDB objects and
+            the cursor of the next page
+    """
+    async with unit_of_work(session) as session:
+        users = (
+            await session.exec(paginate(select(User), User, cursor, limit))
+        ).all()
+        users, next_cursor = page(users, limit)
+        return [from_row(UserInDB, u) for u in users], next_cursor
+
+
+def _select_with_role():
+    """
+    Select users joined with the name of their role
+
+    Returns:
+        Select: select statement of (User, role name) rows
+    """
+    from data.user_role import UserRole
+
+    return select(User, UserRole.name).join(
+        UserRole, UserRole.id == User.role_id
+    )
+
+
+async def get_user_with_role_by_id(
+    id: str, session: Optional[AsyncSession] = None
+) -> UserWithRole:
+    """
+    Get a user and the name of its role by user id, in one query
+
+    Args:
+        id (str): id of the user
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        UserWithRole: UserWithRole object
+    """
+    async with unit_of_work(session) as session:
+        row = (
+            await session.exec(_select_with_role().where(User.id == id))
+        ).first()
+        if row:
+            return from_row(UserWithRole, row[0], role=row[1])
+        raise Missing(msg=f"User with id {id!r} not found")
+
+
+async def get_user_with_role_by_username(
+    username: str, session: Optional[AsyncSession] = None
+) -> UserWithRole:
     """
-    Get all users
+    Get a user and the name of its role by username, in one query
+
+    Args:
+        username (str): username of the user
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
-        List[UserInDB]: List of UserInDB objects
+        UserWithRole: UserWithRole object
     """
-    with Session(engine) as session:
-        users = session.exec(select(User)).all()
-        return [UserInDB(**u.model_dump()) for u in users]
+    async with unit_of_work(session) as session:
+        row = (
+            await session.exec(
+                _select_with_role().where(User.username == username)
+            )
+        ).first()
+        if row:
+            return from_row(UserWithRole, row[0], role=row[1])
+        raise Missing(msg=f"User with username {username!r} not found")
 
 
-def create_user(user: UserCreate) -> UserInDB:
+async def get_users_with_role_by_ids(
+    ids: Sequence[str], session: Optional[AsyncSession] = None
+) -> list[UserWithRole]:
+    """
+    Get the users with any of the given ids and the names of their roles, in
+    one query
+
+    Args:
+        ids (Sequence[str]): ids of the users
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        list[UserWithRole]: the UserWithRole objects found, in no
+            particular order
+    """
+    async with unit_of_work(session) as session:
+        rows = (
+            await session.exec(_select_with_role().where(User.id.in_(ids)))
+        ).all()
+        return [from_row(UserWithRole, u, role=role) for u, role in rows]
+
+
+async def get_all_users_with_role(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session: Optional[AsyncSession] = None,
+) -> tuple[list[UserWithRole], Optional[str]]:
+    """
+    Get a page of users and the names of their roles, newest first, in one
+    query
+
+    Args:
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of users in the page
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        tuple[List[UserWithRole], Optional[str]]: List of UserWithRole
+            objects and the cursor of the next page
+    """
+    async with unit_of_work(session) as session:
+        rows = (
+            await session.exec(
+                paginate(_select_with_role(), User, cursor, limit)
+            )
+        ).all()
+        return page(
+            [from_row(UserWithRole, u, role=role) for u, role in rows],
+            limit,
+        )
+
+
+async def create_user(
+    user: UserCreate, session: Optional[AsyncSession] = None
+) -> UserInDB:
     """
     Create a new user
 
+    The user is created with a single ``INSERT ... RETURNING`` statement; a
+    username that is already taken, also by a concurrent signup, is caught
+    by the unique index on username. Other integrity errors are raised as
+    they are.
+
     Args:
         user (UserCreate): UserCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
-    with Session(engine) as session:
-        from data.user_role import get_user_role_by_name
+    from data.user_role import get_user_role_by_name
 
+    password_hash = await hash_password(user.password)
+    async with unit_of_work(session) as session:
+        now = utcnow()
         try:
-            # Check if username is unique
-            if session.exec(
-                select(User).where(User.username == user.username)
-            ).first():
-                raise Duplicate(
-                    msg=f"User with username {user.username!r} already exists"
+            n_user = (
+                await session.exec(
+                    insert(User)
+                    .values(
+                        id=new_id(),
+                        username=user.username,
+                        password_hash=password_hash,
+                        role_id=(
+                            await get_user_role_by_name("user", session)
+                        ).id,
+                        time_created=now,
+                        time_updated=now,
+                    )
+                    .returning(User)
                 )
-            n_user = User(
-                username=user.username,
-                password_hash=hashpw(
-                    user.password.encode("utf-8"), gensalt()
-                ).decode("utf-8"),
-                role_id=get_user_role_by_name("user").id,
-                time_created=datetime.now(UTC),
-                time_updated=datetime.now(UTC),
+            ).scalar_one()
+        except IntegrityError as e:
+            if not _username_taken(e):
+                raise e
+            raise Duplicate(
+                msg=f"User with username {user.username!r} already exists"
             )
-            session.add(n_user)
-            session.commit()
-            session.refresh(n_user)
-            return UserInDB(**n_user.model_dump())
-        except Exception as e:
-            print(e)
-            session.rollback()
-            raise e
-
-
-def get_role_by_user_id(user_id: str):
-    with Session(engine) as session:
-        user = session.exec(select(User).where(User.id == user_id)).first()
-        if user:
-            return user.role_id
-        raise Missing(msg=f"User with id {user_id!r} not found")
+        return from_row(UserInDB, n_user)
 
 
-def update_user(user: UserUpdate) -> UserInDB:
+async def import_users(
+    users: list[UserCreate],
+    hasher: HashingExecutor,
+    session: Optional[AsyncSession] = None,
+    max_in_flight: Optional[int] = None,
+) -> int:
+    """
+    Create a batch of users, skipping the taken usernames
+
+    Taken usernames are found with one ``IN`` query before any password is
+    hashed, the remaining passwords are hashed in parallel on ``hasher``,
+    at most ``max_in_flight`` at a time, and the users are inserted with one
+    executemany ``INSERT``. A username taken concurrently is skipped by
+    ``ON CONFLICT DO NOTHING``.
+
+    Args:
+        users (list[UserCreate]): UserCreate objects, the first of several
+            with the same username wins
+        hasher (HashingExecutor): executor hashing the passwords
+        session (Optional[AsyncSession]): session of the unit of work
+        max_in_flight (Optional[int]): number of passwords running or
+            waiting on ``hasher`` at the same time, the whole batch by
+            default
+
+    Returns:
+        int: number of users created
+    """
+    from data.user_role import get_user_role_by_name
+
+    unique = {}
+    for user in users:
+        unique.setdefault(user.username, user)
+    async with unit_of_work(session) as session:
+        taken = set(
+            (
+                await session.exec(
+                    select(User.username).where(
+                        User.username.in_(list(unique))
+                    )
+                )
+            ).all()
+        )
+        new_users = [u for n, u in unique.items() if n not in taken]
+        if not new_users:
+            return 0
+        limit = asyncio.Semaphore(max_in_flight or len(new_users))
+
+        async def hash_limited(password: str) -> str:
+            async with limit:
+                return await hasher.hash(password)
+
+        password_hashes = await asyncio.gather(
+            *(hash_limited(user.password) for user in new_users)
+        )
+        role_id = (await get_user_role_by_name("user", session)).id
+        now = utcnow()
+        # A Core execute, unlike the ORM one, reports the inserted rowcount
+        connection = await session.connection()
+        result = await connection.execute(
+            insert(User).on_conflict_do_nothing(),
+            [
+                {
+                    "id": new_id(),
+                    "username": user.username,
+                    "password_hash": password_hash,
+                    "role_id": role_id,
+                    "time_created": now,
+                    "time_updated": now,
+                }
+                for user, password_hash in zip(new_users, password_hashes)
+            ],
+        )
+        return result.rowcount
+
+
+async def update_user(
+    user: UserUpdate, session: Optional[AsyncSession] = None
+) -> UserInDB:
     """
     Update a user
 
+    The update is a single ``UPDATE ... RETURNING`` statement; a username
+    that is already taken is caught by the unique index on username.
+
     Args:
         user (UserUpdate): UserUpdate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
-    with Session(engine) as session:
+    values = {"time_updated": utcnow()}
+    if user.username:
+        values["username"] = user.username
+    if user.password:
+        values["password_hash"] = await hash_password(user.password)
+    async with unit_of_work(session) as session:
         try:
-            try:
-                n_user = get_user_by_id(user.id)
-            except Missing as e:
+            n_user = (
+                await session.exec(
+                    update(User)
+                    .where(User.id == user.id)
+                    .values(**values)
+                    .returning(User)
+                )
+            ).scalar_one_or_none()
+        except IntegrityError as e:
+            if not _username_taken(e):
                 raise e
-            if user.username:
-                try:
-                    d_user = get_user_by_username(user.username)
-                    if d_user.id != user.id:
-                        raise Duplicate(
-                            msg=f"User with username {user.username!r} already exists"
-                        )
-                except Missing:
-                    pass
-            if user.password:
-                n_user.password_hash = hashpw(
-                    user.password.encode("utf-8"), gensalt()
-                ).decode("utf-8")
-            if user.username:
-                n_user.username = user.username
-            n_user.time_updated = datetime.now(UTC)
-            session.add(n_user)
-            session.commit()
-            session.refresh(n_user)
-            return UserInDB(**n_user.model_dump())
-        except Exception as e:
-            session.rollback()
-            raise e
-
-
-def delete_user(user: UserInDB):
+            raise Duplicate(
+                msg=f"User with username {user.username!r} already exists"
+            )
+        if n_user:
+            return from_row(UserInDB, n_user)
+        raise Missing(msg=f"User with id {user.id!r} not found")
+
+
+async def delete_user(user: UserInDB, session: Optional[AsyncSession] = None):
     """
     Delete a user
 
     Args:
         user (UserInDB): UserInDB object
+        session (Optional[AsyncSession]): session of the unit of work
     """
-    with Session(engine) as session:
-        try:
-            n_user = session.exec(
-                select(User).where(User.id == user.id)
-            ).first()
-            if not n_user:
-                raise Missing(msg=f"User with id {user.id!r} not found")
-            session.delete(n_user)
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            raise e
+    async with unit_of_work(session) as session:
+        n_user = (
+            await session.exec(select(User).where(User.id == user.id))
+        ).first()
+        if not n_user:
+            raise Missing(msg=f"User with id {user.id!r} not found")
+        await session.delete(n_user)
+        await session.flush()
 
 
-def create_user_role(user_role: UserRoleCreate) -> UserRoleInDB:
+async def create_user_role(
+    user_role: UserRoleCreate, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Create a new user role
 
     Args:
         user_role (UserRoleCreate): UserRoleCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     from data.user_role import create_user_role
 
-    return create_user_role(user_role)
+    return await create_user_role(user_role, session)
 
 
-def get_user_role_by_id(role_id: str) -> UserRoleInDB:
+async def get_user_role_by_id(
+    role_id: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Get a user role by id
 
     Args:
         role_id (str): id of the user role
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     from data.user_role import get_user_role_by_id
 
-    return get_user_role_by_id(role_id)
+    return await get_user_role_by_id(role_id, session)
 
 
-def get_user_role_by_name(name: str) -> UserRoleInDB:
+async def get_user_role_by_name(
+    name: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Get a user role by name
 
     Args:
         name: str - name of the user role
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     from data.user_role import get_user_role_by_name
 
-    return get_user_role_by_name(name)
+    return await get_user_role_by_name(name, session)
 
 
-def get_all_user_roles() -> list[UserRoleInDB]:
+async def get_all_user_roles(
+    session: Optional[AsyncSession] = None,
+) -> list[UserRoleInDB]:
     """
     Get all user roles
 
+    Args:
+        session (Optional[AsyncSession]): session of the unit of work
+
     Returns:
         list[UserRoleInDB]: List of UserRoleInDB objects
     """
     from data.user_role import get_all_user_roles
 
-    return get_all_user_roles()
+    return await get_all_user_roles(session)
 
 
-def update_user_role(
-    user_role_id: str, user_role: UserRoleUpdate
+async def update_user_role(
+    user_role_id: str,
+    user_role: UserRoleUpdate,
+    session: Optional[AsyncSession] = None,
 ) -> UserRoleInDB:
     """
     Update a user role
@@ -266,48 +510,52 @@ def update_user_role(
     Args:
         user_role_id (str): id of the user role
         user_role (UserRoleCreate): UserRoleCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     from data.user_role import update_user_role
 
-    return update_user_role(user_role_id, user_role)
+    return await update_user_role(user_role_id, user_role, session)
 
 
-def delete_user_role(user_role_id: str):
+async def delete_user_role(
+    user_role_id: str, session: Optional[AsyncSession] = None
+):
     """
     Delete a user role
 
     Args:
         user_role_id (str): id of the user role
+        session (Optional[AsyncSession]): session of the unit of work
     """
     from data.user_role import delete_user_role
 
-    delete_user_role(user_role_id)
+    await delete_user_role(user_role_id, session)
 
 
-def user_role_update(user_id: str, role_name: str):
+async def user_role_update(
+    user_id: str, role_name: str, session: Optional[AsyncSession] = None
+):
     """
     Update a user role
 
     Args:
         user_id (str): id of the user
         role_name (str): name of the role
+        session (Optional[AsyncSession]): session of the unit of work
     """
     from data.user_role import get_user_role_by_name
 
-    with Session(engine) as session:
-        try:
-            user = session.exec(select(User).where(User.id == user_id)).first()
-            if not user:
-                raise Missing(msg=f"User with id {user_id!r} not found")
-            role = get_user_role_by_name(role_name)
-            user.role_id = role.id
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-            return UserInDB(**user.model_dump())
-        except Exception as e:
-            session.rollback()
-            raise e
+    async with unit_of_work(session) as session:
+        user = (
+            await session.exec(select(User).where(User.id == user_id))
+        ).first()
+        if not user:
+            raise Missing(msg=f"User with id {user_id!r} not found")
+        role = await get_user_role_by_name(role_name, session)
+        user.role_id = role.id
+        user.time_updated = utcnow()
+        await session.flush()
+        return from_row(UserInDB, user)
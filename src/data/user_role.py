@@ -4,11 +4,18 @@ User Role Data
 This module contains the data layer for the User Role model.
 """
 
-import uuid
-from sqlmodel import Field, Relationship, SQLModel, Session, select
+from contextlib import AbstractContextManager
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlmodel import Field, Relationship, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from model import from_row
 from model.user_role import UserRoleInDB, UserRoleCreate, UserRoleUpdate
 from errors.errors import Missing, Duplicate
-from . import engine
+from . import unit_of_work
+from .ids import UUIDBlob, new_id
+from .invalidation import InvalidationLog
 
 
 class UserRole(SQLModel, table=True):
@@ -21,91 +28,295 @@ class UserRole(SQLModel, table=True):
     """
 
     __tablename__: str = "user_role"
-    id: str = Field(
-        primary_key=True, default_factory=lambda: str(uuid.uuid4())
-    )
+    id: str = Field(primary_key=True, default_factory=new_id, sa_type=UUIDBlob)
     name: str = Field(min_length=2, max_length=100, unique=True, index=True)
     users: list["User"] = Relationship(back_populates="role")
 
 
-def get_user_role_by_id(id: str) -> UserRoleInDB:
+class RoleCache:
+    """
+    In-process cache of the user roles, by id and by name
+
+    The role table has a handful of rows that almost never change, so once
+    the cache is warm resolving a role costs no database round trip. Entries
+    are only added from rows read from the database and are dropped by every
+    role write, once when the row is written and again when its transaction
+    ends, so the next lookup reads the committed row. A row whose id or name
+    was invalidated while it was being read is not added, since it may
+    predate the write. The cache is per process: role writes in another
+    worker are not seen until it restarts.
+
+    Attributes:
+        hits (int): number of lookups answered from the cache
+        misses (int): number of lookups that went to the database
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self._by_id: dict[str, UserRoleInDB] = {}
+        self._by_name: dict[str, UserRoleInDB] = {}
+        self._invalidations = InvalidationLog()
+        self.hits = 0
+        self.misses = 0
+
+    def get_by_id(self, id: str) -> Optional[UserRoleInDB]:
+        """
+        Get a cached user role by id
+
+        Args:
+            id (str): id of the user role
+
+        Returns:
+            Optional[UserRoleInDB]: UserRoleInDB object, or None on a miss
+        """
+        return self._count(self._by_id.get(id))
+
+    def get_by_name(self, name: str) -> Optional[UserRoleInDB]:
+        """
+        Get a cached user role by name
+
+        Args:
+            name (str): name of the user role
+
+        Returns:
+            Optional[UserRoleInDB]: UserRoleInDB object, or None on a miss
+        """
+        return self._count(self._by_name.get(name))
+
+    def read(self) -> AbstractContextManager[int]:
+        """
+        Track a read of user roles to cache
+
+        Returns:
+            AbstractContextManager[int]: context of the read, yielding the
+                number to pass to ``put``
+        """
+        return self._invalidations.read()
+
+    def put(
+        self, user_role: UserRoleInDB, since: int, *keys: str
+    ) -> UserRoleInDB:
+        """
+        Cache a user role read from the database, unless it was invalidated
+        during the read
+
+        Args:
+            user_role (UserRoleInDB): UserRoleInDB object
+            since (int): number yielded by ``read`` before the row was read
+            keys (str): other keys the row was looked up by
+
+        Returns:
+            UserRoleInDB: the UserRoleInDB object
+        """
+        if not self._invalidations.invalidated_since(
+            since, user_role.id, user_role.name, *keys
+        ):
+            self._by_id[user_role.id] = user_role
+            self._by_name[user_role.name] = user_role
+        return user_role
+
+    def invalidate(self, *keys: str) -> None:
+        """
+        Drop the user roles with any of the given ids or names
+
+        Args:
+            keys (str): ids and names of the user roles
+        """
+        self._invalidations.invalidate(*keys)
+        for key in keys:
+            for user_role in (self._by_id.get(key), self._by_name.get(key)):
+                if user_role:
+                    self._by_id.pop(user_role.id, None)
+                    self._by_name.pop(user_role.name, None)
+
+    def clear(self) -> None:
+        """
+        Drop every cached user role and reset the counters
+        """
+        self._by_id.clear()
+        self._by_name.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the cache counters
+
+        Returns:
+            dict[str, int]: number of cached roles, hits and misses
+        """
+        return {
+            "size": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _count(
+        self, user_role: Optional[UserRoleInDB]
+    ) -> Optional[UserRoleInDB]:
+        """
+        Count a lookup as a hit or a miss
+
+        Args:
+            user_role (Optional[UserRoleInDB]): result of the lookup
+
+        Returns:
+            Optional[UserRoleInDB]: result of the lookup
+        """
+        if user_role:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return user_role
+
+
+role_cache = RoleCache()
+
+
+def _invalidate(session: AsyncSession, *keys: str) -> None:
+    """
+    Drop user roles from the cache now and when the transaction ends
+
+    Args:
+        session (AsyncSession): session writing the user roles
+        keys (str): ids and names of the user roles
+    """
+    role_cache.invalidate(*keys)
+    session.info.setdefault("role_cache_keys", set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_on_transaction_end(session: Session) -> None:
+    """
+    Drop the user roles written in a transaction once it is over, and keep
+    the lookups that read them meanwhile from caching what they read
+
+    Args:
+        session (Session): session whose transaction ended
+    """
+    role_cache.invalidate(*session.info.pop("role_cache_keys", ()))
+
+
+async def load_role_cache(session: Optional[AsyncSession] = None) -> None:
+    """
+    Fill the role cache with every user role, e.g. at startup
+
+    Args:
+        session: Optional[AsyncSession] - session of the unit of work
+    """
+    await get_all_user_roles(session)
+
+
+async def get_user_role_by_id(
+    id: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Get a user role by id
 
     Args:
         id: str - id of the user role
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
         UserRole: UserRole object
     """
-    with Session(engine) as session:
-        user_role = session.exec(
-            select(UserRole).where(UserRole.id == id)
-        ).first()
+    cached = role_cache.get_by_id(id)
+    if cached:
+        return cached
+    with role_cache.read() as since:
+        async with unit_of_work(session) as session:
+            user_role = (
+                await session.exec(select(UserRole).where(UserRole.id == id))
+            ).first()
         if user_role:
-            return UserRoleInDB(**user_role.model_dump())
+            return role_cache.put(from_row(UserRoleInDB, user_role), since)
         raise Missing(msg=f"User role with id {id!r} not found")
 
 
-def get_user_role_by_name(name: str) -> UserRoleInDB:
+async def get_user_role_by_name(
+    name: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Get a user role by name
 
     Args:
         name: str - name of the user role
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
         UserRole: UserRole object
     """
-    with Session(engine) as session:
-        user_role = session.exec(
-            select(UserRole).where(UserRole.name == name)
-        ).first()
+    cached = role_cache.get_by_name(name)
+    if cached:
+        return cached
+    with role_cache.read() as since:
+        async with unit_of_work(session) as session:
+            user_role = (
+                await session.exec(
+                    select(UserRole).where(UserRole.name == name)
+                )
+            ).first()
         if user_role:
-            return UserRoleInDB(**user_role.model_dump())
+            return role_cache.put(
+                from_row(UserRoleInDB, user_role), since, name
+            )
         raise Missing(msg=f"User role with name {name!r} not found")
 
 
-def get_all_user_roles() -> list[UserRoleInDB]:
+async def get_all_user_roles(
+    session: Optional[AsyncSession] = None,
+) -> list[UserRoleInDB]:
     """
     Get all user roles
 
+    Args:
+        session: Optional[AsyncSession] - session of the unit of work
+
     Returns:
         list[UserRole]: List of UserRole objects
     """
-    with Session(engine) as session:
-        user_roles = session.exec(select(UserRole)).all()
+    with role_cache.read() as since:
+        async with unit_of_work(session) as session:
+            user_roles = (await session.exec(select(UserRole))).all()
         return [
-            UserRoleInDB(**user_role.model_dump()) for user_role in user_roles
+            role_cache.put(from_row(UserRoleInDB, user_role), since)
+            for user_role in user_roles
         ]
 
 
-def create_user_role(user_role_create: UserRoleCreate) -> UserRoleInDB:
+async def create_user_role(
+    user_role_create: UserRoleCreate, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Create a user role
 
     Args:
         user_role_create: UserRoleCreate - user role create object
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
         UserRole: UserRole object
     """
     user_role = UserRole.model_validate(user_role_create)
-    with Session(engine) as session:
+    async with unit_of_work(session) as session:
+        _invalidate(session, user_role.name)
         try:
             session.add(user_role)
-            session.commit()
-            session.refresh(user_role)
-            return UserRoleInDB(**user_role.model_dump())
+            await session.flush()
+            return from_row(UserRoleInDB, user_role)
         except Exception as e:
-            session.rollback()
             raise Duplicate(
                 msg=f"User role with name {user_role.name!r} already exists"
             )
 
 
-def update_user_role(
-    id: str, user_role_update: UserRoleUpdate
+async def update_user_role(
+    id: str,
+    user_role_update: UserRoleUpdate,
+    session: Optional[AsyncSession] = None,
 ) -> UserRoleInDB:
     """
     Update a user role
@@ -113,45 +324,53 @@ def update_user_role(
     Args:
         id: str - id of the user role
         user_role_update: UserRoleCreate - user role create object
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
         UserRole: UserRole object
     """
-    with Session(engine) as session:
-        user_role = session.exec(
-            select(UserRole).where(UserRole.id == id)
+    async with unit_of_work(session) as session:
+        user_role = (
+            await session.exec(select(UserRole).where(UserRole.id == id))
         ).first()
         if user_role:
-            if session.exec(
-                select(UserRole).where(UserRole.name == user_role_update.name)
+            if (
+                await session.exec(
+                    select(UserRole).where(
+                        UserRole.name == user_role_update.name
+                    )
+                )
             ).first():
                 raise Duplicate(
                     msg=f"User role with name {user_role_update.name!r} already exists"
                 )
+            _invalidate(session, id, user_role_update.name)
             user_role.name = user_role_update.name
-            session.add(user_role)
-            session.commit()
-            session.refresh(user_role)
-            return UserRoleInDB(**user_role.model_dump())
+            await session.flush()
+            return from_row(UserRoleInDB, user_role)
         raise Missing(msg=f"User role with id {id!r} not found")
 
 
-def delete_user_role(id: str) -> UserRoleInDB:
+async def delete_user_role(
+    id: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Delete a user role
 
     Args:
         id: str - id of the user role
+        session: Optional[AsyncSession] - session of the unit of work
 
     Returns:
         UserRole: UserRole object
     """
-    with Session(engine) as session:
-        user_role = session.exec(
-            select(UserRole).where(UserRole.id == id)
+    async with unit_of_work(session) as session:
+        user_role = (
+            await session.exec(select(UserRole).where(UserRole.id == id))
         ).first()
         if user_role:
-            session.delete(user_role)
-            session.commit()
-            return UserRoleInDB(**user_role.model_dump())
+            _invalidate(session, id)
+            await session.delete(user_role)
+            await session.flush()
+            return from_row(UserRoleInDB, user_role)
         raise Missing(msg=f"User role with id {id!r} not found")
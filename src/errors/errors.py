@@ -63,3 +63,97 @@ class Duplicate(Exception):
             str: Error message
         """
         return self.msg
+
+
+class InvalidCursor(Exception):
+    """
+    Invalid cursor exception
+
+    Args:
+        Exception (Exception): Base exception class
+
+    Attributes:
+        msg (str): Error message
+    """
+
+    def __init__(self, msg: str, *args: object) -> None:
+        """
+        Constructor
+
+        Args:
+            msg (str): Error message
+        """
+        super().__init__(*args)
+        self.msg = msg
+
+    def __str__(self) -> str:
+        """
+        String representation
+
+        Returns:
+            str: Error message
+        """
+        return self.msg
+
+
+class Busy(Exception):
+    """
+    Busy exception, raised when a bounded resource is saturated
+
+    Args:
+        Exception (Exception): Base exception class
+
+    Attributes:
+        msg (str): Error message
+    """
+
+    def __init__(self, msg: str, *args: object) -> None:
+        """
+        Constructor
+
+        Args:
+            msg (str): Error message
+        """
+        super().__init__(*args)
+        self.msg = msg
+
+    def __str__(self) -> str:
+        """
+        String representation
+
+        Returns:
+            str: Error message
+        """
+        return self.msg
+
+
+class PreconditionFailed(Exception):
+    """
+    Precondition failed exception, raised when a conditional write finds
+    the row changed since the version it was based on
+
+    Args:
+        Exception (Exception): Base exception class
+
+    Attributes:
+        msg (str): Error message
+    """
+
+    def __init__(self, msg: str, *args: object) -> None:
+        """
+        Constructor
+
+        Args:
+            msg (str): Error message
+        """
+        super().__init__(*args)
+        self.msg = msg
+
+    def __str__(self) -> str:
+        """
+        String representation
+
+        Returns:
+            str: Error message
+        """
+        return self.msg
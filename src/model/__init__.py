@@ -2,5 +2,31 @@
 This module contains the model classes for the application.
 """
 
+from typing import Any, TypeVar
 from pydantic import BaseModel
 from datetime import datetime
+
+M = TypeVar("M", bound=BaseModel)
+
+# Maximum number of ids of a batch get
+MAX_BATCH_SIZE = 100
+
+
+def from_row(model: type[M], row: Any, **values: Any) -> M:
+    """
+    Build a model from a database row in a single validation
+
+    The model is validated by pydantic-core straight from the attributes
+    the row has loaded, instead of dumping the row to a dict and
+    validating the dict, once per layer. Attributes the model has no field
+    for, e.g. a password hash, are ignored.
+
+    Args:
+        model (type[M]): model class
+        row (Any): table row or model with the fields of ``model``
+        values (Any): values of the fields the row has no attribute for
+
+    Returns:
+        M: model object
+    """
+    return model.model_validate({**row.__dict__, **values})
@@ -2,10 +2,35 @@
 This module contains the pydantic models for the blog.
 """
 
-from . import BaseModel, datetime
+from . import MAX_BATCH_SIZE, BaseModel, datetime
 from pydantic import Field
 from typing import Optional
 
+MAX_BULK_SIZE = 10_000
+# Maximum length of the excerpt of a blog, ellipsis included
+EXCERPT_LENGTH = 200
+
+
+def excerpt(content: str) -> str:
+    """
+    Get the excerpt of the content of a blog
+
+    The excerpt is the beginning of the content, whitespace collapsed, cut
+    after a whole word and ended with an ellipsis when the content is longer
+    than ``EXCERPT_LENGTH``.
+
+    Args:
+        content (str): content of the blog
+
+    Returns:
+        str: the excerpt
+    """
+    text = " ".join(content.split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text.rfind(" ", 0, EXCERPT_LENGTH)
+    return text[: cut if cut > 0 else EXCERPT_LENGTH - 1] + "…"
+
 
 class Blog(BaseModel):
     """
@@ -20,6 +45,7 @@ class Blog(BaseModel):
         content (str): The content of the blog
         time_created (datetime): The time the blog was created
         time_updated (datetime): The time the blog was last updated
+        version (int): The number of writes of the blog, starting at 1
     """
 
     id: str = Field(..., description="The unique identifier for the blog")
@@ -36,6 +62,9 @@ class Blog(BaseModel):
     time_updated: datetime = Field(
         ..., description="The time the blog was last updated"
     )
+    version: int = Field(
+        ..., ge=1, description="The number of writes of the blog"
+    )
 
 
 class BlogCreate(BaseModel):
@@ -108,3 +137,253 @@ class BlogOut(Blog):
     """
 
     pass
+
+
+class BlogPage(BaseModel):
+    """
+    Blog page model
+
+    This class contains one page of a cursor-paginated list of blogs.
+
+    Attributes:
+        items (list[BlogOut]): The blogs in the page, newest first
+        next_cursor (str): The cursor of the next page, None on the last page
+    """
+
+    items: list[BlogOut] = Field(..., description="The blogs in the page")
+    next_cursor: Optional[str] = Field(
+        None, description="The cursor of the next page"
+    )
+
+
+class BlogBulkCreate(BaseModel):
+    """
+    Blog bulk create model
+
+    This class contains the blogs created together by a bulk request.
+
+    Attributes:
+        blogs (list[BlogCreate]): The blogs to create
+    """
+
+    blogs: list[BlogCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BULK_SIZE,
+        description="The blogs to create",
+    )
+
+
+class BlogBulkOut(BaseModel):
+    """
+    Blog bulk out model
+
+    This class contains the result of a bulk create request.
+
+    Attributes:
+        ids (list[str]): The ids of the created blogs, in request order
+    """
+
+    ids: list[str] = Field(..., description="The ids of the created blogs")
+
+
+class BlogSummary(BaseModel):
+    """
+    Blog summary model
+
+    This class contains the attributes of a blog shown in a list, with an
+    excerpt instead of the content.
+
+    Attributes:
+        id (str): The unique identifier for the blog
+        user_id (str): The unique identifier for the user
+        title (str): The title of the blog
+        excerpt (str): The beginning of the content of the blog
+        time_created (datetime): The time the blog was created
+        time_updated (datetime): The time the blog was last updated
+        version (int): The number of writes of the blog, starting at 1
+    """
+
+    id: str = Field(..., description="The unique identifier for the blog")
+    user_id: str = Field(..., description="The unique identifier for the user")
+    title: str = Field(..., description="The title of the blog")
+    excerpt: str = Field(
+        ..., description="The beginning of the content of the blog"
+    )
+    time_created: datetime = Field(
+        ..., description="The time the blog was created"
+    )
+    time_updated: datetime = Field(
+        ..., description="The time the blog was last updated"
+    )
+    version: int = Field(..., description="The number of writes of the blog")
+
+
+class BlogSummaryPage(BaseModel):
+    """
+    Blog summary page model
+
+    This class contains one page of a cursor-paginated list of blog
+    summaries.
+
+    Attributes:
+        items (list[BlogSummary]): The blogs in the page, newest first
+        next_cursor (str): The cursor of the next page, None on the last page
+    """
+
+    items: list[BlogSummary] = Field(..., description="The blogs in the page")
+    next_cursor: Optional[str] = Field(
+        None, description="The cursor of the next page"
+    )
+
+
+class BlogAuthor(BaseModel):
+    """
+    Blog author model
+
+    This class contains the attributes of the author embedded in a blog.
+
+    Attributes:
+        id (str): The unique identifier for the user
+        username (str): The username of the user
+        role (str): The role of the user
+    """
+
+    id: str = Field(..., description="The unique identifier for the user")
+    username: str = Field(..., description="The username of the user")
+    role: str = Field(..., description="The role of the user")
+
+
+class BlogWithAuthor(BlogOut):
+    """
+    Blog with author model
+
+    This class contains the attributes of a blog and its author.
+
+    Attributes:
+        author (BlogAuthor): The author of the blog
+    """
+
+    author: BlogAuthor = Field(..., description="The author of the blog")
+
+
+class BlogWithAuthorPage(BaseModel):
+    """
+    Blog with author page model
+
+    This class contains one page of a cursor-paginated list of blogs with
+    their authors.
+
+    Attributes:
+        items (list[BlogWithAuthor]): The blogs in the page, newest first
+        next_cursor (str): The cursor of the next page, None on the last page
+    """
+
+    items: list[BlogWithAuthor] = Field(
+        ..., description="The blogs in the page"
+    )
+    next_cursor: Optional[str] = Field(
+        None, description="The cursor of the next page"
+    )
+
+
+class BlogSummaryWithAuthor(BlogSummary):
+    """
+    Blog summary with author model
+
+    This class contains the attributes of a blog summary and its author.
+
+    Attributes:
+        author (BlogAuthor): The author of the blog
+    """
+
+    author: BlogAuthor = Field(..., description="The author of the blog")
+
+
+class BlogSummaryWithAuthorPage(BaseModel):
+    """
+    Blog summary with author page model
+
+    This class contains one page of a cursor-paginated list of blog
+    summaries with their authors.
+
+    Attributes:
+        items (list[BlogSummaryWithAuthor]): The blogs in the page, newest
+            first
+        next_cursor (str): The cursor of the next page, None on the last page
+    """
+
+    items: list[BlogSummaryWithAuthor] = Field(
+        ..., description="The blogs in the page"
+    )
+    next_cursor: Optional[str] = Field(
+        None, description="The cursor of the next page"
+    )
+
+
+class BlogBatchGet(BaseModel):
+    """
+    Blog batch get model
+
+    This class contains the ids of the blogs read together by a batch
+    request.
+
+    Attributes:
+        ids (list[str]): The ids of the blogs to read
+    """
+
+    ids: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_SIZE,
+        description="The ids of the blogs to read",
+    )
+
+
+class BlogBatchOut(BaseModel):
+    """
+    Blog batch out model
+
+    This class contains the result of a batch get request.
+
+    Attributes:
+        items (list[Optional[BlogOut]]): The blogs, in request order, None
+            for the ids not found
+    """
+
+    items: list[Optional[BlogOut]] = Field(
+        ..., description="The blogs in request order, null if not found"
+    )
+
+
+class BlogSearchHit(BlogOut):
+    """
+    Blog search hit model
+
+    This class contains a blog matching a search and where it matched.
+
+    Attributes:
+        snippet (str): The best matching text of the blog, matched words
+            wrapped in <b></b>
+    """
+
+    snippet: str = Field(..., description="The best matching text of the blog")
+
+
+class BlogSearchPage(BaseModel):
+    """
+    Blog search page model
+
+    This class contains one page of cursor-paginated search results.
+
+    Attributes:
+        items (list[BlogSearchHit]): The matching blogs, best match first
+        next_cursor (str): The cursor of the next page, None on the last page
+    """
+
+    items: list[BlogSearchHit] = Field(
+        ..., description="The matching blogs in the page"
+    )
+    next_cursor: Optional[str] = Field(
+        None, description="The cursor of the next page"
+    )
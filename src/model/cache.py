@@ -0,0 +1,47 @@
+"""
+This module contains the response cache model.
+"""
+
+from pydantic import Field
+from . import BaseModel
+
+
+class ResponseCacheStats(BaseModel):
+    """
+    Response cache statistics model
+
+    This class contains the counters of the response cache.
+
+    Attributes:
+        entries (int): The number of cached responses
+        bytes (int): The total size of the cached responses
+        max_bytes (int): The maximum total size of the cached responses
+        hits (int): The number of reads served from the cache
+        misses (int): The number of reads that went to the database
+        hit_ratio (float): The share of reads served from the cache
+        evictions (int): The number of responses evicted to make room
+        expirations (int): The number of responses dropped after their TTL
+    """
+
+    entries: int = Field(..., description="The number of cached responses")
+    bytes: int = Field(
+        ..., description="The total size of the cached responses"
+    )
+    max_bytes: int = Field(
+        ..., description="The maximum total size of the cached responses"
+    )
+    hits: int = Field(
+        ..., description="The number of reads served from the cache"
+    )
+    misses: int = Field(
+        ..., description="The number of reads that went to the database"
+    )
+    hit_ratio: float = Field(
+        ..., description="The share of reads served from the cache"
+    )
+    evictions: int = Field(
+        ..., description="The number of responses evicted to make room"
+    )
+    expirations: int = Field(
+        ..., description="The number of responses dropped after their TTL"
+    )
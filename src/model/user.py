@@ -4,7 +4,7 @@ This module contains the user model.
 
 from typing import Optional
 from pydantic import Field
-from . import BaseModel, datetime
+from . import MAX_BATCH_SIZE, BaseModel, datetime
 
 
 class User(BaseModel):
@@ -122,3 +122,92 @@ class UserOut(BaseModel):
     time_updated: datetime = Field(
         ..., description="The time the user was last updated"
     )
+
+
+class UserPage(BaseModel):
+    """
+    User page model
+
+    This class contains one page of a cursor-paginated list of users.
+
+    Attributes:
+        items (list[UserOut]): The users in the page, newest first
+        next_cursor (str): The cursor of the next page, None on the last page
+    """
+
+    items: list[UserOut] = Field(..., description="The users in the page")
+    next_cursor: Optional[str] = Field(
+        None, description="The cursor of the next page"
+    )
+
+
+class UserBatchGet(BaseModel):
+    """
+    User batch get model
+
+    This class contains the ids of the users read together by a batch
+    request.
+
+    Attributes:
+        ids (list[str]): The ids of the users to read
+    """
+
+    ids: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_SIZE,
+        description="The ids of the users to read",
+    )
+
+
+class UserBatchOut(BaseModel):
+    """
+    User batch out model
+
+    This class contains the result of a batch get request.
+
+    Attributes:
+        items (list[Optional[UserOut]]): The users, in request order, None
+            for the ids not found
+    """
+
+    items: list[Optional[UserOut]] = Field(
+        ..., description="The users in request order, null if not found"
+    )
+
+
+class UserImportResult(BaseModel):
+    """
+    User import result model
+
+    This class contains the outcome of a bulk user import.
+
+    Attributes:
+        created (int): The number of users created
+        skipped (int): The number of records skipped for a taken username
+        seconds (float): The duration of the import
+        users_per_second (float): The number of records processed per second
+    """
+
+    created: int = Field(..., description="The number of users created")
+    skipped: int = Field(
+        ..., description="The number of records skipped for a taken username"
+    )
+    seconds: float = Field(..., description="The duration of the import")
+    users_per_second: float = Field(
+        ..., description="The number of records processed per second"
+    )
+
+
+class UserWithRole(UserInDB):
+    """
+    User with role model
+
+    This class contains the attributes of the user in database model
+    together with the name of its role, read with a single join.
+
+    Attributes:
+        role (str): The name of the role of the user
+    """
+
+    role: str = Field(..., description="The name of the role of the user")
@@ -4,99 +4,406 @@ Blog service
 This module contains functions to interact with the blog data
 """
 
-from model.blog import BlogInDB, BlogCreate, BlogUpdate, BlogOut
+from typing import AsyncIterator, Literal, Optional, Union
+from model.blog import (
+    BlogAuthor,
+    BlogBatchGet,
+    BlogBatchOut,
+    BlogInDB,
+    BlogCreate,
+    BlogBulkCreate,
+    BlogBulkOut,
+    BlogUpdate,
+    BlogOut,
+    BlogPage,
+    BlogSearchHit,
+    BlogSearchPage,
+    BlogSummary,
+    BlogSummaryPage,
+    BlogSummaryWithAuthor,
+    BlogSummaryWithAuthorPage,
+    BlogWithAuthor,
+    BlogWithAuthorPage,
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
 from data import blog
+from model import from_row
+from data.pagination import DEFAULT_PAGE_SIZE
+from service.cache import cached, cached_rows, invalidate, row_key
 
+# Tag of every cached page of blogs
+BLOG_PAGES = "blogs"
+# Tag of every cached blog or page embedding authors, whose usernames and
+# role names the user and role writes can change
+BLOG_AUTHORS = "blog_authors"
+# Representation of the blogs in a list: full blogs or summaries
+BlogView = Literal["full", "summary"]
+# Page of blogs in any view, with or without the authors
+BlogListPage = Union[
+    BlogPage, BlogSummaryPage, BlogWithAuthorPage, BlogSummaryWithAuthorPage
+]
+# Page model, item model and columns read of each view, without and with
+# the authors
+VIEWS = {
+    ("full", False): (BlogPage, BlogOut, None),
+    ("summary", False): (BlogSummaryPage, BlogSummary, blog.SUMMARY_COLUMNS),
+    ("full", True): (BlogWithAuthorPage, BlogWithAuthor, None),
+    ("summary", True): (
+        BlogSummaryWithAuthorPage,
+        BlogSummaryWithAuthor,
+        blog.SUMMARY_COLUMNS,
+    ),
+}
 
-def create_blog(new_blog: BlogCreate) -> BlogOut:
+
+def _item(model: type, b: blog.Blog, with_author: bool):
+    """
+    Build a blog in a representation
+
+    Args:
+        model (type): model of the representation
+        b (blog.Blog): Blog object, with ``user`` and its role loaded when
+            ``with_author``
+        with_author (bool): whether to embed the author
+
+    Returns:
+        BaseModel: the blog
+    """
+    if not with_author:
+        return from_row(model, b)
+    return from_row(
+        model,
+        b,
+        author=from_row(BlogAuthor, b.user, role=b.user.role.name),
+    )
+
+
+def _page(
+    view: BlogView,
+    with_author: bool,
+    blogs: list[blog.Blog],
+    next_cursor: Optional[str],
+) -> BlogListPage:
+    """
+    Build a page of blogs in a view
+
+    Args:
+        view (BlogView): representation of the blogs
+        with_author (bool): whether to embed the authors
+        blogs (list[blog.Blog]): Blog objects
+        next_cursor (Optional[str]): cursor of the next page
+
+    Returns:
+        BlogListPage: the page
+    """
+    page_model, item_model, _ = VIEWS[view, with_author]
+    return page_model(
+        items=[_item(item_model, b, with_author) for b in blogs],
+        next_cursor=next_cursor,
+    )
+
+
+def _to_json(b: blog.Blog) -> bytes:
+    """
+    Serialize a blog row as a BlogOut
+
+    Args:
+        b (blog.Blog): Blog object
+
+    Returns:
+        bytes: JSON of the blog
+    """
+    out = from_row(BlogOut, b)
+    return out.__pydantic_serializer__.to_json(out)
+
+
+async def create_blog(
+    new_blog: BlogCreate, session: Optional[AsyncSession] = None
+) -> BlogOut:
     """
     Create a new blog
 
     Args:
         new_blog (BlogCreate): BlogCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         BlogInDB: BlogInDB object
     """
     try:
-        return BlogOut(**blog.create_blog(new_blog).model_dump())
+        created_blog = from_row(
+            BlogOut, await blog.create_blog(new_blog, session=session)
+        )
+        invalidate(session, BLOG_PAGES)
+        return created_blog
     except Exception as e:
         raise e
 
 
-def get_blog_by_id(id: str) -> BlogOut:
+async def create_blogs(
+    new_blogs: BlogBulkCreate, session: Optional[AsyncSession] = None
+) -> BlogBulkOut:
     """
-    Get a blog by id
+    Create many blogs at once
 
     Args:
-        id (str): id of the blog
+        new_blogs (BlogBulkCreate): BlogBulkCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
-        BlogInDB: BlogInDB object
+        BlogBulkOut: ids of the created blogs, in request order
     """
     try:
-        return BlogOut(**blog.get_blog_by_id(id).model_dump())
+        created_blogs = BlogBulkOut(
+            ids=await blog.create_blogs(new_blogs.blogs, session=session)
+        )
+        invalidate(session, BLOG_PAGES)
+        return created_blogs
     except Exception as e:
         raise e
 
 
-def get_blogs_by_user_id(user_id: str) -> list[BlogOut]:
+async def get_blog_by_id(
+    id: str,
+    with_author: bool = False,
+    session: Optional[AsyncSession] = None,
+) -> BlogOut | BlogWithAuthor:
     """
-    Get all blogs by user id
+    Get a blog by id, from the response cache when possible
 
     Args:
-        user_id (str): id of the user
+        id (str): id of the blog
+        with_author (bool): whether to embed the author, read in the same
+            query
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
-        List[BlogInDB]: List of BlogInDB objects
+        BlogOut | BlogWithAuthor: BlogOut or BlogWithAuthor object
     """
+
+    async def read() -> BlogOut | BlogWithAuthor:
+        return _item(
+            BlogWithAuthor if with_author else BlogOut,
+            await blog.get_blog_by_id(id, with_author, session=session),
+            with_author,
+        )
+
+    key = row_key("blog", id)
     try:
+        if with_author:
+            return await cached(
+                f"{key}:author", read, tags=(key, BLOG_AUTHORS)
+            )
+        return await cached(key, read)
+    except Exception as e:
+        raise e
+
+
+async def get_blogs_by_ids(
+    batch: BlogBatchGet, session: Optional[AsyncSession] = None
+) -> BlogBatchOut:
+    """
+    Get blogs by ids, from the response cache when possible and otherwise
+    in one query
+
+    Args:
+        batch (BlogBatchGet): BlogBatchGet object
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        BlogBatchOut: the blogs in request order, None for the ids not
+            found
+    """
+
+    async def read(ids: list[str]) -> list[BlogOut]:
         return [
-            BlogOut(**b.model_dump())
-            for b in blog.get_blogs_by_user_id(user_id)
+            from_row(BlogOut, b)
+            for b in await blog.get_blogs_by_ids(ids, session=session)
         ]
+
+    try:
+        return BlogBatchOut(items=await cached_rows("blog", batch.ids, read))
+    except Exception as e:
+        raise e
+
+
+async def get_blogs_by_user_id(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    view: BlogView = "full",
+    with_author: bool = False,
+    session: Optional[AsyncSession] = None,
+) -> BlogListPage:
+    """
+    Get a page of blogs by user id
+
+    Args:
+        user_id (str): id of the user
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of blogs in the page
+        view (BlogView): full blogs, or summaries read without the content
+        with_author (bool): whether to embed the author, read in the same
+            query
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        BlogListPage: the page in the view
+    """
+    try:
+        blogs, next_cursor = await blog.get_blogs_by_user_id(
+            user_id,
+            cursor,
+            limit,
+            VIEWS[view, with_author][2],
+            with_author,
+            session=session,
+        )
+        return _page(view, with_author, blogs, next_cursor)
     except Exception as e:
         raise e
 
 
-def get_all_blogs() -> list[BlogOut]:
+async def search_blogs(
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session: Optional[AsyncSession] = None,
+) -> BlogSearchPage:
     """
-    Get all blogs
+    Search the blogs, best match first
+
+    Args:
+        query (str): words to search
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of blogs in the page
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
-        List[BlogOut]: List of BlogOut objects
+        BlogSearchPage: BlogSearchPage object
     """
     try:
-        return [BlogOut(**b.model_dump()) for b in blog.get_all_blogs()]
+        hits, next_cursor = await blog.search_blogs(
+            query, cursor, limit, session=session
+        )
+        return BlogSearchPage(
+            items=[
+                from_row(BlogSearchHit, b, snippet=snippet)
+                for b, snippet in hits
+            ],
+            next_cursor=next_cursor,
+        )
     except Exception as e:
         raise e
 
 
-def update_blog(updated_blog: BlogUpdate) -> BlogOut:
+async def get_all_blogs(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    view: BlogView = "full",
+    with_author: bool = False,
+    session: Optional[AsyncSession] = None,
+) -> BlogListPage:
+    """
+    Get a page of blogs, from the response cache when possible
+
+    Args:
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of blogs in the page
+        view (BlogView): full blogs, or summaries read without the content
+        with_author (bool): whether to embed the authors, read in the same
+            query
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        BlogListPage: the page in the view
+    """
+
+    async def read() -> BlogListPage:
+        blogs, next_cursor = await blog.get_all_blogs(
+            cursor,
+            limit,
+            VIEWS[view, with_author][2],
+            with_author,
+            session=session,
+        )
+        return _page(view, with_author, blogs, next_cursor)
+
+    try:
+        return await cached(
+            f"{BLOG_PAGES}:{view}:{with_author}:{cursor}:{limit}",
+            read,
+            tags=(BLOG_PAGES, BLOG_AUTHORS) if with_author else (BLOG_PAGES,),
+        )
+    except Exception as e:
+        raise e
+
+
+async def export_blogs(
+    format: Literal["ndjson", "json"] = "ndjson",
+) -> AsyncIterator[bytes]:
+    """
+    Export all blogs
+
+    Args:
+        format (Literal["ndjson", "json"]): one JSON object per line, or a
+            single JSON array
+
+    Yields:
+        bytes: chunks of the serialized blogs
+    """
+    if format == "ndjson":
+        async for b in blog.stream_blogs():
+            yield _to_json(b) + b"\n"
+        return
+    separator = b"["
+    async for b in blog.stream_blogs():
+        yield separator + _to_json(b)
+        separator = b","
+    yield b"]" if separator == b"," else b"[]"
+
+
+async def update_blog(
+    updated_blog: BlogUpdate,
+    versions: Optional[list[int]] = None,
+    session: Optional[AsyncSession] = None,
+) -> BlogOut:
     """
     Update a blog
 
     Args:
         blog (BlogUpdate): BlogUpdate object
+        versions (Optional[list[int]]): versions the update is based on,
+            None to update whatever the version
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         BlogInDB: BlogInDB object
     """
     try:
-        return BlogOut(**blog.update_blog(updated_blog).model_dump())
+        u_blog = from_row(
+            BlogOut,
+            await blog.update_blog(updated_blog, versions, session=session),
+        )
+        invalidate(session, row_key("blog", u_blog.id), BLOG_PAGES)
+        return u_blog
     except Exception as e:
         raise e
 
 
-def delete_blog(id: str) -> None:
+async def delete_blog(id: str, session: Optional[AsyncSession] = None) -> None:
     """
     Delete a blog
 
     Args:
         id (str): id of the blog
+        session (Optional[AsyncSession]): session of the unit of work
     """
     try:
-        delete_blog = blog.get_blog_by_id(id)
-        blog.delete_blog(BlogInDB(**delete_blog.model_dump()))
+        delete_blog = await blog.get_blog_by_id(id, session=session)
+        await blog.delete_blog(
+            from_row(BlogInDB, delete_blog), session=session
+        )
+        invalidate(session, row_key("blog", delete_blog.id), BLOG_PAGES)
     except Exception as e:
         raise e
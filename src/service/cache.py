@@ -0,0 +1,367 @@
+"""
+Response cache
+
+This module contains the cache of the responses of the read services.
+
+Reads of single blogs, blog pages and single users are served from the
+cache and only go to the database on a miss. Batch reads of single rows
+share the entries of the single reads and read all their misses in one
+query. Every entry carries tags, its own key among them, and the write
+services drop exactly the tags their write affects, once when they write
+and again when the transaction ends. A read that misses only caches its
+response when none of the response's tags was dropped while it was reading,
+since it may have read the rows before the write committed. Only found rows
+are cached, so creating a row never has a stale miss to drop.
+Entries also expire after a TTL, which bounds the staleness left by writes
+that bypass the services, e.g. another process or a direct SQL import.
+
+The cache is pluggable: ``set_response_cache`` installs any
+``ResponseCache``, by default an in-process ``LRUResponseCache``.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional, Sequence, TypeVar
+
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import Config
+from data.ids import id_from_blob, id_to_blob
+from data.invalidation import InvalidationLog
+from model.cache import ResponseCacheStats
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class ResponseCache(ABC):
+    """
+    Interface of a response cache
+
+    Values are treated as immutable: they are returned as stored, and the
+    callers must not modify them. A subclass missing any of the methods
+    cannot be instantiated, so it cannot be installed.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[BaseModel]:
+        """
+        Get a cached response
+
+        Args:
+            key (str): key of the response
+
+        Returns:
+            Optional[BaseModel]: the response, or None on a miss
+        """
+
+    @abstractmethod
+    def set(
+        self, key: str, value: BaseModel, tags: Iterable[str] = ()
+    ) -> None:
+        """
+        Cache a response
+
+        Args:
+            key (str): key of the response
+            value (BaseModel): the response
+            tags (Iterable[str]): tags invalidating the response besides
+                its key
+        """
+
+    @abstractmethod
+    def invalidate(self, *tags: str) -> None:
+        """
+        Drop the responses with any of the given keys or tags
+
+        Args:
+            tags (str): keys and tags of the responses
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Drop every response and reset the counters
+        """
+
+    @abstractmethod
+    def stats(self) -> ResponseCacheStats:
+        """
+        Get the cache counters
+
+        Returns:
+            ResponseCacheStats: ResponseCacheStats object
+        """
+
+
+class LRUResponseCache(ResponseCache):
+    """
+    In-process response cache bounded in bytes, least recently used first
+    out, with a time to live
+
+    The size of a response is the length of its JSON, which is what the
+    response costs to keep around once serialized.
+
+    Attributes:
+        max_bytes (int): maximum total size of the cached responses
+        ttl (float): seconds a response stays cached
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        """
+        Constructor
+
+        Args:
+            max_bytes (int): maximum total size of the cached responses
+            ttl (float): seconds a response stays cached
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (response, size, expiry, tags)
+        self._entries: OrderedDict[
+            str, tuple[BaseModel, int, float, tuple[str, ...]]
+        ] = OrderedDict()
+        self._keys_by_tag: dict[str, set[str]] = {}
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = self._expirations = 0
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        """
+        Get a cached response, refreshing its recency
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        if entry[2] <= time.monotonic():
+            self._drop(key)
+            self._expirations += 1
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[0]
+
+    def set(
+        self, key: str, value: BaseModel, tags: Iterable[str] = ()
+    ) -> None:
+        """
+        Cache a response, evicting the least recently used ones to fit
+        """
+        size = len(value.model_dump_json())
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        tags = (key, *tags)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl, tags)
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self._evictions += 1
+
+    def invalidate(self, *tags: str) -> None:
+        """
+        Drop the responses with any of the given keys or tags
+        """
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._drop(key)
+
+    def clear(self) -> None:
+        """
+        Drop every response and reset the counters
+        """
+        self._entries.clear()
+        self._keys_by_tag.clear()
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = self._expirations = 0
+
+    def stats(self) -> ResponseCacheStats:
+        """
+        Get the cache counters
+        """
+        lookups = self._hits + self._misses
+        return ResponseCacheStats(
+            entries=len(self._entries),
+            bytes=self._bytes,
+            max_bytes=self.max_bytes,
+            hits=self._hits,
+            misses=self._misses,
+            hit_ratio=self._hits / lookups if lookups else 0.0,
+            evictions=self._evictions,
+            expirations=self._expirations,
+        )
+
+    def _drop(self, key: str) -> None:
+        """
+        Drop a response if it is cached
+
+        Args:
+            key (str): key of the response
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        for tag in entry[3]:
+            keys = self._keys_by_tag[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tag[tag]
+
+
+_response_cache: Optional[ResponseCache] = None
+_invalidations = InvalidationLog()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the response cache, creating the default one on first use
+
+    Returns:
+        ResponseCache: ResponseCache object
+    """
+    global _response_cache
+    if _response_cache is None:
+        config = Config()
+        _response_cache = LRUResponseCache(
+            config.get_response_cache_bytes(), config.get_response_cache_ttl()
+        )
+    return _response_cache
+
+
+def set_response_cache(cache: ResponseCache) -> None:
+    """
+    Install a response cache
+
+    Args:
+        cache (ResponseCache): ResponseCache object
+    """
+    global _response_cache
+    _response_cache = cache
+
+
+def row_key(kind: str, id: str) -> str:
+    """
+    Get the key of the response of a single row
+
+    The id is canonicalized, so every spelling of a UUID shares the entry
+    that the writes of the row invalidate.
+
+    Args:
+        kind (str): kind of row, e.g. ``blog``
+        id (str): id of the row
+
+    Returns:
+        str: key of the response
+    """
+    return f"{kind}:{id_from_blob(id_to_blob(id))}"
+
+
+async def cached(
+    key: str,
+    read: Callable[[], Awaitable[T]],
+    tags: Iterable[str] = (),
+) -> T:
+    """
+    Get a response from the cache, or read and cache it on a miss
+
+    Args:
+        key (str): key of the response
+        read (Callable[[], Awaitable[T]]): reads the response
+        tags (Iterable[str]): tags invalidating the response besides its
+            key
+
+    Returns:
+        T: the response
+    """
+    cache = get_response_cache()
+    value = cache.get(key)
+    if value is None:
+        with _invalidations.read() as since:
+            value = await read()
+            if not _invalidations.invalidated_since(since, key, *tags):
+                cache.set(key, value, tags)
+    return value
+
+
+async def cached_rows(
+    kind: str,
+    ids: Sequence[str],
+    read: Callable[[list[str]], Awaitable[Iterable[T]]],
+    tags: Iterable[str] = (),
+) -> list[Optional[T]]:
+    """
+    Get the responses of single rows from the cache, reading every miss at
+    once
+
+    Args:
+        kind (str): kind of row, e.g. ``blog``
+        ids (Sequence[str]): ids of the rows, possibly repeated
+        read (Callable[[list[str]], Awaitable[Iterable[T]]]): reads the
+            responses, with an ``id``, of the rows found among the given
+            ids
+        tags (Iterable[str]): tags invalidating the responses besides
+            their keys
+
+    Returns:
+        list[Optional[T]]: the responses in the order of ``ids``, None for
+            the rows not found
+    """
+    cache = get_response_cache()
+    keys = [row_key(kind, id) for id in ids]
+    found = {key: cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [id for id, key in zip(ids, keys) if found[key] is None]
+    if missing:
+        with _invalidations.read() as since:
+            for value in await read(list(dict.fromkeys(missing))):
+                key = row_key(kind, value.id)
+                found[key] = value
+                if not _invalidations.invalidated_since(since, key, *tags):
+                    cache.set(key, value, tags)
+    return [found[key] for key in keys]
+
+
+def _invalidate(*tags: str) -> None:
+    """
+    Drop responses from the cache and keep the reads in flight from caching
+    the responses they read before
+
+    Args:
+        tags (str): keys and tags of the responses
+    """
+    _invalidations.invalidate(*tags)
+    get_response_cache().invalidate(*tags)
+
+
+def invalidate(session: Optional[AsyncSession], *tags: str) -> None:
+    """
+    Drop responses from the cache now and when the transaction ends
+
+    Args:
+        session (Optional[AsyncSession]): session of the write, None when
+            the write was committed in its own unit of work
+        tags (str): keys and tags of the responses
+    """
+    _invalidate(*tags)
+    if session is not None:
+        session.info.setdefault("response_cache_tags", set()).update(tags)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_on_transaction_end(session: Session) -> None:
+    """
+    Drop the responses written in a transaction once it is over
+
+    Args:
+        session (Session): session whose transaction ended
+    """
+    tags = session.info.pop("response_cache_tags", ())
+    if tags:
+        _invalidate(*tags)
@@ -4,215 +4,417 @@ User service
 This module contains functions to interact with the user data
 """
 
-from model.user import UserInDB, UserCreate, UserUpdate, UserOut
+import time
+from typing import AsyncIterable, Optional
+from model.user import (
+    UserBatchGet,
+    UserBatchOut,
+    UserInDB,
+    UserCreate,
+    UserImportResult,
+    UserUpdate,
+    UserOut,
+    UserPage,
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
 from data import user
+from model import from_row
+from config import Config
+from data.hashing import HashingExecutor, get_import_hasher
+from data.pagination import DEFAULT_PAGE_SIZE
+from errors.errors import Busy
 from data import user_role
 from model.user_role import UserRoleCreate, UserRoleInDB, UserRoleUpdate
+from service.blog import BLOG_AUTHORS
+from service.cache import cached, cached_rows, invalidate, row_key
 
+IMPORT_BATCH_SIZE = 1000
+# Number of imports running in the process
+_imports_running = 0
+# Tag of every cached user, whose role name a role write can change
+USERS = "users"
 
-def create_user(new_user: UserCreate) -> UserOut:
+
+async def create_user(
+    new_user: UserCreate, session: Optional[AsyncSession] = None
+) -> UserOut:
     """
     Create a new user
 
     Args:
         new_user (UserCreate): UserCreate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
     try:
-        n_user = user.create_user(new_user)
-        return UserOut(
-            **n_user.model_dump(), role=user.get_role_by_user_id(n_user.id)
+        n_user = await user.create_user(new_user, session=session)
+        role = await user_role.get_user_role_by_id(
+            n_user.role_id, session=session
         )
+        return from_row(UserOut, n_user, role=role.name)
     except Exception as e:
         raise e
 
 
-def get_user_by_id(id: str) -> UserOut:
+async def import_users(
+    records: AsyncIterable[UserCreate],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    hasher: Optional[HashingExecutor] = None,
+) -> UserImportResult:
     """
-    Get a user by id
+    Import a stream of users
+
+    The records are consumed ``batch_size`` at a time and each batch is
+    created in its own transaction, so memory use does not depend on the
+    size of the import and a failure keeps the batches already imported.
+    Passwords are hashed on the process wide import pool. Each import keeps
+    at most its share of the workers and queue of the pool in flight, so a
+    batch of any size waits for the pool instead of overflowing its queue,
+    and an import beyond ``MAX_IMPORTS`` is rejected before it reads any
+    record.
+
+    Args:
+        records (AsyncIterable[UserCreate]): users to import
+        batch_size (int): number of users per transaction
+        hasher (Optional[HashingExecutor]): executor hashing the passwords,
+            the process wide import pool by default
+
+    Returns:
+        UserImportResult: UserImportResult object
+
+    Raises:
+        Busy: if ``MAX_IMPORTS`` imports are already running
+    """
+    global _imports_running
+    max_imports = Config().get_max_imports()
+    if _imports_running >= max_imports:
+        raise Busy(msg="Too many imports are running, retry later")
+    _imports_running += 1
+    hasher = hasher or get_import_hasher()
+    max_in_flight = max(
+        (hasher.max_workers + hasher.max_queue) // max_imports, 1
+    )
+    created = skipped = 0
+    start = time.perf_counter()
+
+    async def flush(batch: list[UserCreate]):
+        nonlocal created, skipped
+        imported = await user.import_users(
+            batch, hasher, max_in_flight=max_in_flight
+        )
+        created += imported
+        skipped += len(batch) - imported
+
+    try:
+        batch = []
+        async for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+    except Exception as e:
+        raise e
+    finally:
+        _imports_running -= 1
+    seconds = time.perf_counter() - start
+    return UserImportResult(
+        created=created,
+        skipped=skipped,
+        seconds=seconds,
+        users_per_second=(created + skipped) / seconds if seconds else 0.0,
+    )
+
+
+async def get_user_by_id(
+    id: str, session: Optional[AsyncSession] = None
+) -> UserOut:
+    """
+    Get a user by id, from the response cache when possible
 
     Args:
         id (str): id of the user
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
+
+    async def read() -> UserOut:
+        return from_row(
+            UserOut, await user.get_user_with_role_by_id(id, session=session)
+        )
+
     try:
-        n_user = user.get_user_by_id(id)
-        return UserOut(
-            **n_user.model_dump(), role=user.get_role_by_user_id(n_user.id)
+        return await cached(row_key("user", id), read, tags=(USERS,))
+    except Exception as e:
+        raise e
+
+
+async def get_users_by_ids(
+    batch: UserBatchGet, session: Optional[AsyncSession] = None
+) -> UserBatchOut:
+    """
+    Get users by ids, from the response cache when possible and otherwise
+    in one query
+
+    Args:
+        batch (UserBatchGet): UserBatchGet object
+        session (Optional[AsyncSession]): session of the unit of work
+
+    Returns:
+        UserBatchOut: the users in request order, None for the ids not
+            found
+    """
+
+    async def read(ids: list[str]) -> list[UserOut]:
+        return [
+            from_row(UserOut, u)
+            for u in await user.get_users_with_role_by_ids(
+                ids, session=session
+            )
+        ]
+
+    try:
+        return UserBatchOut(
+            items=await cached_rows("user", batch.ids, read, tags=(USERS,))
         )
     except Exception as e:
         raise e
 
 
-def get_user_by_username(username: str) -> UserOut:
+async def get_user_by_username(
+    username: str, session: Optional[AsyncSession] = None
+) -> UserOut:
     """
     Get a user by username
 
     Args:
         username (str): username of the user
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
     try:
-        n_user = user.get_user_by_username(username)
-        return UserOut(
-            **n_user.model_dump(), role=user.get_role_by_user_id(n_user.id)
+        return from_row(
+            UserOut,
+            await user.get_user_with_role_by_username(
+                username, session=session
+            ),
         )
     except Exception as e:
         raise e
 
 
-def get_all_users() -> list[UserOut]:
+async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session: Optional[AsyncSession] = None,
+) -> UserPage:
     """
-    Get all users
+    Get a page of users
+
+    Args:
+        cursor (Optional[str]): cursor returned with the previous page
+        limit (int): maximum number of users in the page
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
-        List[UserInDB]: List of UserInDB objects
+        UserPage: UserPage object
     """
     try:
-        return [
-            UserOut(**u.model_dump(), role=user.get_role_by_user_id(u.id))
-            for u in user.get_all_users()
-        ]
+        users, next_cursor = await user.get_all_users_with_role(
+            cursor, limit, session=session
+        )
+        return UserPage(
+            items=[from_row(UserOut, u) for u in users],
+            next_cursor=next_cursor,
+        )
     except Exception as e:
         raise e
 
 
-def update_user(updated_user: UserUpdate) -> UserOut:
+async def update_user(
+    updated_user: UserUpdate, session: Optional[AsyncSession] = None
+) -> UserOut:
     """
     Update a user
 
     Args:
         user (UserUpdate): UserUpdate object
+        session (Optional[AsyncSession]): session of the unit of work
 
     Returns:
         UserInDB: UserInDB object
     """
     try:
-        u_user = user.update_user(updated_user)
-        return UserOut(
-            **u_user.model_dump(), role=user.get_role_by_user_id(u_user.id)
+        u_user = await user.update_user(updated_user, session=session)
+        invalidate(session, row_key("user", u_user.id), BLOG_AUTHORS)
+        role = await user_role.get_user_role_by_id(
+            u_user.role_id, session=session
         )
+        return from_row(UserOut, u_user, role=role.name)
     except Exception as e:
         raise e
 
 
-def delete_user(deleted_user_id: str):
+async def delete_user(
+    deleted_user_id: str, session: Optional[AsyncSession] = None
+):
     """
     Delete a user
 
     Args:
         deleted_user (UserInDB): UserInDB object
+        session (Optional[AsyncSession]): session of the unit of work
     """
     try:
-        deleted_user = user.get_user_by_id(deleted_user_id)
-        user.delete_user(
+        deleted_user = await user.get_user_by_id(
+            deleted_user_id, session=session
+        )
+        await user.delete_user(
             UserInDB(
                 **deleted_user.model_dump(exclude={"role_id"}),
-                role_id=deleted_user.role_id
-            )
+                role_id=deleted_user.role_id,
+            ),
+            session=session,
         )
+        invalidate(session, row_key("user", deleted_user.id), BLOG_AUTHORS)
     except Exception as e:
         raise e
 
 
-def user_role_update(user_id: str, role_name: str):
+async def user_role_update(
+    user_id: str, role_name: str, session: Optional[AsyncSession] = None
+):
     """
     Update user role
 
     Args:
         user_id (str): User id
         role_id (str): Role id
+        session (Optional[AsyncSession]): session of the unit of work
     """
     try:
-        role_id = user_role.get_user_role_by_name(role_name).id
-        user.user_role_update(user_id, role_name)
+        role_id = (
+            await user_role.get_user_role_by_name(role_name, session=session)
+        ).id
+        n_user = await user.user_role_update(
+            user_id, role_name, session=session
+        )
+        invalidate(session, row_key("user", n_user.id), BLOG_AUTHORS)
         return True
     except Exception as e:
         raise e
 
 
-def create_user_role(role: UserRoleCreate) -> UserRoleInDB:
+async def create_user_role(
+    role: UserRoleCreate, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Create a new user role
     Args:
         user_role (UserRoleCreate): UserRoleCreate object
+        session (Optional[AsyncSession]): session of the unit of work
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     try:
-        return user_role.create_user_role(role)
+        return await user_role.create_user_role(role, session=session)
     except Exception as e:
         raise e
 
 
-def get_user_role_by_id(role_id: str) -> UserRoleInDB:
+async def get_user_role_by_id(
+    role_id: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Get a user role by id
     Args:
         role_id (str): id of the user role
+        session (Optional[AsyncSession]): session of the unit of work
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     try:
-        return user_role.get_user_role_by_id(role_id)
+        return await user_role.get_user_role_by_id(role_id, session=session)
     except Exception as e:
         raise e
 
 
-def get_user_role_by_name(name: str) -> UserRoleInDB:
+async def get_user_role_by_name(
+    name: str, session: Optional[AsyncSession] = None
+) -> UserRoleInDB:
     """
     Get a user role by name
     Args:
         name: str - name of the user role
+        session (Optional[AsyncSession]): session of the unit of work
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     try:
-        return user_role.get_user_role_by_name(name)
+        return await user_role.get_user_role_by_name(name, session=session)
     except Exception as e:
         raise e
 
 
-def get_all_user_roles() -> list[UserRoleInDB]:
+async def get_all_user_roles(
+    session: Optional[AsyncSession] = None,
+) -> list[UserRoleInDB]:
     """
     Get all user roles
+    Args:
+        session (Optional[AsyncSession]): session of the unit of work
+
     Returns:
         list[UserRoleInDB]: List of UserRoleInDB objects
     """
     try:
-        return user_role.get_all_user_roles()
+        return await user_role.get_all_user_roles(session=session)
     except Exception as e:
         raise e
 
 
-def update_user_role(user_role_id: str, role: UserRoleUpdate) -> UserRoleInDB:
+async def update_user_role(
+    user_role_id: str,
+    role: UserRoleUpdate,
+    session: Optional[AsyncSession] = None,
+) -> UserRoleInDB:
     """
     Update a user role
     Args:
         user_role_id (str): id of the user role
         role (UserRoleUpdate): UserRoleUpdate object
+        session (Optional[AsyncSession]): session of the unit of work
     Returns:
         UserRoleInDB: UserRoleInDB object
     """
     try:
-        return user_role.update_user_role(user_role_id, role)
+        u_role = await user_role.update_user_role(
+            user_role_id, role, session=session
+        )
+        invalidate(session, USERS, BLOG_AUTHORS)
+        return u_role
     except Exception as e:
         raise e
 
 
-def delete_user_role(user_role_id: str):
+async def delete_user_role(
+    user_role_id: str, session: Optional[AsyncSession] = None
+):
     """
     Delete a user role
     Args:
         user_role_id (str): id of the user role
+        session (Optional[AsyncSession]): session of the unit of work
     """
     try:
-        user_role.delete_user_role(user_role_id)
+        await user_role.delete_user_role(user_role_id, session=session)
+        invalidate(session, USERS, BLOG_AUTHORS)
     except Exception as e:
         raise e
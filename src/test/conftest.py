@@ -0,0 +1,129 @@
+"""
+Shared test configuration
+
+This module contains the fixtures shared by all the test modules.
+"""
+
+from uuid import uuid4
+
+from pytest import fixture
+from sqlalchemy import event
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+@fixture(scope="session", autouse=True)
+def database():
+    """
+    Set up the test database once for the whole test session, and close
+    its connections at the end so a write-ahead log is checkpointed into
+    the database file and removed
+    """
+    from data import engine, init_db, run_sync
+
+    run_sync(init_db())
+    yield
+    run_sync(engine.dispose())
+
+
+@fixture
+def anyio_backend() -> str:
+    """
+    Run the async tests on asyncio only, the async database driver
+    (aiosqlite) does not support trio
+
+    Returns:
+        str: anyio backend name
+    """
+    return "asyncio"
+
+
+def unique_name(name: str) -> str:
+    """
+    Make a generated name unique, so tests creating usernames or role names
+    never collide: the test database is set up once per session and its
+    rows are shared by every test
+
+    Args:
+        name (str): generated name, e.g. ``faker.user_name()``
+
+    Returns:
+        str: the name with a random suffix
+    """
+    return f"{name}-{uuid4().hex[:12]}"
+
+
+class QueryCounter:
+    """
+    Counts the connection checkouts and SQL statements of the engine
+
+    Attributes:
+        checkouts (int): number of connections checked out of the pool
+        statements (int): number of SQL statements executed
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Reset the counters
+        """
+        self.checkouts = 0
+        self.statements = 0
+
+    def on_checkout(self, *args) -> None:
+        """
+        Pool checkout event listener
+        """
+        self.checkouts += 1
+
+    def on_execute(self, *args) -> None:
+        """
+        Statement execution event listener
+        """
+        self.statements += 1
+
+
+@fixture
+def query_counter():
+    """
+    Count the checkouts and statements issued while the test runs
+
+    Yields:
+        QueryCounter: QueryCounter object
+    """
+    from data import engine
+
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "checkout", counter.on_checkout)
+    event.listen(
+        engine.sync_engine, "before_cursor_execute", counter.on_execute
+    )
+    yield counter
+    event.remove(engine.sync_engine, "checkout", counter.on_checkout)
+    event.remove(
+        engine.sync_engine, "before_cursor_execute", counter.on_execute
+    )
+
+
+async def query_plan(session: AsyncSession, statement) -> str:
+    """
+    Get the SQLite query plan of a statement
+
+    Args:
+        session (AsyncSession): session to run EXPLAIN QUERY PLAN on
+        statement (Executable): statement to explain
+
+    Returns:
+        str: the plan, one step per line
+    """
+    connection = await session.connection()
+    compiled = statement.compile(connection.sync_connection)
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    rows = await connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {compiled}", params
+    )
+    return "\n".join(row[3] for row in rows)
@@ -4,31 +4,38 @@ Unit tests for blog data
 This file contains the unit tests for the blog data.
 """
 
-from pytest import fixture, raises
+from pytest import fixture, mark, raises
 import os
 from faker import Faker
 
-from errors.errors import Duplicate, Missing
+from errors.errors import InvalidCursor, Missing, PreconditionFailed
 
 os.environ["ENV"] = "test"
-from data import blog, user
-from model.blog import BlogInDB, BlogCreate, BlogUpdate
+from data import blog, unit_of_work, user, utcnow
+from model.blog import (
+    EXCERPT_LENGTH,
+    BlogCreate,
+    BlogUpdate,
+    excerpt,
+)
 from model.user import UserInDB, UserCreate
+from conftest import QueryCounter, query_plan, unique_name
+from data.pagination import encode_cursor
 
 faker = Faker()
 
 
 @fixture
-def this_user() -> UserInDB:
+async def this_user() -> UserInDB:
     """
     Create a user
 
     Returns:
         UserInDB: UserInDB object
     """
-    return user.create_user(
+    return await user.create_user(
         UserCreate(
-            username=faker.user_name(),
+            username=unique_name(faker.user_name()),
             password=faker.password(),
         )
     )
@@ -65,82 +72,332 @@ def updated_blog() -> BlogUpdate:
     )
 
 
-def test_create_blog(new_blog: BlogCreate):
+@mark.anyio
+async def test_create_blog(new_blog: BlogCreate):
     """
     Test create blog
 
     Args:
         new_blog (BlogCreate): BlogCreate object
     """
-    created_blog = blog.create_blog(new_blog)
+    created_blog = await blog.create_blog(new_blog)
     assert created_blog.title == new_blog.title
     assert created_blog.content == new_blog.content
     assert created_blog.user_id == new_blog.user_id
 
 
-def test_get_blog_by_id(new_blog: BlogCreate):
+@mark.anyio
+async def test_create_blogs(this_user: UserInDB, query_counter: QueryCounter):
+    """
+    Test create blogs inserts one chunk per statement, in order
+
+    Args:
+        this_user (UserInDB): UserInDB object
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    new_blogs = [
+        BlogCreate(
+            user_id=this_user.id, title=f"Bulk {i}", content=faker.text()
+        )
+        for i in range(5)
+    ]
+    query_counter.reset()
+    ids = await blog.create_blogs(new_blogs, chunk_size=2)
+    assert query_counter.statements == 3
+    assert len(set(ids)) == 5
+    for id, new_blog in zip(ids, new_blogs):
+        created_blog = await blog.get_blog_by_id(id)
+        assert created_blog.title == new_blog.title
+        assert created_blog.user_id == this_user.id
+
+
+@mark.anyio
+async def test_get_blog_by_id(new_blog: BlogCreate):
     """
     Test get blog by id
 
     Args:
         new_blog (BlogCreate): BlogCreate object
     """
-    created_blog = blog.create_blog(new_blog)
-    blog_by_id = blog.get_blog_by_id(created_blog.id)
+    created_blog = await blog.create_blog(new_blog)
+    blog_by_id = await blog.get_blog_by_id(created_blog.id)
     assert blog_by_id.title == new_blog.title
     assert blog_by_id.content == new_blog.content
     assert blog_by_id.user_id == new_blog.user_id
 
 
-def test_get_blog_by_id_missing():
+@mark.anyio
+async def test_get_blog_by_id_missing():
     """
     Test get blog by id missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        blog.get_blog_by_id(id)
+        await blog.get_blog_by_id(id)
     assert exc_info.value.msg == f"Blog with id {id!r} not found"
 
 
-def test_get_blogs_by_user_id(new_blog: BlogCreate):
+@mark.anyio
+async def test_get_blogs_by_user_id(new_blog: BlogCreate):
     """
     Test get blogs by user id
 
     Args:
         new_blog (BlogCreate): BlogCreate object
     """
-    created_blog = blog.create_blog(new_blog)
-    blogs_by_user_id = blog.get_blogs_by_user_id(created_blog.user_id)
+    created_blog = await blog.create_blog(new_blog)
+    blogs_by_user_id, next_cursor = await blog.get_blogs_by_user_id(
+        created_blog.user_id
+    )
+    assert next_cursor is None
     assert len(blogs_by_user_id) == 1
     assert blogs_by_user_id[0].title == new_blog.title
     assert blogs_by_user_id[0].content == new_blog.content
     assert blogs_by_user_id[0].user_id == new_blog.user_id
 
 
-def test_get_blog_by_user_id_missing():
+@mark.anyio
+async def test_get_blogs_by_user_id_one_query(
+    this_user: UserInDB, query_counter: QueryCounter
+):
+    """
+    Test get blogs by user id pages newest first in one query per page,
+    also for a user without blogs
+
+    Args:
+        this_user (UserInDB): UserInDB object
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    query_counter.reset()
+    assert await blog.get_blogs_by_user_id(this_user.id) == ([], None)
+    assert query_counter.statements == 1
+    ids = []
+    for i in range(3):
+        ids.append(
+            (
+                await blog.create_blog(
+                    BlogCreate(
+                        user_id=this_user.id, title=f"Post {i}", content="..."
+                    )
+                )
+            ).id
+        )
+    query_counter.reset()
+    first, cursor = await blog.get_blogs_by_user_id(this_user.id, limit=2)
+    second, last_cursor = await blog.get_blogs_by_user_id(
+        this_user.id, cursor, limit=2
+    )
+    assert query_counter.statements == 2
+    assert [b.id for b in first + second] == ids[::-1]
+    assert last_cursor is None
+
+
+@mark.anyio
+async def test_get_blogs_by_user_id_plan():
+    """
+    Test the blogs of a user are read from the per-user index in order,
+    only the page itself is sorted after the join
+    """
+    statement = blog._blogs_by_user_statement(
+        "user-id", encode_cursor(utcnow(), "blog-id"), 10
+    )
+    async with unit_of_work() as session:
+        plan = await query_plan(session, statement)
+    assert (
+        "SEARCH blog USING INDEX ix_blog_user_id_time_created_id "
+        "(user_id=? AND (time_created,id)<(?,?))"
+    ) in plan
+    assert "SCAN blog" not in plan
+
+
+@mark.anyio
+async def test_get_blog_by_user_id_missing():
     """
     Test get blog by user id missing
     """
     with raises(Missing) as exc_info:
         user_id = str(faker.uuid4())
-        blog.get_blogs_by_user_id(user_id)
+        await blog.get_blogs_by_user_id(user_id)
     assert exc_info.value.msg == f"Blogs with user id {user_id!r} not found"
 
 
-def test_get_all_blogs(new_blog: BlogCreate):
+@mark.anyio
+async def test_get_all_blogs(new_blog: BlogCreate):
     """
     Test get all blogs
 
     Args:
         new_blog (BlogCreate): BlogCreate object
     """
-    created_blog = blog.create_blog(new_blog)
-    all_blogs = blog.get_all_blogs()
+    created_blog = await blog.create_blog(new_blog)
+    all_blogs, _ = await blog.get_all_blogs()
     assert len(all_blogs) >= 1
     assert any([b.title == new_blog.title for b in all_blogs])
 
 
-def test_update_blog(new_blog: BlogCreate, updated_blog: BlogUpdate):
+@mark.anyio
+async def test_get_all_blogs_paginated(new_blog: BlogCreate):
+    """
+    Test get all blogs page by page
+
+    Args:
+        new_blog (BlogCreate): BlogCreate object
+    """
+    created = [(await blog.create_blog(new_blog)).id for _ in range(3)]
+    first, cursor = await blog.get_all_blogs(limit=2)
+    assert len(first) == 2
+    assert cursor is not None
+    second, _ = await blog.get_all_blogs(cursor=cursor, limit=2)
+    assert [b.id for b in first + second][:3] == created[::-1]
+
+
+@mark.anyio
+async def test_get_blogs_summary_columns(this_user: UserInDB):
+    """
+    Test the blogs listed for summaries are read without their content
+
+    Args:
+        this_user (UserInDB): UserInDB object
+    """
+    content = " ".join(["word"] * 100)
+    created = await blog.create_blog(
+        BlogCreate(user_id=this_user.id, title="Summary", content=content)
+    )
+    statement = blog._blogs_by_user_statement(
+        this_user.id, None, 10, blog.SUMMARY_COLUMNS
+    )
+    assert "content" not in str(statement)
+    by_user, _ = await blog.get_blogs_by_user_id(
+        this_user.id, columns=blog.SUMMARY_COLUMNS
+    )
+    all_blogs, _ = await blog.get_all_blogs(
+        limit=1, columns=blog.SUMMARY_COLUMNS
+    )
+    for b in (by_user[0], all_blogs[0]):
+        assert b.id == created.id
+        assert "content" not in b.__dict__
+        assert b.excerpt == excerpt(content)
+        assert len(b.excerpt) == EXCERPT_LENGTH
+
+
+@mark.anyio
+async def test_get_blogs_with_author(
+    this_user: UserInDB, query_counter: QueryCounter
+):
+    """
+    Test blogs are read with their author and the author's role in one
+    query, single or by page
+
+    Args:
+        this_user (UserInDB): UserInDB object
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    created = await blog.create_blog(
+        BlogCreate(user_id=this_user.id, title="Authored", content="...")
+    )
+    query_counter.reset()
+    by_id = await blog.get_blog_by_id(created.id, with_author=True)
+    assert query_counter.statements == 1
+    query_counter.reset()
+    by_user, _ = await blog.get_blogs_by_user_id(
+        this_user.id, with_author=True
+    )
+    all_blogs, _ = await blog.get_all_blogs(
+        limit=1, columns=blog.SUMMARY_COLUMNS, with_author=True
+    )
+    assert query_counter.statements == 2
+    for b in (by_id, by_user[0], all_blogs[0]):
+        assert b.id == created.id
+        assert b.user.id == this_user.id
+        assert b.user.username == this_user.username
+        assert b.user.role.name == "user"
+        assert "password_hash" not in b.user.__dict__
+
+
+@mark.anyio
+async def test_get_all_blogs_invalid_cursor():
+    """
+    Test get all blogs with an invalid cursor
+    """
+    with raises(InvalidCursor):
+        await blog.get_all_blogs(cursor="not a cursor")
+
+
+@mark.anyio
+async def test_stream_blogs(new_blog: BlogCreate):
+    """
+    Test stream blogs
+
+    Args:
+        new_blog (BlogCreate): BlogCreate object
+    """
+    created_blog = await blog.create_blog(new_blog)
+    streamed = [b.id async for b in blog.stream_blogs(batch_size=2)]
+    assert len(streamed) == len(set(streamed))
+    assert created_blog.id in streamed
+
+
+@mark.anyio
+async def test_search_blogs(this_user: UserInDB):
+    """
+    Test search blogs ranks title matches first and pages the results
+
+    Args:
+        this_user (UserInDB): UserInDB object
+    """
+    word = faker.uuid4(cast_to=None).hex
+    in_content, in_title = await blog.create_blogs(
+        [
+            BlogCreate(
+                user_id=this_user.id, title="Content", content=f"a {word} b"
+            ),
+            BlogCreate(user_id=this_user.id, title=word, content="content"),
+        ]
+    )
+    first, cursor = await blog.search_blogs(word, limit=1)
+    second, last_cursor = await blog.search_blogs(word, cursor, limit=1)
+    assert [b.id for b, _ in first + second] == [in_title, in_content]
+    assert second[0][1] == f"a <b>{word}</b> b"
+    assert last_cursor is None
+
+
+@mark.anyio
+async def test_search_blogs_follows_writes(
+    new_blog: BlogCreate, updated_blog: BlogUpdate
+):
+    """
+    Test the search index follows blog updates and deletes
+
+    Args:
+        new_blog (BlogCreate): BlogCreate object
+        updated_blog (BlogUpdate): BlogUpdate object
+    """
+    word, new_word = (
+        faker.uuid4(cast_to=None).hex,
+        faker.uuid4(cast_to=None).hex,
+    )
+    new_blog.title = word
+    created_blog = await blog.create_blog(new_blog)
+    updated_blog.id = created_blog.id
+    updated_blog.title = new_word
+    await blog.update_blog(updated_blog)
+    assert await blog.search_blogs(word) == ([], None)
+    assert len((await blog.search_blogs(new_word))[0]) == 1
+    await blog.delete_blog(created_blog)
+    assert await blog.search_blogs(new_word) == ([], None)
+
+
+@mark.anyio
+async def test_search_blogs_syntax():
+    """
+    Test search text is matched as plain words, never as FTS5 syntax
+    """
+    assert await blog.search_blogs('"NEAR( AND *') == ([], None)
+    assert await blog.search_blogs("  ") == ([], None)
+
+
+@mark.anyio
+async def test_update_blog(new_blog: BlogCreate, updated_blog: BlogUpdate):
     """
     Test update blog
 
@@ -148,16 +405,68 @@ def test_update_blog(new_blog: BlogCreate, updated_blog: BlogUpdate):
         new_blog (BlogCreate): BlogCreate object
         updated_blog (BlogUpdate): BlogUpdate object
     """
-    created_blog = blog.create_blog(new_blog)
+    created_blog = await blog.create_blog(new_blog)
     updated_blog.id = created_blog.id
-    blog.update_blog(updated_blog)
-    blog_by_id = blog.get_blog_by_id(created_blog.id)
+    await blog.update_blog(updated_blog)
+    blog_by_id = await blog.get_blog_by_id(created_blog.id)
     assert blog_by_id.title == updated_blog.title
     assert blog_by_id.content == updated_blog.content
     assert blog_by_id.time_updated != created_blog.time_updated
 
 
-def test_update_blog_missing(updated_blog: BlogUpdate):
+@mark.anyio
+async def test_update_blog_single_statement(
+    new_blog: BlogCreate, query_counter: QueryCounter
+):
+    """
+    Test update blog is one UPDATE ... RETURNING statement
+
+    Args:
+        new_blog (BlogCreate): BlogCreate object
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    created_blog = await blog.create_blog(new_blog)
+    query_counter.reset()
+    updated = await blog.update_blog(
+        BlogUpdate(id=created_blog.id, title=faker.sentence(), content=None)
+    )
+    assert query_counter.statements == 1
+    assert updated.content == created_blog.content
+    assert updated.time_updated > created_blog.time_updated
+
+
+@mark.anyio
+async def test_update_blog_versions(
+    new_blog: BlogCreate, query_counter: QueryCounter
+):
+    """
+    Test a conditional update applies only to the versions it is based on
+
+    Args:
+        new_blog (BlogCreate): BlogCreate object
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    created_blog = await blog.create_blog(new_blog)
+    assert created_blog.version == 1
+    query_counter.reset()
+    updated = await blog.update_blog(
+        BlogUpdate(id=created_blog.id, title="First edit"), versions=[1]
+    )
+    assert query_counter.statements == 1
+    assert updated.version == 2
+    with raises(PreconditionFailed):
+        await blog.update_blog(
+            BlogUpdate(id=created_blog.id, title="Stale edit"), versions=[1]
+        )
+    assert (await blog.get_blog_by_id(created_blog.id)).title == "First edit"
+    with raises(Missing):
+        await blog.update_blog(
+            BlogUpdate(id=str(faker.uuid4()), title="Edit"), versions=[1]
+        )
+
+
+@mark.anyio
+async def test_update_blog_missing(updated_blog: BlogUpdate):
     """
     Test update blog missing
 
@@ -165,19 +474,20 @@ def test_update_blog_missing(updated_blog: BlogUpdate):
         updated_blog (BlogUpdate): BlogUpdate object
     """
     with raises(Missing) as exc_info:
-        blog.update_blog(updated_blog)
+        await blog.update_blog(updated_blog)
     assert exc_info.value.msg == f"Blog with id {updated_blog.id!r} not found"
 
 
-def test_delete_blog(new_blog: BlogCreate):
+@mark.anyio
+async def test_delete_blog(new_blog: BlogCreate):
     """
     Test delete blog
 
     Args:
         new_blog (BlogCreate): BlogCreate object
     """
-    created_blog = blog.create_blog(new_blog)
-    blog.delete_blog(created_blog)
+    created_blog = await blog.create_blog(new_blog)
+    await blog.delete_blog(created_blog)
     with raises(Missing) as exc_info:
-        blog.get_blog_by_id(created_blog.id)
+        await blog.get_blog_by_id(created_blog.id)
     assert exc_info.value.msg == f"Blog with id {created_blog.id!r} not found"
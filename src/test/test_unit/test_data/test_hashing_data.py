@@ -0,0 +1,68 @@
+"""
+Test hashing data
+
+This module contains the unit tests for the password hashing executor.
+"""
+
+import asyncio
+import os
+
+from bcrypt import checkpw
+from pytest import mark
+
+os.environ["ENV"] = "test"
+from data.hashing import HashingExecutor
+from errors.errors import Busy
+
+
+@mark.anyio
+async def test_hash():
+    """
+    Test hash returns a bcrypt hash of the password and counts it
+    """
+    hasher = HashingExecutor(max_workers=1, max_queue=1)
+    password_hash = await hasher.hash("password")
+    assert checkpw(b"password", password_hash.encode("utf-8"))
+    stats = hasher.stats()
+    assert stats["hashed"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["avg_hash_ms"] > 0
+    hasher.shutdown()
+
+
+@mark.anyio
+async def test_hash_does_not_block_event_loop():
+    """
+    Test the event loop keeps running while a password is hashed
+    """
+    hasher = HashingExecutor(max_workers=1, max_queue=0)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    await hasher.hash("password")
+    ticker.cancel()
+    assert ticks >= 5
+    hasher.shutdown()
+
+
+@mark.anyio
+async def test_hash_busy():
+    """
+    Test hashes beyond the workers and the queue are rejected
+    """
+    hasher = HashingExecutor(max_workers=1, max_queue=1)
+    results = await asyncio.gather(
+        *(hasher.hash("password") for _ in range(3)), return_exceptions=True
+    )
+    assert sum(isinstance(r, Busy) for r in results) == 1
+    stats = hasher.stats()
+    assert stats["hashed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["max_in_flight"] == 2
+    hasher.shutdown()
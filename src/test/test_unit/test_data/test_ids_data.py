@@ -0,0 +1,77 @@
+"""
+Test ids data
+
+This module contains the unit tests for the id generator.
+"""
+
+import os
+import uuid
+from datetime import timedelta
+
+from pytest import mark
+from sqlalchemy import text
+
+os.environ["ENV"] = "test"
+from data import unit_of_work, user, utcnow
+from data.ids import id_from_blob, id_time, id_to_blob, new_id, uuid7
+
+
+def test_uuid7():
+    """
+    Test uuid7 sets the version and variant bits and the current time
+    """
+    before = utcnow()
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before - timedelta(milliseconds=1) <= id_time(str(value))
+    assert id_time(str(value)) <= utcnow()
+
+
+def test_new_id_ordered():
+    """
+    Test ids sort, as strings, in the order they were generated
+    """
+    ids = [new_id() for _ in range(10000)]
+    assert sorted(ids) == ids
+    assert len(set(ids)) == len(ids)
+
+
+def test_id_time_legacy():
+    """
+    Test id_time of an id that is not a UUIDv7
+    """
+    assert id_time(str(uuid.uuid4())) is None
+    assert id_time("not a uuid") is None
+
+
+def test_id_blob():
+    """
+    Test ids are stored as 16 bytes that sort like the strings
+    """
+    ids = [str(uuid.uuid4()) for _ in range(1000)]
+    blobs = [id_to_blob(id) for id in ids]
+    assert all(len(blob) == 16 for blob in blobs)
+    assert [id_from_blob(blob) for blob in blobs] == ids
+    assert sorted(blobs) == [id_to_blob(id) for id in sorted(ids)]
+    assert id_to_blob("not a uuid") == "not a uuid"
+
+
+@mark.anyio
+async def test_id_blob_column():
+    """
+    Test the id columns hold blobs while the models hold strings
+    """
+    created = (await user.get_all_users(limit=1))[0][0]
+    async with unit_of_work() as session:
+        stored = (
+            await session.exec(
+                text(
+                    "SELECT typeof(id), length(id), typeof(role_id) "
+                    "FROM user WHERE id = :id"
+                ).bindparams(id=id_to_blob(created.id))
+            )
+        ).one()
+    assert tuple(stored) == ("blob", 16, "blob")
+    assert isinstance(created.id, str)
+    assert (await user.get_user_by_id(created.id.upper())).id == created.id
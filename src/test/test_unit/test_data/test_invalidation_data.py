@@ -0,0 +1,37 @@
+"""
+Test invalidation data
+
+This module contains the unit tests for the invalidation log.
+"""
+
+from data.invalidation import MAX_TRACKED_KEYS, InvalidationLog
+
+
+def test_invalidated_since():
+    """
+    Test only the invalidations after a read started are reported, per key
+    """
+    log = InvalidationLog()
+    log.invalidate("a")
+    with log.read() as since:
+        assert not log.invalidated_since(since, "a", "b")
+        log.invalidate("b")
+        assert log.invalidated_since(since, "a", "b")
+        assert not log.invalidated_since(since, "a", "c")
+        with log.read() as later:
+            assert not log.invalidated_since(later, "b")
+
+
+def test_forget():
+    """
+    Test the invalidations are forgotten once no read can be affected
+    """
+    log = InvalidationLog()
+    with log.read() as since:
+        for i in range(MAX_TRACKED_KEYS):
+            log.invalidate(str(i))
+        with log.read():
+            log.invalidate("last")
+        # The outer read still needs every invalidation since it started
+        assert log.invalidated_since(since, "0")
+    assert not log._latest
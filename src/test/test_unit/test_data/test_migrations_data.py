@@ -0,0 +1,150 @@
+"""
+Test migrations data
+
+This module contains the unit tests for the schema migrations.
+"""
+
+import os
+
+from pytest import fixture
+from sqlalchemy import Connection, create_engine, inspect
+
+os.environ["ENV"] = "test"
+from data.ids import id_from_blob
+from data.migrations import MIGRATIONS, migrate, schema_version
+
+ROLE_ID = "5a5d6f3e-8f0a-4c8e-9d6b-2f1c0e7a9b31"
+USER_ID = "0c9f4b52-1d7e-4a3b-8e55-6b2d9f0a4c17"
+
+LEGACY_SCHEMA = (
+    """
+    CREATE TABLE user_role (
+        id VARCHAR NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE user (
+        id VARCHAR NOT NULL,
+        username VARCHAR(100) NOT NULL,
+        password_hash VARCHAR NOT NULL,
+        role_id VARCHAR NOT NULL,
+        time_created DATETIME NOT NULL,
+        time_updated DATETIME NOT NULL,
+        PRIMARY KEY (id, username),
+        FOREIGN KEY(role_id) REFERENCES user_role (id)
+    )
+    """,
+    "CREATE UNIQUE INDEX ix_user_username ON user (username)",
+    f"INSERT INTO user_role VALUES ('{ROLE_ID}', 'user')",
+    f"""
+    INSERT INTO user VALUES (
+        '{USER_ID}', 'legacy', 'hash', '{ROLE_ID}',
+        '2024-01-01 00:00:00', '2024-01-01 00:00:00'
+    )
+    """,
+)
+
+
+@fixture
+def connection() -> Connection:
+    """
+    Open a connection to a new in-memory database
+
+    Yields:
+        Connection: Connection object
+    """
+    with create_engine("sqlite://").connect() as connection:
+        yield connection
+
+
+def test_migrate_new_database(connection: Connection):
+    """
+    Test a new database is created at the latest version
+
+    Args:
+        connection (Connection): Connection object
+    """
+    assert migrate(connection) == 0
+    assert schema_version(connection) == len(MIGRATIONS)
+    assert inspect(connection).get_pk_constraint("user")[
+        "constrained_columns"
+    ] == ["id"]
+
+
+def test_migrate_legacy_database(connection: Connection):
+    """
+    Test a database older than the migrations is rebuilt in place
+
+    Args:
+        connection (Connection): Connection object
+    """
+    for statement in LEGACY_SCHEMA:
+        connection.exec_driver_sql(statement)
+    assert migrate(connection) == len(MIGRATIONS)
+    assert schema_version(connection) == len(MIGRATIONS)
+    inspector = inspect(connection)
+    assert inspector.get_pk_constraint("user")["constrained_columns"] == ["id"]
+    assert {i["name"]: i["unique"] for i in inspector.get_indexes("user")} == {
+        "ix_user_username": 1,
+        "ix_user_time_created_id": 0,
+    }
+    assert inspector.has_table("blog")
+    rows = connection.exec_driver_sql(
+        "SELECT id, username, role_id FROM user"
+    ).all()
+    assert [
+        (id_from_blob(id), username, id_from_blob(role_id))
+        for id, username, role_id in rows
+    ] == [(USER_ID, "legacy", ROLE_ID)]
+    assert (
+        connection.exec_driver_sql(
+            "SELECT count(*) FROM user JOIN user_role ON role_id = user_role.id"
+        ).scalar()
+        == 1
+    )
+    assert migrate(connection) == 0
+
+
+def test_migrate_blog_version(connection: Connection):
+    """
+    Test existing blogs get the version column at version 1
+
+    Args:
+        connection (Connection): Connection object
+    """
+    migrate(connection)
+    for column in ("version", "excerpt"):
+        connection.exec_driver_sql(f"ALTER TABLE blog DROP COLUMN {column}")
+    connection.exec_driver_sql(
+        "INSERT INTO blog (id, user_id, title, content, time_created, "
+        "time_updated) VALUES (x'00', x'01', 'Title', 'Content', "
+        "'2024-01-01 00:00:00', '2024-01-01 00:00:00')"
+    )
+    connection.exec_driver_sql("PRAGMA user_version = 2")
+    assert migrate(connection) == len(MIGRATIONS) - 2
+    assert connection.exec_driver_sql("SELECT version FROM blog").all() == [
+        (1,)
+    ]
+
+
+def test_migrate_blog_excerpt(connection: Connection):
+    """
+    Test existing blogs get the excerpt column, filled from their content
+
+    Args:
+        connection (Connection): Connection object
+    """
+    migrate(connection)
+    connection.exec_driver_sql("ALTER TABLE blog DROP COLUMN excerpt")
+    connection.exec_driver_sql(
+        "INSERT INTO blog (id, user_id, title, content, time_created, "
+        "time_updated, version) VALUES (x'00', x'01', 'Title', "
+        "' Some\n content ', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1)"
+    )
+    connection.exec_driver_sql("PRAGMA user_version = 3")
+    assert migrate(connection) == len(MIGRATIONS) - 3
+    assert connection.exec_driver_sql("SELECT excerpt FROM blog").all() == [
+        ("Some content",)
+    ]
@@ -0,0 +1,102 @@
+"""
+Test storage data
+
+This module contains the unit tests for the storage profiles.
+"""
+
+from pathlib import Path
+from pytest import mark, raises
+from sqlalchemy.ext.asyncio import create_async_engine
+import os
+
+os.environ["ENV"] = "test"
+from config import Config
+from data import storage, unit_of_work
+
+
+async def pragmas(uri: str, profile: str) -> dict:
+    """
+    Read the storage pragmas of a connection of a new engine
+
+    Args:
+        uri (str): database URI
+        profile (str): name of the storage profile of the engine
+
+    Returns:
+        dict: pragma names and values as read back from SQLite
+    """
+    engine = create_async_engine(uri)
+    storage.install_storage_profile(engine, profile)
+    try:
+        async with engine.connect() as connection:
+            return {
+                name: (
+                    await connection.exec_driver_sql(f"PRAGMA {name}")
+                ).scalar()
+                for name in storage.STORAGE_PROFILES["production"]
+            }
+    finally:
+        await engine.dispose()
+
+
+@mark.anyio
+async def test_production_profile(tmp_path: Path):
+    """
+    Test the production profile is applied to the connections
+
+    Args:
+        tmp_path (Path): temporary directory
+    """
+    assert await pragmas(
+        f"sqlite+aiosqlite:///{tmp_path / 'production.db'}", "production"
+    ) == {
+        "busy_timeout": 5000,
+        "journal_mode": "wal",
+        # NORMAL and MEMORY
+        "synchronous": 1,
+        "temp_store": 2,
+        "mmap_size": 256 * 2**20,
+        "cache_size": -64 * 2**10,
+    }
+
+
+@mark.anyio
+async def test_default_profile(tmp_path: Path):
+    """
+    Test the default profile keeps the SQLite defaults
+
+    Args:
+        tmp_path (Path): temporary directory
+    """
+    values = await pragmas(
+        f"sqlite+aiosqlite:///{tmp_path / 'default.db'}", "default"
+    )
+    assert values["journal_mode"] == "delete"
+    # FULL
+    assert values["synchronous"] == 2
+    assert values["mmap_size"] == 0
+
+
+def test_unknown_profile():
+    """
+    Test an unknown profile is rejected
+    """
+    with raises(ValueError) as exc_info:
+        storage.get_storage_profile("fastest")
+    assert "production" in str(exc_info.value)
+
+
+@mark.anyio
+async def test_engine_profile():
+    """
+    Test the engine applies the storage profile of the config
+    """
+    expected = storage.get_storage_profile(Config().get_db_storage_profile())
+    async with unit_of_work() as session:
+        connection = await session.connection()
+        # Also set on an in-memory database, unlike journal_mode and mmap
+        for name in ("busy_timeout", "cache_size"):
+            if name in expected:
+                assert (
+                    await connection.exec_driver_sql(f"PRAGMA {name}")
+                ).scalar() == expected[name]
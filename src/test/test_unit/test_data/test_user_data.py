@@ -4,15 +4,25 @@ Test user data
 This module contains the unit tests for the user data module.
 """
 
-from pytest import fixture, raises
+from pytest import MonkeyPatch, fixture, mark, raises
 from faker import Faker
 from model.user import UserCreate, UserCreate, UserInDB, UserUpdate
-from model.user_role import UserRoleCreate, UserRoleInDB, UserRoleUpdate
+from model.user_role import UserRoleCreate, UserRoleUpdate
+import asyncio
+from types import SimpleNamespace
 import os
 from errors.errors import Duplicate, Missing
 
 os.environ["ENV"] = "test"
-from data import user
+from data import user, user_role
+from data.hashing import HashingExecutor
+from conftest import QueryCounter, query_plan, unique_name
+from data import unit_of_work
+from data.pagination import encode_cursor
+from data.user import User
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from datetime import datetime
 
 faker = Faker()
 
@@ -25,7 +35,9 @@ def new_user() -> UserCreate:
     Returns:
         UserCreate: A new user
     """
-    return UserCreate(username=faker.user_name(), password=faker.password())
+    return UserCreate(
+        username=unique_name(faker.user_name()), password=faker.password()
+    )
 
 
 @fixture
@@ -38,7 +50,7 @@ def updated_user() -> UserUpdate:
     """
     return UserUpdate(
         id=str(faker.uuid4()),
-        username=faker.user_name(),
+        username=unique_name(faker.user_name()),
         password=faker.password(),
     )
 
@@ -51,7 +63,7 @@ def new_user_role() -> UserRoleCreate:
     Returns:
         UserRoleCreate: A new user role
     """
-    return UserRoleCreate(name=faker.word().zfill(2))
+    return UserRoleCreate(name=unique_name(faker.word()))
 
 
 @fixture
@@ -63,39 +75,139 @@ def updated_user_role() -> UserRoleUpdate:
         UserRoleUpdate: An updated user role
     """
     return UserRoleUpdate(
-        name=faker.word(),
+        name=unique_name(faker.word()),
     )
 
 
-def test_create_user(new_user: UserCreate):
+@mark.anyio
+async def test_create_user(new_user: UserCreate):
     """
     Test create user
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
+    created_user = await user.create_user(new_user)
     assert created_user.username == new_user.username
     assert created_user.password_hash != new_user.password
 
 
-def test_create_user_duplicate(new_user: UserCreate):
+@mark.anyio
+async def test_create_user_duplicate(new_user: UserCreate):
     """
     Test create user duplicate
 
     Args:
         new_user (UserCreate): A new user
     """
-    user.create_user(new_user)
+    await user.create_user(new_user)
     with raises(Duplicate) as exc_info:
-        user.create_user(new_user)
+        await user.create_user(new_user)
     assert (
         exc_info.value.msg
         == f"User with username {new_user.username!r} already exists"
     )
 
 
-def test_update_user(new_user: UserCreate, updated_user: UserUpdate):
+@mark.anyio
+async def test_create_user_integrity_error(
+    new_user: UserCreate, monkeypatch: MonkeyPatch
+):
+    """
+    Test create user only reports a taken username as a duplicate
+
+    Args:
+        new_user (UserCreate): A new user
+        monkeypatch (MonkeyPatch): pytest monkeypatch fixture
+    """
+
+    async def no_role(name, session=None):
+        return SimpleNamespace(id=None)
+
+    monkeypatch.setattr(user_role, "get_user_role_by_name", no_role)
+    with raises(IntegrityError) as exc_info:
+        await user.create_user(new_user)
+    assert "NOT NULL" in str(exc_info.value)
+
+
+@mark.anyio
+async def test_create_user_one_statement(
+    new_user: UserCreate, query_counter: QueryCounter
+):
+    """
+    Test create user is one statement, also when the username is taken
+
+    Args:
+        new_user (UserCreate): A new user
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    await user.get_user_role_by_name("user")
+    query_counter.reset()
+    await user.create_user(new_user)
+    assert query_counter.statements == 1
+    query_counter.reset()
+    with raises(Duplicate):
+        await user.create_user(new_user)
+    assert query_counter.statements == 1
+
+
+@mark.anyio
+async def test_create_user_concurrent():
+    """
+    Test concurrent signups with one username create exactly one user
+    """
+    username = unique_name(faker.user_name())
+    results = await asyncio.gather(
+        *(
+            user.create_user(
+                UserCreate(username=username, password=faker.password())
+            )
+            for _ in range(20)
+        ),
+        return_exceptions=True,
+    )
+    created = [r for r in results if isinstance(r, UserInDB)]
+    assert len(created) == 1
+    assert all(
+        isinstance(r, Duplicate) for r in results if r is not created[0]
+    )
+    async with unit_of_work() as session:
+        rows = (
+            await session.exec(select(User).where(User.username == username))
+        ).all()
+    assert [r.id for r in rows] == [created[0].id]
+
+
+@mark.anyio
+async def test_import_users(new_user: UserCreate, query_counter: QueryCounter):
+    """
+    Test import users skips taken and repeated usernames
+
+    Args:
+        new_user (UserCreate): A new user
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    await user.create_user(new_user)
+    fresh = [
+        UserCreate(username=f"{faker.uuid4()}", password=faker.password())
+        for _ in range(2)
+    ]
+    hasher = HashingExecutor(max_workers=2, max_queue=10)
+    query_counter.reset()
+    try:
+        created = await user.import_users([new_user, *fresh, fresh[0]], hasher)
+    finally:
+        hasher.shutdown()
+    assert created == 2
+    assert query_counter.statements == 2
+    for u in fresh:
+        assert (
+            await user.get_user_with_role_by_username(u.username)
+        ).role == ("user")
+
+
+@mark.anyio
+async def test_update_user(new_user: UserCreate, updated_user: UserUpdate):
     """
     Test update user
 
@@ -103,15 +215,38 @@ def test_update_user(new_user: UserCreate, updated_user: UserUpdate):
         new_user (UserCreate): A new user
         updated_user (UserUpdate): An updated user
     """
-    created_user = user.create_user(new_user)
+    created_user = await user.create_user(new_user)
     updated_user.id = created_user.id
-    user.update_user(updated_user)
-    user_by_id = user.get_user_by_id(created_user.id)
+    await user.update_user(updated_user)
+    user_by_id = await user.get_user_by_id(created_user.id)
     assert user_by_id.username == updated_user.username
     assert user_by_id.password_hash != updated_user.password
 
 
-def test_update_user_missing(updated_user: UserUpdate):
+@mark.anyio
+async def test_update_user_single_statement(
+    new_user: UserCreate, query_counter: QueryCounter
+):
+    """
+    Test update user is one UPDATE ... RETURNING statement
+
+    Args:
+        new_user (UserCreate): A new user
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    created_user = await user.create_user(new_user)
+    query_counter.reset()
+    updated = await user.update_user(
+        UserUpdate(
+            id=created_user.id, username=created_user.username, password=None
+        )
+    )
+    assert query_counter.statements == 1
+    assert updated.password_hash == created_user.password_hash
+
+
+@mark.anyio
+async def test_update_user_missing(updated_user: UserUpdate):
     """
     Test update user missing
 
@@ -119,22 +254,23 @@ def test_update_user_missing(updated_user: UserUpdate):
         updated_user (UserUpdate): An updated user
     """
     with raises(Missing) as exc_info:
-        user.update_user(updated_user)
+        await user.update_user(updated_user)
     assert exc_info.value.msg == f"User with id {updated_user.id!r} not found"
 
 
-def test_update_user_duplicate(new_user: UserCreate):
+@mark.anyio
+async def test_update_user_duplicate(new_user: UserCreate):
     """
     Test update user duplicate
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
-    new_user.username = faker.user_name()
-    user.create_user(new_user)
+    created_user = await user.create_user(new_user)
+    new_user.username = unique_name(faker.user_name())
+    await user.create_user(new_user)
     with raises(Duplicate) as exc_info:
-        user.update_user(
+        await user.update_user(
             UserUpdate(
                 id=created_user.id,
                 username=new_user.username,
@@ -147,30 +283,32 @@ def test_update_user_duplicate(new_user: UserCreate):
     )
 
 
-def test_delete_user(new_user: UserCreate):
+@mark.anyio
+async def test_delete_user(new_user: UserCreate):
     """
     Test delete user
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
-    user.delete_user(created_user)
+    created_user = await user.create_user(new_user)
+    await user.delete_user(created_user)
     with raises(Missing) as exc_info:
-        user.get_user_by_id(created_user.id)
+        await user.get_user_by_id(created_user.id)
     assert exc_info.value.msg == f"User with id {created_user.id!r} not found"
 
 
-def test_delete_user_missing():
+@mark.anyio
+async def test_delete_user_missing():
     """
     Test delete user missing
     """
     id = str(faker.uuid4())
     with raises(Missing) as exc_info:
-        user.delete_user(
+        await user.delete_user(
             UserInDB(
                 id=id,
-                username=faker.user_name(),
+                username=unique_name(faker.user_name()),
                 password_hash=faker.password(),
                 role_id=str(faker.uuid4()),
                 time_created=faker.date_time(),
@@ -180,60 +318,113 @@ def test_delete_user_missing():
     assert exc_info.value.msg == f"User with id {id!r} not found"
 
 
-def test_get_user_by_id(new_user: UserCreate):
+@mark.anyio
+async def test_get_user_by_id(new_user: UserCreate):
     """
     Test get user by id
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
+    created_user = await user.create_user(new_user)
     user_id = created_user.id
-    user_by_id = user.get_user_by_id(user_id)
+    user_by_id = await user.get_user_by_id(user_id)
     assert user_by_id.id == user_id
 
 
-def test_get_user_by_username(new_user: UserCreate):
+@mark.anyio
+async def test_get_user_by_username(new_user: UserCreate):
     """
     Test get user by username
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
+    created_user = await user.create_user(new_user)
     username = created_user.username
-    user_by_username = user.get_user_by_username(username)
+    user_by_username = await user.get_user_by_username(username)
     assert user_by_username.username == username
 
 
-def test_user_role_create(new_user_role: UserRoleCreate):
+@mark.anyio
+async def test_get_user_with_role(new_user: UserCreate):
+    """
+    Test get user with role by id and by username
+
+    Args:
+        new_user (UserCreate): A new user
+    """
+    created_user = await user.create_user(new_user)
+    by_id = await user.get_user_with_role_by_id(created_user.id)
+    by_username = await user.get_user_with_role_by_username(
+        created_user.username
+    )
+    assert by_id == by_username
+    assert by_id.role == "user"
+    assert by_id.role_id == created_user.role_id
+
+
+@mark.anyio
+async def test_get_user_with_role_missing():
+    """
+    Test get user with role missing
+    """
+    id = str(faker.uuid4())
+    with raises(Missing) as exc_info:
+        await user.get_user_with_role_by_id(id)
+    assert exc_info.value.msg == f"User with id {id!r} not found"
+
+
+@mark.anyio
+async def test_get_all_users_with_role(
+    new_user: UserCreate, query_counter: QueryCounter
+):
+    """
+    Test get all users with role is one query per page
+
+    Args:
+        new_user (UserCreate): A new user
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    created_user = await user.create_user(new_user)
+    query_counter.reset()
+    users, _ = await user.get_all_users_with_role(limit=10)
+    assert query_counter.statements == 1
+    assert users[0].id == created_user.id
+    assert users[0].role == "user"
+
+
+@mark.anyio
+async def test_user_role_create(new_user_role: UserRoleCreate):
     """
     Test create user role
 
     Args:
         new_user_role (UserRoleCreate): A new user role
     """
-    created_user_role = user.create_user_role(new_user_role)
+    created_user_role = await user.create_user_role(new_user_role)
     assert created_user_role.name == new_user_role.name
 
 
-def test_user_role_create_duplicate(new_user_role: UserRoleCreate):
+@mark.anyio
+async def test_user_role_create_duplicate(new_user_role: UserRoleCreate):
     """
     Test create user role duplicate
 
     Args:
         new_user_role (UserRoleCreate): A new user role
     """
-    user.create_user_role(new_user_role)
+    await user.create_user_role(new_user_role)
     with raises(Duplicate) as exc_info:
-        user.create_user_role(new_user_role)
+        await user.create_user_role(new_user_role)
     assert (
         exc_info.value.msg
         == f"User role with name {new_user_role.name!r} already exists"
     )
 
 
-def test_user_role_update(
+@mark.anyio
+async def test_user_role_update(
     new_user_role: UserRoleCreate, updated_user_role: UserRoleUpdate
 ):
     """
@@ -243,13 +434,14 @@ def test_user_role_update(
         new_user_role (UserRoleCreate): A new user role
         updated_user_role (UserRoleUpdate): An updated user role
     """
-    created_user_role = user.create_user_role(new_user_role)
-    user.update_user_role(created_user_role.id, updated_user_role)
-    user_role_by_id = user.get_user_role_by_id(created_user_role.id)
+    created_user_role = await user.create_user_role(new_user_role)
+    await user.update_user_role(created_user_role.id, updated_user_role)
+    user_role_by_id = await user.get_user_role_by_id(created_user_role.id)
     assert user_role_by_id.name == updated_user_role.name
 
 
-def test_user_role_update_missing(updated_user_role: UserRoleUpdate):
+@mark.anyio
+async def test_user_role_update_missing(updated_user_role: UserRoleUpdate):
     """
     Test update user role missing
 
@@ -258,22 +450,23 @@ def test_user_role_update_missing(updated_user_role: UserRoleUpdate):
     """
     id = str(faker.uuid4())
     with raises(Missing) as exc_info:
-        user.update_user_role(id, updated_user_role)
+        await user.update_user_role(id, updated_user_role)
     assert exc_info.value.msg == f"User role with id {id!r} not found"
 
 
-def test_user_role_update_duplicate(new_user_role: UserRoleCreate):
+@mark.anyio
+async def test_user_role_update_duplicate(new_user_role: UserRoleCreate):
     """
     Test update user role duplicate
 
     Args:
         new_user_role (UserRoleCreate): A new user role
     """
-    created_user_role = user.create_user_role(new_user_role)
-    new_user_role.name = faker.word().zfill(2)
-    user.create_user_role(new_user_role)
+    created_user_role = await user.create_user_role(new_user_role)
+    new_user_role.name = unique_name(faker.word())
+    await user.create_user_role(new_user_role)
     with raises(Duplicate) as exc_info:
-        user.update_user_role(
+        await user.update_user_role(
             created_user_role.id, UserRoleUpdate(name=new_user_role.name)
         )
     assert (
@@ -282,34 +475,39 @@ def test_user_role_update_duplicate(new_user_role: UserRoleCreate):
     )
 
 
-def test_user_role_delete(new_user_role: UserRoleCreate):
+@mark.anyio
+async def test_user_role_delete(new_user_role: UserRoleCreate):
     """
     Test delete user role
 
     Args:
         new_user_role (UserRoleCreate): A new user role
     """
-    created_user_role = user.create_user_role(new_user_role)
-    user.delete_user_role(created_user_role.id)
+    created_user_role = await user.create_user_role(new_user_role)
+    await user.delete_user_role(created_user_role.id)
     with raises(Missing) as exc_info:
-        user.get_user_role_by_id(created_user_role.id)
+        await user.get_user_role_by_id(created_user_role.id)
     assert (
         exc_info.value.msg
         == f"User role with id {created_user_role.id!r} not found"
     )
 
 
-def test_user_role_delete_missing():
+@mark.anyio
+async def test_user_role_delete_missing():
     """
     Test delete user role missing
     """
     id = str(faker.uuid4())
     with raises(Missing) as exc_info:
-        user.delete_user_role(id)
+        await user.delete_user_role(id)
     assert exc_info.value.msg == f"User role with id {id!r} not found"
 
 
-def test_update_user_role(new_user: UserCreate, new_user_role: UserRoleCreate):
+@mark.anyio
+async def test_update_user_role(
+    new_user: UserCreate, new_user_role: UserRoleCreate
+):
     """
     Test update user role
 
@@ -317,19 +515,59 @@ def test_update_user_role(new_user: UserCreate, new_user_role: UserRoleCreate):
         new_user (UserCreate): A new user
         new_user_role (UserRoleCreate): A new user role
     """
-    created_user = user.create_user(new_user)
-    created_user_role = user.create_user_role(new_user_role)
-    user.user_role_update(created_user.id, created_user_role.name)
-    user_by_id = UserInDB(**user.get_user_by_id(created_user.id).model_dump())
+    created_user = await user.create_user(new_user)
+    created_user_role = await user.create_user_role(new_user_role)
+    await user.user_role_update(created_user.id, created_user_role.name)
+    user_by_id = UserInDB(
+        **(await user.get_user_by_id(created_user.id)).model_dump()
+    )
     assert user_by_id.role_id == created_user_role.id
 
 
-def test_update_user_role_missing():
+@mark.anyio
+async def test_update_user_role_missing():
     """
     Test update user role missing
     """
     user_id = str(faker.uuid4())
-    role_name = faker.word().zfill(2)
+    role_name = unique_name(faker.word())
     with raises(Missing) as exc_info:
-        user.user_role_update(user_id, role_name)
+        await user.user_role_update(user_id, role_name)
     assert exc_info.value.msg == f"User with id {user_id!r} not found"
+
+
+@mark.anyio
+async def test_user_lookup_plans():
+    """
+    Test the hot user lookups are index searches, never table scans
+    """
+    async with unit_of_work() as session:
+        by_id = await query_plan(session, select(User).where(User.id == "x"))
+        by_username = await query_plan(
+            session, select(User).where(User.username == "x")
+        )
+        with_role = await query_plan(
+            session, user._select_with_role().where(User.id == "x")
+        )
+        all_users = await query_plan(
+            session,
+            user.paginate(
+                user._select_with_role(),
+                User,
+                encode_cursor(datetime(2024, 1, 1), "x"),
+                10,
+            ),
+        )
+    assert by_id == "SEARCH user USING INDEX sqlite_autoindex_user_1 (id=?)"
+    assert (
+        by_username == "SEARCH user USING INDEX ix_user_username (username=?)"
+    )
+    assert (
+        "SEARCH user USING INDEX sqlite_autoindex_user_1 (id=?)" in with_role
+    )
+    assert (
+        "SEARCH user_role USING INDEX sqlite_autoindex_user_role_1 (id=?)"
+        in with_role
+    )
+    assert "ix_user_time_created_id" in all_users
+    assert "TEMP B-TREE" not in all_users
@@ -4,14 +4,15 @@ Test user role data
 This module contains the unit tests for the user role data.
 """
 
-from pytest import fixture, raises
+from pytest import fixture, mark, raises
 from faker import Faker
-from model.user_role import UserRoleCreate, UserRoleUpdate, UserRoleInDB
+from model.user_role import UserRoleCreate, UserRoleUpdate
 import os
 from errors.errors import Duplicate, Missing
 
 os.environ["ENV"] = "test"
 from data import user_role
+from conftest import QueryCounter, unique_name
 
 faker = Faker()
 
@@ -25,7 +26,7 @@ def new_user_role1() -> UserRoleCreate:
         UserRoleCreate: User role create object
     """
     return UserRoleCreate(
-        name=faker.word().zfill(2),
+        name=unique_name(faker.word()),
     )
 
 
@@ -38,7 +39,7 @@ def new_user_role2() -> UserRoleCreate:
         UserRoleCreate: User role create object
     """
     return UserRoleCreate(
-        name=faker.word(),
+        name=unique_name(faker.word()),
     )
 
 
@@ -51,7 +52,7 @@ def new_user_role3() -> UserRoleCreate:
         UserRoleCreate: User role create object
     """
     return UserRoleCreate(
-        name=faker.word().zfill(2),
+        name=unique_name(faker.word()),
     )
 
 
@@ -64,60 +65,67 @@ def updated_user_role() -> UserRoleUpdate:
         UserRoleUpdate: User role update object
     """
     return UserRoleUpdate(
-        name=faker.word(),
+        name=unique_name(faker.word()),
     )
 
 
-def test_create_user_role(new_user_role1: UserRoleCreate):
+@mark.anyio
+async def test_create_user_role(new_user_role1: UserRoleCreate):
     """
     Test create user role
 
     Args:
         new_user_role (UserRoleCreate): User role create object
     """
-    user_role_in_db = user_role.create_user_role(new_user_role1)
+    user_role_in_db = await user_role.create_user_role(new_user_role1)
     assert user_role_in_db.name == new_user_role1.name
 
 
-def test_create_user_role_duplicate(new_user_role2: UserRoleCreate):
+@mark.anyio
+async def test_create_user_role_duplicate(new_user_role2: UserRoleCreate):
     """
     Test create user role duplicate
 
     Args:
         new_user_role (UserRoleCreate): User role create object
     """
-    user_role.create_user_role(new_user_role2)
+    await user_role.create_user_role(new_user_role2)
     with raises(Duplicate):
-        user_role.create_user_role(new_user_role2)
+        await user_role.create_user_role(new_user_role2)
 
 
-def test_get_user_role_by_id(new_user_role3: UserRoleCreate):
+@mark.anyio
+async def test_get_user_role_by_id(new_user_role3: UserRoleCreate):
     """
     Test get user role by id
 
     Args:
         new_user_role (UserRoleCreate): User role create object
     """
-    user_role_in_db = user_role.create_user_role(new_user_role3)
-    user_role_by_id = user_role.get_user_role_by_id(user_role_in_db.id)
+    user_role_in_db = await user_role.create_user_role(new_user_role3)
+    user_role_by_id = await user_role.get_user_role_by_id(user_role_in_db.id)
     assert user_role_in_db.id == user_role_by_id.id
     assert user_role_in_db.name == user_role_by_id.name
 
 
-def test_get_user_role_by_name(new_user_role3: UserRoleCreate):
+@mark.anyio
+async def test_get_user_role_by_name(new_user_role3: UserRoleCreate):
     """
     Test get user role by name
 
     Args:
         new_user_role (UserRoleCreate): User role create object
     """
-    user_role_in_db = user_role.create_user_role(new_user_role3)
-    user_role_by_name = user_role.get_user_role_by_name(user_role_in_db.name)
+    user_role_in_db = await user_role.create_user_role(new_user_role3)
+    user_role_by_name = await user_role.get_user_role_by_name(
+        user_role_in_db.name
+    )
     assert user_role_in_db.id == user_role_by_name.id
     assert user_role_in_db.name == user_role_by_name.name
 
 
-def test_get_all_user_roles(
+@mark.anyio
+async def test_get_all_user_roles(
     new_user_role1: UserRoleCreate, new_user_role2: UserRoleCreate
 ):
     """
@@ -127,14 +135,15 @@ def test_get_all_user_roles(
         new_user_role1 (UserRoleCreate): User role create object
         new_user_role2 (UserRoleCreate): User role create object
     """
-    user_role_in_db1 = user_role.create_user_role(new_user_role1)
-    user_role_in_db2 = user_role.create_user_role(new_user_role2)
-    user_roles = user_role.get_all_user_roles()
+    user_role_in_db1 = await user_role.create_user_role(new_user_role1)
+    user_role_in_db2 = await user_role.create_user_role(new_user_role2)
+    user_roles = await user_role.get_all_user_roles()
     assert user_role_in_db1 in user_roles
     assert user_role_in_db2 in user_roles
 
 
-def test_update_user_role(
+@mark.anyio
+async def test_update_user_role(
     new_user_role1: UserRoleCreate, updated_user_role: UserRoleUpdate
 ):
     """
@@ -144,13 +153,14 @@ def test_update_user_role(
         new_user_role (UserRoleCreate): User role create object
         updated_user_role (UserRoleUpdate): User role update object
     """
-    user_role_in_db = user_role.create_user_role(new_user_role1)
-    user_role.update_user_role(user_role_in_db.id, updated_user_role)
-    user_role_in_db = user_role.get_user_role_by_id(user_role_in_db.id)
+    user_role_in_db = await user_role.create_user_role(new_user_role1)
+    await user_role.update_user_role(user_role_in_db.id, updated_user_role)
+    user_role_in_db = await user_role.get_user_role_by_id(user_role_in_db.id)
     assert user_role_in_db.name == updated_user_role.name
 
 
-def test_update_user_role_duplicate(
+@mark.anyio
+async def test_update_user_role_duplicate(
     new_user_role1: UserRoleCreate, new_user_role2: UserRoleCreate
 ):
     """
@@ -160,15 +170,16 @@ def test_update_user_role_duplicate(
         new_user_role1 (UserRoleCreate): User role create object
         new_user_role2 (UserRoleCreate): User role create object
     """
-    user_role_in_db1 = user_role.create_user_role(new_user_role1)
-    user_role_in_db2 = user_role.create_user_role(new_user_role2)
+    user_role_in_db1 = await user_role.create_user_role(new_user_role1)
+    user_role_in_db2 = await user_role.create_user_role(new_user_role2)
     with raises(Duplicate):
-        user_role.update_user_role(
+        await user_role.update_user_role(
             user_role_in_db1.id, UserRoleUpdate(name=user_role_in_db2.name)
         )
 
 
-def test_update_user_role_missing(updated_user_role: UserRoleUpdate):
+@mark.anyio
+async def test_update_user_role_missing(updated_user_role: UserRoleUpdate):
     """
     Test update user role missing
 
@@ -176,25 +187,89 @@ def test_update_user_role_missing(updated_user_role: UserRoleUpdate):
         updated_user_role (UserRoleUpdate): User role update object
     """
     with raises(Missing):
-        user_role.update_user_role(str(faker.uuid4()), updated_user_role)
+        await user_role.update_user_role(str(faker.uuid4()), updated_user_role)
 
 
-def test_delete_user_role(new_user_role1: UserRoleCreate):
+@mark.anyio
+async def test_delete_user_role(new_user_role1: UserRoleCreate):
     """
     Test delete user role
 
     Args:
         new_user_role (UserRoleCreate): User role create object
     """
-    user_role_in_db = user_role.create_user_role(new_user_role1)
-    user_role.delete_user_role(user_role_in_db.id)
+    user_role_in_db = await user_role.create_user_role(new_user_role1)
+    await user_role.delete_user_role(user_role_in_db.id)
     with raises(Missing):
-        user_role.get_user_role_by_id(user_role_in_db.id)
+        await user_role.get_user_role_by_id(user_role_in_db.id)
 
 
-def test_delete_user_role_missing():
+@mark.anyio
+async def test_delete_user_role_missing():
     """
     Test delete user role missing
     """
     with raises(Missing):
-        user_role.delete_user_role(str(faker.uuid4()))
+        await user_role.delete_user_role(str(faker.uuid4()))
+
+
+@mark.anyio
+async def test_get_user_role_cached(query_counter: QueryCounter):
+    """
+    Test a cached user role lookup costs no query
+
+    Args:
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    user_role_in_db = await user_role.create_user_role(
+        UserRoleCreate(name=faker.uuid4())
+    )
+    await user_role.get_user_role_by_id(user_role_in_db.id)
+    hits = user_role.role_cache.hits
+    query_counter.reset()
+    by_id = await user_role.get_user_role_by_id(user_role_in_db.id)
+    by_name = await user_role.get_user_role_by_name(user_role_in_db.name)
+    assert by_id == by_name == user_role_in_db
+    assert query_counter.statements == 0
+    assert user_role.role_cache.hits == hits + 2
+
+
+@mark.anyio
+async def test_get_user_role_cache_invalidated():
+    """
+    Test updating and deleting a user role drop it from the cache
+    """
+    user_role_in_db = await user_role.create_user_role(
+        UserRoleCreate(name=faker.uuid4())
+    )
+    updated_user_role = UserRoleUpdate(name=faker.uuid4())
+    await user_role.get_user_role_by_name(user_role_in_db.name)
+    await user_role.update_user_role(user_role_in_db.id, updated_user_role)
+    with raises(Missing):
+        await user_role.get_user_role_by_name(user_role_in_db.name)
+    assert (
+        await user_role.get_user_role_by_id(user_role_in_db.id)
+    ).name == updated_user_role.name
+    await user_role.delete_user_role(user_role_in_db.id)
+    with raises(Missing):
+        await user_role.get_user_role_by_id(user_role_in_db.id)
+
+
+@mark.anyio
+async def test_get_user_role_cache_racing_write():
+    """
+    Test a user role read while a write commits is not cached
+    """
+    user_role_in_db = await user_role.create_user_role(
+        UserRoleCreate(name=faker.uuid4())
+    )
+    updated_user_role = UserRoleUpdate(name=faker.uuid4())
+    with user_role.role_cache.read() as since:
+        # The lookup has read the row, the write commits before it caches it
+        await user_role.update_user_role(user_role_in_db.id, updated_user_role)
+        user_role.role_cache.put(user_role_in_db, since)
+    assert user_role.role_cache.get_by_id(user_role_in_db.id) is None
+    assert user_role.role_cache.get_by_name(user_role_in_db.name) is None
+    assert (
+        await user_role.get_user_role_by_id(user_role_in_db.id)
+    ).name == updated_user_role.name
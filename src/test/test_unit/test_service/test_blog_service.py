@@ -4,30 +4,32 @@ Unit tests for blog service
 This module contains unit tests for the blog service
 """
 
-from pytest import fixture, raises
+from pytest import fixture, mark, raises
 from faker import Faker
+from conftest import unique_name
+import json
 import os
 
 os.environ["ENV"] = "test"
 from model.user import UserCreate, UserInDB, UserOut
 from service import blog, user
 from errors.errors import Missing
-from model.blog import BlogCreate, BlogUpdate
+from model.blog import BlogBulkCreate, BlogCreate, BlogUpdate
 
 faker = Faker()
 
 
 @fixture
-def new_user() -> UserOut:
+async def new_user() -> UserOut:
     """
     Create a new user
 
     Returns:
         UserOut: A new user
     """
-    return user.create_user(
+    return await user.create_user(
         UserCreate(
-            username=faker.user_name(),
+            username=unique_name(faker.user_name()),
             password=faker.password(),
         )
     )
@@ -62,77 +64,133 @@ def updated_blog() -> BlogUpdate:
     )
 
 
-def test_create_blog(new_blog: BlogCreate):
+@mark.anyio
+async def test_create_blog(new_blog: BlogCreate):
     """
     Test create blog
 
     Args:
         new_blog (BlogCreate): A new blog
     """
-    created_blog = blog.create_blog(new_blog)
+    created_blog = await blog.create_blog(new_blog)
     assert created_blog.title == new_blog.title
     assert created_blog.content == new_blog.content
 
 
-def test_get_blog_by_id(new_blog: BlogCreate):
+@mark.anyio
+async def test_create_blogs(new_blog: BlogCreate):
+    """
+    Test create blogs
+
+    Args:
+        new_blog (BlogCreate): A new blog
+    """
+    created = await blog.create_blogs(
+        BlogBulkCreate(blogs=[new_blog, new_blog])
+    )
+    assert len(created.ids) == 2
+    for id in created.ids:
+        assert (await blog.get_blog_by_id(id)).title == new_blog.title
+
+
+@mark.anyio
+async def test_get_blog_by_id(new_blog: BlogCreate):
     """
     Test get blog by id
 
     Args:
         new_blog (BlogCreate): A new blog
     """
-    created_blog = blog.create_blog(new_blog)
-    blog_by_id = blog.get_blog_by_id(created_blog.id)
+    created_blog = await blog.create_blog(new_blog)
+    blog_by_id = await blog.get_blog_by_id(created_blog.id)
     assert blog_by_id.title == new_blog.title
     assert blog_by_id.content == new_blog.content
 
 
-def test_get_blog_by_id_missing():
+@mark.anyio
+async def test_get_blog_by_id_missing():
     """
     Test get blog by id missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        blog.get_blog_by_id(id)
+        await blog.get_blog_by_id(id)
     assert exc_info.value.msg == f"Blog with id {id!r} not found"
 
 
-def test_get_blog_by_user_id(new_blog: BlogCreate):
+@mark.anyio
+async def test_get_blog_by_user_id(new_blog: BlogCreate):
     """
     Test get blog by user id
 
     Args:
         new_blog (BlogCreate): A new blog
     """
-    created_blog = blog.create_blog(new_blog)
-    blogs_by_user_id = blog.get_blogs_by_user_id(created_blog.user_id)
-    assert len(blogs_by_user_id) > 0
-    assert any(blog.id == created_blog.id for blog in blogs_by_user_id)
+    created_blog = await blog.create_blog(new_blog)
+    blogs_by_user_id = await blog.get_blogs_by_user_id(created_blog.user_id)
+    assert len(blogs_by_user_id.items) > 0
+    assert any(blog.id == created_blog.id for blog in blogs_by_user_id.items)
 
 
-def test_get_blogs_by_user_id_missing():
+@mark.anyio
+async def test_get_blogs_by_user_id_missing():
     """
     Test get blogs by user id missing
     """
     with raises(Missing) as exc_info:
         user_id = str(faker.uuid4())
-        blog.get_blogs_by_user_id(user_id)
+        await blog.get_blogs_by_user_id(user_id)
     assert exc_info.value.msg == f"Blogs with user id {user_id!r} not found"
 
 
-def test_get_all_blogs(new_blog: BlogCreate):
+@mark.anyio
+async def test_get_all_blogs(new_blog: BlogCreate):
     """
     Test get all blogs
 
     Args:
         new_blog (BlogCreate): A new blog
     """
-    blog.create_blog(new_blog)
-    all_blogs = blog.get_all_blogs()
-    assert len(all_blogs) > 0
+    await blog.create_blog(new_blog)
+    all_blogs = await blog.get_all_blogs()
+    assert len(all_blogs.items) > 0
+
+
+@mark.anyio
+async def test_search_blogs(new_blog: BlogCreate):
+    """
+    Test search blogs
+
+    Args:
+        new_blog (BlogCreate): A new blog
+    """
+    word = faker.uuid4(cast_to=None).hex
+    new_blog.content = f"{new_blog.content} {word}"
+    created_blog = await blog.create_blog(new_blog)
+    found = await blog.search_blogs(word)
+    assert [b.id for b in found.items] == [created_blog.id]
+    assert f"<b>{word}</b>" in found.items[0].snippet
+    assert found.next_cursor is None
+
+
+@mark.anyio
+async def test_export_blogs(new_blog: BlogCreate):
+    """
+    Test export blogs as NDJSON and as a JSON array
+
+    Args:
+        new_blog (BlogCreate): A new blog
+    """
+    created_blog = await blog.create_blog(new_blog)
+    ndjson = b"".join([c async for c in blog.export_blogs("ndjson")])
+    lines = [json.loads(line) for line in ndjson.splitlines()]
+    array = json.loads(b"".join([c async for c in blog.export_blogs("json")]))
+    assert lines == array
+    assert created_blog.id in [b["id"] for b in array]
 
 
-def test_update_blog(new_blog: BlogCreate, updated_blog: BlogUpdate):
+@mark.anyio
+async def test_update_blog(new_blog: BlogCreate, updated_blog: BlogUpdate):
     """
     Test update blog
 
@@ -140,46 +198,49 @@ def test_update_blog(new_blog: BlogCreate, updated_blog: BlogUpdate):
         new_blog (BlogCreate): A new blog
         updated_blog (BlogUpdate): An updated blog
     """
-    created_blog = blog.create_blog(new_blog)
+    created_blog = await blog.create_blog(new_blog)
     updated_blog.id = created_blog.id
-    blog_updated = blog.update_blog(updated_blog)
+    blog_updated = await blog.update_blog(updated_blog)
     assert blog_updated.title == updated_blog.title
     assert blog_updated.content == updated_blog.content
     assert blog_updated.time_created == created_blog.time_created
     assert blog_updated.time_updated != created_blog.time_updated
 
 
-def test_update_blog_missing():
+@mark.anyio
+async def test_update_blog_missing():
     """
     Test update blog missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        blog.update_blog(
+        await blog.update_blog(
             BlogUpdate(id=id, title=faker.sentence(), content=faker.text())
         )
     assert exc_info.value.msg == f"Blog with id {id!r} not found"
 
 
-def test_delete_blog(new_blog: BlogCreate):
+@mark.anyio
+async def test_delete_blog(new_blog: BlogCreate):
     """
     Test delete blog
 
     Args:
         new_blog (BlogCreate): A new blog
     """
-    created_blog = blog.create_blog(new_blog)
-    blog.delete_blog(created_blog.id)
+    created_blog = await blog.create_blog(new_blog)
+    await blog.delete_blog(created_blog.id)
     with raises(Missing) as exc_info:
-        blog.get_blog_by_id(created_blog.id)
+        await blog.get_blog_by_id(created_blog.id)
     assert exc_info.value.msg == f"Blog with id {created_blog.id!r} not found"
 
 
-def test_delete_blog_missing():
+@mark.anyio
+async def test_delete_blog_missing():
     """
     Test delete blog missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        blog.delete_blog(id)
+        await blog.delete_blog(id)
     assert exc_info.value.msg == f"Blog with id {id!r} not found"
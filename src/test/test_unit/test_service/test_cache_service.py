@@ -0,0 +1,244 @@
+"""
+Unit tests for the response cache
+
+This module contains the unit tests for the response cache and its
+invalidation by the write services.
+"""
+
+import os
+import time
+
+from faker import Faker
+from pytest import MonkeyPatch, fixture, mark, raises
+
+os.environ["ENV"] = "test"
+from data import blog as blog_data
+from data import unit_of_work
+from errors.errors import Missing
+from model.blog import BlogBatchGet, BlogCreate, BlogOut, BlogUpdate
+from model.user import UserCreate, UserOut, UserUpdate
+from model.user_role import UserRoleCreate, UserRoleUpdate
+from service import blog, user
+from service.cache import (
+    LRUResponseCache,
+    ResponseCache,
+    get_response_cache,
+    row_key,
+)
+from conftest import QueryCounter
+
+faker = Faker()
+
+
+@fixture
+async def new_user() -> UserOut:
+    """
+    Create a new user
+
+    Returns:
+        UserOut: A new user
+    """
+    return await user.create_user(
+        UserCreate(username=faker.uuid4(), password=faker.password())
+    )
+
+
+@fixture
+async def new_blog(new_user: UserOut) -> BlogOut:
+    """
+    Create a new blog
+
+    Args:
+        new_user (UserOut): A new user
+
+    Returns:
+        BlogOut: A new blog
+    """
+    return await blog.create_blog(
+        BlogCreate(
+            user_id=new_user.id, title=faker.sentence(), content=faker.text()
+        )
+    )
+
+
+def test_lru_evicts_least_recently_used():
+    """
+    Test the cache keeps within its byte bound, least recently used first
+    out
+    """
+    value = UserRoleCreate(name="x" * 20)
+    size = len(value.model_dump_json())
+    cache = LRUResponseCache(max_bytes=2 * size, ttl=60)
+    cache.set("a", value)
+    cache.set("b", value)
+    assert cache.get("a") is value
+    cache.set("c", value)
+    assert cache.get("b") is None
+    assert cache.get("a") is value
+    stats = cache.stats()
+    assert (stats.entries, stats.bytes, stats.evictions) == (2, 2 * size, 1)
+    assert (stats.hits, stats.misses, stats.hit_ratio) == (2, 1, 2 / 3)
+
+
+def test_lru_expires_and_invalidates_tags():
+    """
+    Test entries expire after the TTL and are dropped by key or tag
+    """
+    value = UserRoleCreate(name="name")
+    cache = LRUResponseCache(max_bytes=1000, ttl=0.01)
+    cache.set("a", value)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats().expirations == 1
+    cache.ttl = 60
+    cache.set("a", value, tags=("t",))
+    cache.set("b", value, tags=("t",))
+    cache.set("c", value)
+    cache.invalidate("t")
+    assert cache.get("a") is None and cache.get("b") is None
+    cache.invalidate("c")
+    assert cache.stats().entries == cache.stats().bytes == 0
+
+
+def test_incomplete_cache_rejected():
+    """
+    Test a response cache missing a method cannot be instantiated
+    """
+
+    class NoStatsCache(ResponseCache):
+        get = LRUResponseCache.get
+        set = LRUResponseCache.set
+        invalidate = LRUResponseCache.invalidate
+        clear = LRUResponseCache.clear
+
+    with raises(TypeError) as exc_info:
+        NoStatsCache()
+    assert "stats" in str(exc_info.value)
+
+
+@mark.anyio
+async def test_get_blog_cached(new_blog: BlogOut, query_counter: QueryCounter):
+    """
+    Test a blog is read once, whatever the spelling of its id, until it is
+    updated
+
+    Args:
+        new_blog (BlogOut): A new blog
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    await blog.get_blog_by_id(new_blog.id)
+    query_counter.reset()
+    assert await blog.get_blog_by_id(new_blog.id.upper()) == new_blog
+    assert query_counter.statements == 0
+    title = faker.sentence()
+    await blog.update_blog(BlogUpdate(id=new_blog.id, title=title))
+    assert (await blog.get_blog_by_id(new_blog.id)).title == title
+    await blog.delete_blog(new_blog.id)
+    with raises(Missing):
+        await blog.get_blog_by_id(new_blog.id)
+
+
+@mark.anyio
+async def test_read_racing_write_not_cached(
+    new_blog: BlogOut, monkeypatch: MonkeyPatch
+):
+    """
+    Test a blog read while an update commits is returned but not cached,
+    for single and batch reads
+
+    Args:
+        new_blog (BlogOut): A new blog
+        monkeypatch (MonkeyPatch): pytest monkeypatch fixture
+    """
+    read_one, read_many = blog_data.get_blog_by_id, blog_data.get_blogs_by_ids
+
+    async def update(title: str):
+        await blog.update_blog(BlogUpdate(id=new_blog.id, title=title))
+
+    async def racing_read_one(*args, **kwargs):
+        row = await read_one(*args, **kwargs)
+        await update("Racing single read")
+        return row
+
+    async def racing_read_many(*args, **kwargs):
+        rows = await read_many(*args, **kwargs)
+        await update("Racing batch read")
+        return rows
+
+    monkeypatch.setattr(blog_data, "get_blog_by_id", racing_read_one)
+    assert (await blog.get_blog_by_id(new_blog.id)).title == new_blog.title
+    monkeypatch.undo()
+    assert (
+        await blog.get_blog_by_id(new_blog.id)
+    ).title == "Racing single read"
+    # Drop the blog cached by the single read
+    await update("Before batch read")
+    monkeypatch.setattr(blog_data, "get_blogs_by_ids", racing_read_many)
+    await blog.get_blogs_by_ids(BlogBatchGet(ids=[new_blog.id]))
+    monkeypatch.undo()
+    assert (
+        await blog.get_blogs_by_ids(BlogBatchGet(ids=[new_blog.id]))
+    ).items[0].title == "Racing batch read"
+
+
+@mark.anyio
+async def test_get_all_blogs_cached(
+    new_blog: BlogOut, query_counter: QueryCounter
+):
+    """
+    Test a page of blogs is cached until a blog is created
+
+    Args:
+        new_blog (BlogOut): A new blog
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    first = await blog.get_all_blogs(limit=1)
+    query_counter.reset()
+    assert await blog.get_all_blogs(limit=1) is first
+    assert query_counter.statements == 0
+    created = await blog.create_blog(
+        BlogCreate(user_id=new_blog.user_id, title="Newer", content="...")
+    )
+    assert (await blog.get_all_blogs(limit=1)).items[0].id == created.id
+
+
+@mark.anyio
+async def test_get_user_cached_invalidated_by_role_rename(new_user: UserOut):
+    """
+    Test renaming a role drops the cached users
+
+    Args:
+        new_user (UserOut): A new user
+    """
+    role = await user.create_user_role(UserRoleCreate(name=faker.uuid4()))
+    await user.user_role_update(new_user.id, role.name)
+    assert (await user.get_user_by_id(new_user.id)).role == role.name
+    renamed = UserRoleUpdate(name=faker.uuid4())
+    await user.update_user_role(role.id, renamed)
+    assert (await user.get_user_by_id(new_user.id)).role == renamed.name
+
+
+@mark.anyio
+async def test_rolled_back_write_invalidated(new_user: UserOut):
+    """
+    Test a read cached inside a write transaction that rolls back is
+    dropped with it
+
+    Args:
+        new_user (UserOut): A new user
+    """
+    username = faker.uuid4()
+    with raises(RuntimeError):
+        async with unit_of_work() as session:
+            await user.update_user(
+                UserUpdate(id=new_user.id, username=username, password=None),
+                session,
+            )
+            assert (
+                await user.get_user_by_id(new_user.id, session)
+            ).username == username
+            raise RuntimeError
+    assert get_response_cache().get(row_key("user", new_user.id)) is None
+    assert (
+        await user.get_user_by_id(new_user.id)
+    ).username == new_user.username
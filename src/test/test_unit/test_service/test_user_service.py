@@ -4,14 +4,17 @@ Unit tests for user service
 This module contains the unit tests for the user service module.
 """
 
-from pytest import fixture, raises
+from pytest import MonkeyPatch, fixture, mark, raises
 from faker import Faker
+from conftest import unique_name
+import asyncio
 import os
 
 os.environ["ENV"] = "test"
 from model.user_role import UserRoleCreate, UserRoleUpdate
 from service import user
-from errors.errors import Duplicate, Missing
+from data.hashing import HashingExecutor, get_import_hasher
+from errors.errors import Busy, Duplicate, Missing
 from model.user import UserCreate, UserUpdate
 
 faker = Faker()
@@ -26,7 +29,7 @@ def new_user() -> UserCreate:
         UserCreate: A new user
     """
     return UserCreate(
-        username=faker.user_name(),
+        username=unique_name(faker.user_name()),
         password=faker.password(),
     )
 
@@ -41,7 +44,7 @@ def updated_user() -> UserUpdate:
     """
     return UserUpdate(
         id=str(faker.uuid4()),
-        username=faker.user_name(),
+        username=unique_name(faker.user_name()),
         password=faker.password(),
     )
 
@@ -54,7 +57,7 @@ def new_role() -> UserRoleCreate:
     Returns:
         UserRoleCreate: A new role
     """
-    return UserRoleCreate(name=faker.word().zfill(2))
+    return UserRoleCreate(name=unique_name(faker.word()))
 
 
 @fixture
@@ -65,94 +68,198 @@ def updated_role() -> UserRoleUpdate:
     Returns:
         UserRoleCreate: An updated role
     """
-    return UserRoleUpdate(name=faker.word().zfill(2))
+    return UserRoleUpdate(name=unique_name(faker.word()))
 
 
-def test_create_user(new_user: UserCreate):
+@mark.anyio
+async def test_create_user(new_user: UserCreate):
     """
     Test create user
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
+    created_user = await user.create_user(new_user)
     assert created_user.username == new_user.username
 
 
-def test_create_user_duplicate(new_user: UserCreate):
+@mark.anyio
+async def test_create_user_duplicate(new_user: UserCreate):
     """
     Test create user duplicate
 
     Args:
         new_user (UserCreate): A new user
     """
-    user.create_user(new_user)
+    await user.create_user(new_user)
     with raises(Duplicate) as exc_info:
-        user.create_user(new_user)
+        await user.create_user(new_user)
     assert (
         exc_info.value.msg
         == f"User with username {new_user.username!r} already exists"
     )
 
 
-def test_get_user_by_id(new_user: UserCreate):
+@mark.anyio
+async def test_get_user_by_id(new_user: UserCreate):
     """
     Test get user by id
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
-    user_by_id = user.get_user_by_id(created_user.id)
+    created_user = await user.create_user(new_user)
+    user_by_id = await user.get_user_by_id(created_user.id)
     assert user_by_id.username == new_user.username
 
 
-def test_get_user_by_username(new_user: UserCreate):
+@mark.anyio
+async def test_get_user_by_username(new_user: UserCreate):
     """
     Test get user by username
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
-    user_by_username = user.get_user_by_username(created_user.username)
+    created_user = await user.create_user(new_user)
+    user_by_username = await user.get_user_by_username(created_user.username)
     assert user_by_username.username == new_user.username
 
 
-def test_get_all_users(new_user: UserCreate):
+@mark.anyio
+async def test_get_all_users(new_user: UserCreate):
     """
     Test get all users
 
     Args:
         new_user (UserCreate): A new user
     """
-    user.create_user(new_user)
-    all_users = user.get_all_users()
-    assert len(all_users) > 0
-    assert any(user.username == new_user.username for user in all_users)
+    await user.create_user(new_user)
+    all_users = await user.get_all_users()
+    assert len(all_users.items) > 0
+    assert any(user.username == new_user.username for user in all_users.items)
 
 
-def test_get_user_by_id_missing():
+@mark.anyio
+async def test_get_user_by_id_role_name(new_user: UserCreate):
+    """
+    Test the user role is returned by name
+
+    Args:
+        new_user (UserCreate): A new user
+    """
+    created_user = await user.create_user(new_user)
+    assert created_user.role == "user"
+    assert (await user.get_user_by_id(created_user.id)).role == "user"
+
+
+@mark.anyio
+async def test_get_user_by_id_missing():
     """
     Test get user by id missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        user.get_user_by_id(id)
+        await user.get_user_by_id(id)
     assert exc_info.value.msg == f"User with id {id!r} not found"
 
 
-def test_get_user_by_username_missing():
+@mark.anyio
+async def test_get_user_by_username_missing():
     """
     Test get user by username missing
     """
     with raises(Missing) as exc_info:
-        username = faker.user_name()
-        user.get_user_by_username(username)
+        username = unique_name(faker.user_name())
+        await user.get_user_by_username(username)
     assert exc_info.value.msg == f"User with username {username!r} not found"
 
 
-def test_update_user(new_user: UserCreate, updated_user: UserUpdate):
+@mark.anyio
+async def test_import_users(new_user: UserCreate):
+    """
+    Test import users in batches
+
+    Args:
+        new_user (UserCreate): A new user
+    """
+    await user.create_user(new_user)
+    fresh = [
+        UserCreate(username=f"{faker.uuid4()}", password=faker.password())
+        for _ in range(3)
+    ]
+
+    async def records():
+        for record in [*fresh, new_user]:
+            yield record
+
+    result = await user.import_users(records(), batch_size=2)
+    assert result.created == 3
+    assert result.skipped == 1
+    assert result.users_per_second > 0
+    for u in fresh:
+        assert (await user.get_user_by_username(u.username)).role == "user"
+
+
+@mark.anyio
+async def test_import_users_shared_pool():
+    """
+    Test imports share one hashing pool and an import beyond the limit is
+    rejected before it reads any record
+    """
+    started, finish = asyncio.Event(), asyncio.Event()
+    read = []
+
+    async def slow_records():
+        started.set()
+        await finish.wait()
+        yield UserCreate(username=str(faker.uuid4()), password="password")
+
+    async def records():
+        read.append(True)
+        yield UserCreate(username=str(faker.uuid4()), password="password")
+
+    running = asyncio.create_task(user.import_users(slow_records()))
+    await started.wait()
+    with raises(Busy):
+        await user.import_users(records())
+    assert not read
+    finish.set()
+    assert (await running).created == 1
+    pool = get_import_hasher()
+    assert (await user.import_users(records())).created == 1
+    assert get_import_hasher() is pool
+
+
+@mark.anyio
+async def test_import_users_batch_larger_than_pool(monkeypatch: MonkeyPatch):
+    """
+    Test a batch larger than the hashing pool waits for it instead of
+    overflowing its queue, with each running import kept to its share
+
+    Args:
+        monkeypatch (MonkeyPatch): pytest monkeypatch
+    """
+    monkeypatch.setenv("MAX_IMPORTS", "2")
+    hasher = HashingExecutor(max_workers=1, max_queue=3)
+
+    async def records():
+        for _ in range(6):
+            yield UserCreate(username=str(faker.uuid4()), password="password")
+
+    try:
+        result = await user.import_users(
+            records(), batch_size=6, hasher=hasher
+        )
+    finally:
+        hasher.shutdown()
+    assert result.created == 6
+    assert hasher.rejected == 0
+    assert hasher.max_in_flight == 2
+
+
+@mark.anyio
+async def test_update_user(new_user: UserCreate, updated_user: UserUpdate):
     """
     Test update user
 
@@ -160,16 +267,17 @@ def test_update_user(new_user: UserCreate, updated_user: UserUpdate):
         new_user (UserCreate): A new user
         updated_user (UserUpdate): An updated user
     """
-    created_user = user.create_user(new_user)
+    created_user = await user.create_user(new_user)
     updated_user.id = created_user.id
-    updated_user.username = faker.user_name()
+    updated_user.username = unique_name(faker.user_name())
     updated_user.password = faker.password()
-    user.update_user(updated_user)
-    user_by_id = user.get_user_by_id(created_user.id)
+    await user.update_user(updated_user)
+    user_by_id = await user.get_user_by_id(created_user.id)
     assert user_by_id.username == updated_user.username
 
 
-def test_update_user_missing(updated_user: UserUpdate):
+@mark.anyio
+async def test_update_user_missing(updated_user: UserUpdate):
     """
     Test update user missing
 
@@ -179,11 +287,14 @@ def test_update_user_missing(updated_user: UserUpdate):
     """
     with raises(Missing) as exc_info:
         updated_user.id = str(faker.uuid4())
-        user.update_user(updated_user)
+        await user.update_user(updated_user)
     assert exc_info.value.msg == f"User with id {updated_user.id!r} not found"
 
 
-def test_update_user_duplicate(new_user: UserCreate, updated_user: UserUpdate):
+@mark.anyio
+async def test_update_user_duplicate(
+    new_user: UserCreate, updated_user: UserUpdate
+):
     """
     Test update user duplicate
 
@@ -191,143 +302,160 @@ def test_update_user_duplicate(new_user: UserCreate, updated_user: UserUpdate):
         new_user (UserCreate): A new user
         updated_user (UserUpdate): An updated user
     """
-    user.create_user(new_user)
-    created_user = user.create_user(
+    await user.create_user(new_user)
+    created_user = await user.create_user(
         UserCreate(
-            username=faker.user_name(),
+            username=unique_name(faker.user_name()),
             password=faker.password(),
         )
     )
     updated_user.id = created_user.id
     updated_user.username = new_user.username
     with raises(Duplicate) as exc_info:
-        user.update_user(updated_user)
+        await user.update_user(updated_user)
     assert (
         exc_info.value.msg
         == f"User with username {new_user.username!r} already exists"
     )
 
 
-def test_delete_user(new_user: UserCreate):
+@mark.anyio
+async def test_delete_user(new_user: UserCreate):
     """
     Test delete user
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
-    user.delete_user(created_user.id)
+    created_user = await user.create_user(new_user)
+    await user.delete_user(created_user.id)
     with raises(Missing) as exc_info:
-        user.get_user_by_id(created_user.id)
+        await user.get_user_by_id(created_user.id)
     assert exc_info.value.msg == f"User with id {created_user.id!r} not found"
 
 
-def test_delete_user_missing():
+@mark.anyio
+async def test_delete_user_missing():
     """
     Test delete user missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        user.delete_user(id)
+        await user.delete_user(id)
     assert exc_info.value.msg == f"User with id {id!r} not found"
 
 
-def test_user_role_update(new_user: UserCreate, new_role: UserRoleCreate):
+@mark.anyio
+async def test_user_role_update(
+    new_user: UserCreate, new_role: UserRoleCreate
+):
     """
     Test user role update
 
     Args:
         new_user (UserCreate): A new user
     """
-    created_user = user.create_user(new_user)
-    user.create_user_role(new_role)
-    user_role_update = user.user_role_update(created_user.id, new_role.name)
+    created_user = await user.create_user(new_user)
+    await user.create_user_role(new_role)
+    user_role_update = await user.user_role_update(
+        created_user.id, new_role.name
+    )
     assert user_role_update == True
 
 
-def test_user_role_update_missing(new_user: UserCreate):
+@mark.anyio
+async def test_user_role_update_missing(new_user: UserCreate):
     """
     Test user role update missing
     """
-    n_user = user.create_user(new_user)
+    n_user = await user.create_user(new_user)
     with raises(Missing) as exc_info:
-        name = faker.word().zfill(2)
-        user.user_role_update(n_user.id, name)
+        name = unique_name(faker.word())
+        await user.user_role_update(n_user.id, name)
     assert exc_info.value.msg == f"User role with name {name!r} not found"
 
 
-def test_role_create(new_role: UserRoleCreate):
+@mark.anyio
+async def test_role_create(new_role: UserRoleCreate):
     """
     Test role create
 
     Args:
         new_role (UserRoleCreate): A new role
     """
-    created_role = user.create_user_role(new_role)
+    created_role = await user.create_user_role(new_role)
     assert created_role.name == new_role.name
 
 
-def test_role_create_duplicate(new_role: UserRoleCreate):
+@mark.anyio
+async def test_role_create_duplicate(new_role: UserRoleCreate):
     """
     Test role create duplicate
 
     Args:
         new_role (UserRoleCreate): A new role
     """
-    user.create_user_role(new_role)
+    await user.create_user_role(new_role)
     with raises(Duplicate) as exc_info:
-        user.create_user_role(new_role)
+        await user.create_user_role(new_role)
     assert (
         exc_info.value.msg
         == f"User role with name {new_role.name!r} already exists"
     )
 
 
-def test_get_role_by_id(new_role: UserRoleCreate):
+@mark.anyio
+async def test_get_role_by_id(new_role: UserRoleCreate):
     """
     Test get role by id
 
     Args:
         new_role (UserRoleCreate): A new role
     """
-    created_role = user.create_user_role(new_role)
-    role_by_id = user.get_user_role_by_id(created_role.id)
+    created_role = await user.create_user_role(new_role)
+    role_by_id = await user.get_user_role_by_id(created_role.id)
     assert role_by_id.name == new_role.name
 
 
-def test_get_role_by_name(new_role: UserRoleCreate):
+@mark.anyio
+async def test_get_role_by_name(new_role: UserRoleCreate):
     """
     Test get role by name
 
     Args:
         new_role (UserRoleCreate): A new role
     """
-    created_role = user.create_user_role(new_role)
-    role_by_name = user.get_user_role_by_name(created_role.name)
+    created_role = await user.create_user_role(new_role)
+    role_by_name = await user.get_user_role_by_name(created_role.name)
     assert role_by_name.name == new_role.name
 
 
-def test_get_role_by_id_missing():
+@mark.anyio
+async def test_get_role_by_id_missing():
     """
     Test get role by id missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        user.get_user_role_by_id(id)
+        await user.get_user_role_by_id(id)
     assert exc_info.value.msg == f"User role with id {id!r} not found"
 
 
-def test_get_role_by_name_missing():
+@mark.anyio
+async def test_get_role_by_name_missing():
     """
     Test get role by name missing
     """
     with raises(Missing) as exc_info:
-        name = faker.user_name()
-        user.get_user_role_by_name(name)
+        name = unique_name(faker.user_name())
+        await user.get_user_role_by_name(name)
     assert exc_info.value.msg == f"User role with name {name!r} not found"
 
 
-def test_update_role(new_role: UserRoleCreate, updated_role: UserRoleUpdate):
+@mark.anyio
+async def test_update_role(
+    new_role: UserRoleCreate, updated_role: UserRoleUpdate
+):
     """
     Test update role
 
@@ -335,13 +463,14 @@ def test_update_role(new_role: UserRoleCreate, updated_role: UserRoleUpdate):
         new_role (UserRoleCreate): A new role
         updated_role (UserRoleUpdate): An updated role
     """
-    created_role = user.create_user_role(new_role)
-    user.update_user_role(created_role.id, updated_role)
-    role_by_id = user.get_user_role_by_id(created_role.id)
+    created_role = await user.create_user_role(new_role)
+    await user.update_user_role(created_role.id, updated_role)
+    role_by_id = await user.get_user_role_by_id(created_role.id)
     assert role_by_id.name == updated_role.name
 
 
-def test_update_role_missing(updated_role: UserRoleUpdate):
+@mark.anyio
+async def test_update_role_missing(updated_role: UserRoleUpdate):
     """
     Test update role missing
 
@@ -351,11 +480,12 @@ def test_update_role_missing(updated_role: UserRoleUpdate):
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        user.update_user_role(id, updated_role)
+        await user.update_user_role(id, updated_role)
     assert exc_info.value.msg == f"User role with id {id!r} not found"
 
 
-def test_update_role_duplicate(
+@mark.anyio
+async def test_update_role_duplicate(
     new_role: UserRoleCreate, updated_role: UserRoleUpdate
 ):
     """
@@ -365,39 +495,43 @@ def test_update_role_duplicate(
         new_role (UserRoleCreate): A new role
         updated_role (UserRoleUpdate): An updated role
     """
-    user.create_user_role(new_role)
-    created_role = user.create_user_role(UserRoleCreate(name=faker.word().zfill(2)))
+    await user.create_user_role(new_role)
+    created_role = await user.create_user_role(
+        UserRoleCreate(name=unique_name(faker.word()))
+    )
     updated_role.name = created_role.name
     with raises(Duplicate) as exc_info:
-        user.update_user_role(created_role.id, updated_role)
+        await user.update_user_role(created_role.id, updated_role)
     assert (
         exc_info.value.msg
         == f"User role with name {updated_role.name!r} already exists"
     )
 
 
-def test_delete_role(new_role: UserRoleCreate):
+@mark.anyio
+async def test_delete_role(new_role: UserRoleCreate):
     """
     Test delete role
 
     Args:
         new_role (UserRoleCreate): A new role
     """
-    created_role = user.create_user_role(new_role)
-    user.delete_user_role(created_role.id)
+    created_role = await user.create_user_role(new_role)
+    await user.delete_user_role(created_role.id)
     with raises(Missing) as exc_info:
-        user.get_user_role_by_id(created_role.id)
+        await user.get_user_role_by_id(created_role.id)
     assert (
         exc_info.value.msg
         == f"User role with id {created_role.id!r} not found"
     )
 
 
-def test_delete_role_missing():
+@mark.anyio
+async def test_delete_role_missing():
     """
     Test delete role missing
     """
     with raises(Missing) as exc_info:
         id = str(faker.uuid4())
-        user.delete_user_role(id)
+        await user.delete_user_role(id)
     assert exc_info.value.msg == f"User role with id {id!r} not found"
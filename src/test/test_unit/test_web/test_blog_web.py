@@ -9,14 +9,17 @@ from faker import Faker
 from httpx import AsyncClient, ASGITransport
 from fastapi import FastAPI
 from httpx import Response
+import json
 import os
 
 os.environ["ENV"] = "prod"
-from model.user import UserCreate, UserOut
-from model.blog import BlogCreate, BlogOut, BlogUpdate
+from model import MAX_BATCH_SIZE
+from model.user import UserCreate, UserOut, UserUpdate
+from model.blog import BlogCreate, BlogOut, BlogSummary, BlogUpdate, excerpt
 from service import blog as blog_service
 from service import user as user_service
 from web import create_app
+from conftest import QueryCounter, unique_name
 
 faker = Faker()
 
@@ -33,16 +36,16 @@ def app() -> FastAPI:
 
 
 @fixture
-def new_user_in_db() -> UserOut:
+async def new_user_in_db() -> UserOut:
     """
     Create a new user in db
 
     Returns:
         UserInDB: A new user in db
     """
-    return user_service.create_user(
+    return await user_service.create_user(
         UserCreate(
-            username=faker.user_name(),
+            username=unique_name(faker.user_name()),
             password=faker.password(),
         )
     )
@@ -67,7 +70,7 @@ def new_blog(new_user_in_db: UserOut) -> BlogCreate:
 
 
 @fixture
-def new_blog_in_db(new_user_in_db: UserOut) -> BlogOut:
+async def new_blog_in_db(new_user_in_db: UserOut) -> BlogOut:
     """
     Create a new blog in db
 
@@ -77,7 +80,7 @@ def new_blog_in_db(new_user_in_db: UserOut) -> BlogOut:
     Returns:
         BlogOut: A new blog in db
     """
-    return blog_service.create_blog(
+    return await blog_service.create_blog(
         BlogCreate(
             title=faker.sentence(),
             content=faker.text(),
@@ -148,6 +151,47 @@ async def test_create_blog_invalid(app: FastAPI, new_user_in_db: UserOut):
         assert response.status_code == 422
 
 
+@mark.anyio
+async def test_create_blogs(app: FastAPI, new_blog: BlogCreate):
+    """
+    Test create blogs in bulk
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog (BlogCreate): A new blog
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.post(
+            "/api/blog/bulk",
+            json={"blogs": [new_blog.model_dump()] * 3},
+        )
+        assert response.status_code == 201
+        ids = response.json()["ids"]
+        assert len(ids) == 3
+        response = await ac.get(f"/api/blog/{ids[0]}")
+        assert response.status_code == 200
+        assert BlogOut(**response.json()).title == new_blog.title
+
+
+@mark.anyio
+async def test_create_blogs_invalid(app: FastAPI):
+    """
+    Test create blogs in bulk with no blog
+
+    Args:
+        app (FastAPI): A FastAPI app
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.post(
+            "/api/blog/bulk", json={"blogs": []}
+        )
+        assert response.status_code == 422
+
+
 @mark.anyio
 async def test_read_blog(app: FastAPI, new_blog_in_db: BlogOut):
     """
@@ -166,6 +210,92 @@ async def test_read_blog(app: FastAPI, new_blog_in_db: BlogOut):
         assert blog == new_blog_in_db
 
 
+@mark.anyio
+async def test_read_blog_cached(app: FastAPI, new_blog_in_db: BlogOut):
+    """
+    Test a blog read again is served from the response cache
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        await ac.get(f"/api/blog/{new_blog_in_db.id}")
+        before = (await ac.get("/api/cache/stats")).json()
+        response: Response = await ac.get(f"/api/blog/{new_blog_in_db.id}")
+        assert BlogOut(**response.json()) == new_blog_in_db
+        after = (await ac.get("/api/cache/stats")).json()
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+        assert 0 < after["hit_ratio"] <= 1
+
+
+@mark.anyio
+async def test_read_blog_conditional(app: FastAPI, new_blog_in_db: BlogOut):
+    """
+    Test a blog the client already has is answered with 304 until it is
+    updated
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+    """
+    url = f"/api/blog/{new_blog_in_db.id}"
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(url)
+        tag = response.headers["etag"]
+        last_modified = response.headers["last-modified"]
+        response = await ac.get(url, headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == tag
+        response = await ac.get(
+            url, headers={"If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 304
+        await ac.patch(url, json={"id": new_blog_in_db.id, "title": "New"})
+        response = await ac.get(url, headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != tag
+        assert response.json()["title"] == "New"
+
+
+@mark.anyio
+async def test_read_all_blogs_conditional(
+    app: FastAPI, new_blog_in_db: BlogOut
+):
+    """
+    Test a page of blogs the client already has is answered with 304 until
+    a blog is created
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get("/api/blog/all")
+        tag = response.headers["etag"]
+        response = await ac.get(
+            "/api/blog/all", headers={"If-None-Match": f'W/{tag}, "other"'}
+        )
+        assert response.status_code == 304
+        await blog_service.create_blog(
+            BlogCreate(
+                user_id=new_blog_in_db.user_id, title="Newer", content="..."
+            )
+        )
+        response = await ac.get(
+            "/api/blog/all", headers={"If-None-Match": tag}
+        )
+        assert response.status_code == 200
+
+
 @mark.anyio
 async def test_read_blog_missing(app: FastAPI):
     """
@@ -197,11 +327,203 @@ async def test_read_blog_by_user(app: FastAPI, new_blog_in_db: BlogOut):
             f"/api/blog/user/{new_blog_in_db.user_id}"
         )
         assert response.status_code == 200
-        blogs = [BlogOut(**b) for b in response.json()]
+        blogs = [BlogOut(**b) for b in response.json()["items"]]
         assert len(blogs) >= 1
         assert new_blog_in_db in blogs
 
 
+@mark.anyio
+async def test_read_blogs_batch(
+    app: FastAPI,
+    new_blog_in_db: BlogOut,
+    new_blog: BlogCreate,
+    query_counter: QueryCounter,
+):
+    """
+    Test a batch of blogs is read in one query, in request order, with
+    null for the ids not found, and from the cache once read
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+        new_blog (BlogCreate): A new blog
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    other = await blog_service.create_blog(new_blog)
+    ids = [other.id, str(faker.uuid4()), new_blog_in_db.id, other.id.upper()]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        query_counter.reset()
+        response: Response = await ac.post(
+            "/api/blog/batch", json={"ids": ids}
+        )
+        assert response.status_code == 200
+        assert query_counter.statements == 1
+        assert response.json()["items"] == [
+            other.model_dump(mode="json"),
+            None,
+            new_blog_in_db.model_dump(mode="json"),
+            other.model_dump(mode="json"),
+        ]
+        query_counter.reset()
+        response = await ac.post(
+            "/api/blog/batch", json={"ids": [new_blog_in_db.id, other.id]}
+        )
+        assert len(response.json()["items"]) == 2
+        assert query_counter.statements == 0
+        for ids in ([], [other.id] * (MAX_BATCH_SIZE + 1)):
+            response = await ac.post("/api/blog/batch", json={"ids": ids})
+            assert response.status_code == 422
+
+
+@mark.anyio
+async def test_read_blogs_summary(app: FastAPI, new_blog_in_db: BlogOut):
+    """
+    Test the summary view lists blogs with an excerpt instead of the
+    content, the full view stays the default
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        for url in (
+            "/api/blog/all",
+            f"/api/blog/user/{new_blog_in_db.user_id}",
+        ):
+            response: Response = await ac.get(url, params={"view": "summary"})
+            assert response.status_code == 200
+            summaries = [BlogSummary(**b) for b in response.json()["items"]]
+            assert (
+                BlogSummary(
+                    **new_blog_in_db.model_dump(),
+                    excerpt=excerpt(new_blog_in_db.content),
+                )
+                in summaries
+            )
+            assert all("content" not in b for b in response.json()["items"])
+            response = await ac.get(url)
+            assert "content" in response.json()["items"][0]
+        response = await ac.get("/api/blog/all", params={"view": "titles"})
+        assert response.status_code == 422
+
+
+@mark.anyio
+async def test_read_blogs_with_author(
+    app: FastAPI,
+    new_blog_in_db: BlogOut,
+    new_user_in_db: UserOut,
+    query_counter: QueryCounter,
+):
+    """
+    Test include=author embeds the author of the blogs, reads a page in one
+    query, and changes the ETag when the author changes
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+        new_user_in_db (UserOut): A new user in db, author of the blog
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    author = {
+        "id": new_user_in_db.id,
+        "username": new_user_in_db.username,
+        "role": new_user_in_db.role,
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(
+            f"/api/blog/{new_blog_in_db.id}", params={"include": "author"}
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            **new_blog_in_db.model_dump(mode="json"),
+            "author": author,
+        }
+        assert "last-modified" not in response.headers
+        tag = response.headers["etag"]
+        for url in (
+            "/api/blog/all",
+            f"/api/blog/user/{new_user_in_db.id}",
+        ):
+            for view in ("full", "summary"):
+                query_counter.reset()
+                response = await ac.get(
+                    url, params={"include": "author", "view": view}
+                )
+                assert response.status_code == 200
+                assert query_counter.statements == 1
+                item = next(
+                    b
+                    for b in response.json()["items"]
+                    if b["id"] == new_blog_in_db.id
+                )
+                assert item["author"] == author
+                assert ("content" in item) == (view == "full")
+        response = await ac.get(
+            "/api/blog/all", params={"include": "comments"}
+        )
+        assert response.status_code == 422
+        username = unique_name(faker.user_name())
+        await user_service.update_user(
+            UserUpdate(id=new_user_in_db.id, username=username, password=None)
+        )
+        response = await ac.get(
+            f"/api/blog/{new_blog_in_db.id}",
+            params={"include": "author"},
+            headers={"If-None-Match": tag},
+        )
+        assert response.status_code == 200
+        assert response.json()["author"]["username"] == username
+        assert response.headers["etag"] != tag
+
+
+@mark.anyio
+async def test_read_blog_by_user_paginated(
+    app: FastAPI, new_user_in_db: UserOut
+):
+    """
+    Test read blog by user page by page
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_user_in_db (UserOut): A new user in db
+    """
+    created = [
+        await blog_service.create_blog(
+            BlogCreate(
+                title=faker.sentence(),
+                content=faker.text(),
+                user_id=new_user_in_db.id,
+            )
+        )
+        for _ in range(3)
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        first: Response = await ac.get(
+            f"/api/blog/user/{new_user_in_db.id}", params={"limit": 2}
+        )
+        assert first.status_code == 200
+        assert first.json()["next_cursor"] is not None
+        second: Response = await ac.get(
+            f"/api/blog/user/{new_user_in_db.id}",
+            params={"limit": 2, "cursor": first.json()["next_cursor"]},
+        )
+        assert second.status_code == 200
+        assert second.json()["next_cursor"] is None
+        blogs = [
+            BlogOut(**b)
+            for b in first.json()["items"] + second.json()["items"]
+        ]
+        assert blogs == created[::-1]
+
+
 @mark.anyio
 async def test_read_blog_by_user_missing(app: FastAPI):
     """
@@ -234,11 +556,95 @@ async def test_read_all_blogs(
         response: Response = await ac.get("/api/blog/all")
         print(response.json())
         assert response.status_code == 200
-        blogs = [BlogOut(**b) for b in response.json()]
+        blogs = [BlogOut(**b) for b in response.json()["items"]]
         assert len(blogs) >= 1
         assert new_blog_in_db in blogs
 
 
+@mark.anyio
+async def test_read_all_blogs_invalid_cursor(app: FastAPI):
+    """
+    Test read all blogs with an invalid cursor
+
+    Args:
+        app (FastAPI): A FastAPI app
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(
+            "/api/blog/all", params={"cursor": "not a cursor"}
+        )
+        assert response.status_code == 400
+
+
+@mark.anyio
+async def test_search_blogs(app: FastAPI, new_blog: BlogCreate):
+    """
+    Test search blogs
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog (BlogCreate): A new blog
+    """
+    word = faker.uuid4(cast_to=None).hex
+    new_blog.title = word
+    created_blog = await blog_service.create_blog(new_blog)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(
+            "/api/blog/search", params={"q": word}
+        )
+        assert response.status_code == 200
+        items = response.json()["items"]
+        assert [b["id"] for b in items] == [created_blog.id]
+        assert items[0]["snippet"] == f"<b>{word}</b>"
+
+
+@mark.anyio
+async def test_search_blogs_invalid(app: FastAPI):
+    """
+    Test search blogs with no query and with an invalid cursor
+
+    Args:
+        app (FastAPI): A FastAPI app
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get("/api/blog/search")
+        assert response.status_code == 422
+        response = await ac.get(
+            "/api/blog/search", params={"q": "x", "cursor": "not a cursor"}
+        )
+        assert response.status_code == 400
+
+
+@mark.anyio
+async def test_export_blogs(app: FastAPI, new_blog_in_db: BlogOut):
+    """
+    Test export blogs
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        ndjson: Response = await ac.get("/api/blog/export")
+        assert ndjson.status_code == 200
+        assert ndjson.headers["content-type"] == "application/x-ndjson"
+        blogs = [BlogOut(**json.loads(b)) for b in ndjson.text.splitlines()]
+        assert new_blog_in_db in blogs
+        array: Response = await ac.get(
+            "/api/blog/export", params={"format": "json"}
+        )
+        assert array.status_code == 200
+        assert [BlogOut(**b) for b in array.json()] == blogs
+
+
 @mark.anyio
 async def test_update_blog(
     app: FastAPI, new_blog_in_db: BlogOut, new_blog_update: BlogUpdate
@@ -264,6 +670,71 @@ async def test_update_blog(
         assert blog.user_id == new_blog_in_db.user_id
 
 
+@mark.anyio
+async def test_update_blog_if_match(app: FastAPI, new_blog_in_db: BlogOut):
+    """
+    Test an update based on a stale ETag is rejected with 412
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+    """
+    url = f"/api/blog/{new_blog_in_db.id}"
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        tag = (await ac.get(url)).headers["etag"]
+        first: Response = await ac.patch(
+            url,
+            json={"id": new_blog_in_db.id, "title": "First"},
+            headers={"If-Match": tag},
+        )
+        assert first.status_code == 200
+        assert first.headers["etag"] != tag
+        second: Response = await ac.patch(
+            url,
+            json={"id": new_blog_in_db.id, "title": "Second"},
+            headers={"If-Match": tag},
+        )
+        assert second.status_code == 412
+        assert second.json()["detail"] == "Blog was modified"
+        assert (await ac.get(url)).json()["title"] == "First"
+        response = await ac.patch(
+            url,
+            json={"id": new_blog_in_db.id, "title": "Third"},
+            headers={"If-Match": first.headers["etag"]},
+        )
+        assert response.status_code == 200
+
+
+@mark.anyio
+async def test_update_blog_one_unit_of_work(
+    app: FastAPI,
+    new_blog_in_db: BlogOut,
+    new_blog_update: BlogUpdate,
+    query_counter: QueryCounter,
+):
+    """
+    Test update blog is a single statement on one connection checkout
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_blog_in_db (BlogOut): A new blog in db
+        new_blog_update (BlogUpdate): A new blog update
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        query_counter.reset()
+        response: Response = await ac.patch(
+            f"/api/blog/{new_blog_in_db.id}", json=new_blog_update.model_dump()
+        )
+        assert response.status_code == 200
+        assert query_counter.checkouts == 1
+        assert query_counter.statements == 1
+
+
 @mark.anyio
 async def test_update_blog_missing(app: FastAPI, new_blog_update: BlogUpdate):
     """
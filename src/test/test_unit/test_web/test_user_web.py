@@ -4,7 +4,7 @@ Unit tests for user web
 This module contains the unit tests for the user web module.
 """
 
-from pytest import fixture, mark
+from pytest import MonkeyPatch, fixture, mark
 from faker import Faker
 from httpx import AsyncClient, ASGITransport
 from fastapi import FastAPI
@@ -15,6 +15,7 @@ os.environ["ENV"] = "test"
 from model.user import UserCreate, UserOut, UserUpdate
 from service import user as user_service
 from web import create_app
+from conftest import QueryCounter, unique_name
 
 faker = Faker()
 
@@ -39,22 +40,22 @@ def new_user() -> UserCreate:
         UserCreate: A new user
     """
     return UserCreate(
-        username=faker.user_name(),
+        username=unique_name(faker.user_name()),
         password=faker.password(),
     )
 
 
 @fixture
-def new_user_in_db() -> UserOut:
+async def new_user_in_db() -> UserOut:
     """
     Create a new user in db
 
     Returns:
         UserInDB: A new user in db
     """
-    return user_service.create_user(
+    return await user_service.create_user(
         UserCreate(
-            username=faker.user_name(),
+            username=unique_name(faker.user_name()),
             password=faker.password(),
         )
     )
@@ -70,7 +71,7 @@ def new_user_update() -> UserUpdate:
     """
     return UserUpdate(
         id=str(Faker().uuid4()),
-        username=faker.user_name(),
+        username=unique_name(faker.user_name()),
         password=Faker().password(),
     )
 
@@ -101,11 +102,63 @@ async def test_get_all_users(app: FastAPI, new_user_in_db: UserOut):
     ) as ac:
         response: Response = await ac.get("/api/user/all")
         assert response.status_code == 200
-        users = [UserOut(**u) for u in response.json()]
+        users = [UserOut(**u) for u in response.json()["items"]]
         assert len(users) >= 1
         assert new_user_in_db in users
 
 
+@mark.anyio
+async def test_read_all_users_paginated(app: FastAPI):
+    """
+    Test get all users page by page
+
+    Args:
+        app (FastAPI): A FastAPI app
+    """
+    created = [
+        await user_service.create_user(
+            UserCreate(
+                username=unique_name(faker.user_name()),
+                password=faker.password(),
+            )
+        )
+        for _ in range(3)
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        first: Response = await ac.get("/api/user/all", params={"limit": 2})
+        assert first.status_code == 200
+        assert len(first.json()["items"]) == 2
+        second: Response = await ac.get(
+            "/api/user/all",
+            params={"limit": 2, "cursor": first.json()["next_cursor"]},
+        )
+        assert second.status_code == 200
+        users = [
+            UserOut(**u)
+            for u in first.json()["items"] + second.json()["items"]
+        ]
+        assert [u.id for u in users[:3]] == [u.id for u in created[::-1]]
+
+
+@mark.anyio
+async def test_read_all_users_invalid_cursor(app: FastAPI):
+    """
+    Test get all users with an invalid cursor
+
+    Args:
+        app (FastAPI): A FastAPI app
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(
+            "/api/user/all", params={"cursor": "not a cursor"}
+        )
+        assert response.status_code == 400
+
+
 @mark.anyio
 async def test_create_user(app: FastAPI, new_user: UserCreate):
     """
@@ -125,6 +178,72 @@ async def test_create_user(app: FastAPI, new_user: UserCreate):
         assert user.username == new_user.username
 
 
+@mark.anyio
+async def test_import_users(app: FastAPI, new_user_in_db: UserOut):
+    """
+    Test import users from an NDJSON body
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_user_in_db (UserOut): A new user in db
+    """
+    fresh = [
+        UserCreate(username=f"{faker.uuid4()}", password=faker.password())
+        for _ in range(2)
+    ]
+    taken = UserCreate(username=new_user_in_db.username, password="password")
+    body = "\n".join(u.model_dump_json() for u in [*fresh, taken])
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.post("/api/user/import", content=body)
+        assert response.status_code == 201
+        assert response.json()["created"] == 2
+        assert response.json()["skipped"] == 1
+        response = await ac.get(f"/api/user/username/{fresh[1].username}")
+        assert response.status_code == 200
+
+
+@mark.anyio
+async def test_import_users_busy(app: FastAPI, monkeypatch: MonkeyPatch):
+    """
+    Test import users while the allowed imports are running
+
+    Args:
+        app (FastAPI): A FastAPI app
+        monkeypatch (MonkeyPatch): pytest monkeypatch fixture
+    """
+    monkeypatch.setattr(user_service, "_imports_running", 1)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.post(
+            "/api/user/import",
+            content=UserCreate(
+                username=str(faker.uuid4()), password="password"
+            ).model_dump_json(),
+        )
+        assert response.status_code == 503
+
+
+@mark.anyio
+async def test_import_users_invalid(app: FastAPI):
+    """
+    Test import users with an invalid line
+
+    Args:
+        app (FastAPI): A FastAPI app
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.post(
+            "/api/user/import", content='{"username": "x"}\n'
+        )
+        assert response.status_code == 422
+        assert response.json()["detail"].startswith("Invalid user on line 1")
+
+
 @mark.anyio
 async def test_create_user_duplicate(app: FastAPI, new_user: UserCreate):
     """
@@ -161,6 +280,105 @@ async def test_get_user_by_id(app: FastAPI, new_user_in_db: UserOut):
         assert user.username == new_user_in_db.username
 
 
+@mark.anyio
+async def test_get_user_by_id_body(app: FastAPI, new_user_in_db: UserOut):
+    """
+    Test the user is sent as the JSON of UserOut, without the fields of the
+    user row it does not have
+
+    Args:
+        new_user_in_db (UserOut): A new user in db
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(f"/api/user/{new_user_in_db.id}")
+        assert response.headers["content-type"] == "application/json"
+        assert list(response.json()) == list(UserOut.model_fields)
+        assert response.json() == new_user_in_db.model_dump(mode="json")
+
+
+@mark.anyio
+async def test_get_users_batch(
+    app: FastAPI, new_user_in_db: UserOut, query_counter: QueryCounter
+):
+    """
+    Test a batch of users is read with their roles in one query, in request
+    order, with null for the ids not found
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_user_in_db (UserOut): A new user in db
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    missing = str(faker.uuid4())
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        query_counter.reset()
+        response: Response = await ac.post(
+            "/api/user/batch", json={"ids": [missing, new_user_in_db.id]}
+        )
+        assert response.status_code == 200
+        assert query_counter.statements == 1
+        assert response.json()["items"] == [
+            None,
+            new_user_in_db.model_dump(mode="json"),
+        ]
+
+
+@mark.anyio
+async def test_get_user_by_id_one_unit_of_work(
+    app: FastAPI, new_user_in_db: UserOut, query_counter: QueryCounter
+):
+    """
+    Test get user by id is one query on one connection checkout
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_user_in_db (UserOut): A new user in db
+        query_counter (QueryCounter): checkout and statement counter
+    """
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        query_counter.reset()
+        response: Response = await ac.get(f"/api/user/{new_user_in_db.id}")
+        assert response.status_code == 200
+        assert query_counter.checkouts == 1
+        assert query_counter.statements == 1
+
+
+@mark.anyio
+async def test_get_user_by_id_conditional(
+    app: FastAPI, new_user_in_db: UserOut
+):
+    """
+    Test a user the client already has is answered with 304 until its role
+    changes
+
+    Args:
+        app (FastAPI): A FastAPI app
+        new_user_in_db (UserOut): A new user in db
+    """
+    url = f"/api/user/{new_user_in_db.id}"
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response: Response = await ac.get(url)
+        tag = response.headers["etag"]
+        response = await ac.get(url, headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        await user_service.user_role_update(new_user_in_db.id, "moderator")
+        response = await ac.get(url, headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.json()["role"] == "moderator"
+        response = await ac.get(
+            url, headers={"If-Modified-Since": "Thu, 01 Jan 2015 00:00:00 GMT"}
+        )
+        assert response.status_code == 200
+
+
 @mark.anyio
 async def test_get_user_by_id_missing(app: FastAPI):
     """
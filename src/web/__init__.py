@@ -4,16 +4,48 @@ This package contains the web application.
 The web application is a FastAPI application that serves the API and the web interface.
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from model.cache import ResponseCacheStats
+from service.cache import get_response_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Set up the database before serving and release its connections after
+
+    Args:
+        app (FastAPI): the application
+    """
+    from data import get_engine, init_db
+    from data.hashing import shutdown_hasher
+
+    await init_db()
+    yield
+    shutdown_hasher()
+    await get_engine().dispose()
+
 
 def create_app():
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     @app.get("/")
     def read_root():
         return {"Hello": "World"}
 
+    @app.get("/api/cache/stats")
+    def read_cache_stats() -> ResponseCacheStats:
+        """
+        Get the hit ratio and size of the response cache
+
+        Returns:
+            ResponseCacheStats: ResponseCacheStats object
+        """
+        return get_response_cache().stats()
+
     from web.user import user
     from web.blog import blog
 
@@ -4,13 +4,93 @@ Blog API endpoints
 This module contains the blog API endpoints
 """
 
-from fastapi import APIRouter, HTTPException, status
-from errors.errors import Duplicate, Missing
-from model.blog import BlogCreate, BlogOut, BlogUpdate
+from typing import Literal, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from data import get_session
+from data.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from errors.errors import (
+    Duplicate,
+    InvalidCursor,
+    Missing,
+    PreconditionFailed,
+)
+from model.blog import (
+    BlogBatchGet,
+    BlogBatchOut,
+    BlogBulkCreate,
+    BlogBulkOut,
+    BlogCreate,
+    BlogOut,
+    BlogSearchPage,
+    BlogUpdate,
+    BlogWithAuthor,
+)
 from service import blog as blog_service
+from service.blog import BlogListPage, BlogView
+from web.conditional import (
+    etag,
+    if_match_versions,
+    not_modified,
+    version_etag,
+)
+from web.responses import model_response
 
 blog = APIRouter(prefix="/blog", tags=["blog"])
 
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+# Related rows a blog read can embed
+BlogInclude = Literal["author"]
+
+
+def _etag_parts(blog) -> tuple:
+    """
+    Get the values defining the representation of a blog
+
+    The author's username and role are part of it: user and role writes
+    change the representation of a blog with its author without touching
+    the blog row.
+
+    Args:
+        blog: blog in any representation
+
+    Returns:
+        tuple: id, version and, if embedded, author of the blog
+    """
+    author = getattr(blog, "author", None)
+    if author is None:
+        return blog.id, blog.version
+    return blog.id, blog.version, author.username, author.role
+
+
+def _page_etag(page: BlogListPage) -> str:
+    """
+    Get the entity tag of a page of blogs
+
+    Args:
+        page (BlogListPage): page of blogs in any view
+
+    Returns:
+        str: entity tag
+    """
+    return etag(
+        *(part for b in page.items for part in _etag_parts(b)),
+        page.next_cursor,
+    )
+
 
 @blog.get("/")
 async def blog_root():
@@ -21,53 +101,202 @@ async def blog_root():
 
 
 @blog.get("/all")
-async def read_all_blogs() -> list[BlogOut]:
+async def read_all_blogs(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    view: BlogView = "full",
+    include: Optional[BlogInclude] = None,
+    session: AsyncSession = Depends(get_session),
+) -> BlogListPage:
     """
-    Get all blogs
+    Get a page of blogs, newest first, or 304 if the client has it
+
+    Args:
+        request (Request): the request
+        response (Response): the response
+        cursor (Optional[str]): next_cursor of the previous page
+        limit (int): maximum number of blogs in the page
+        view (BlogView): ``full`` blogs, or ``summary`` with an excerpt
+            instead of the content
+        include (Optional[BlogInclude]): ``author`` to embed the author of
+            each blog
+        session (AsyncSession): session of the request
 
     Returns:
-        List[BlogOut]: List of BlogOut objects
+        BlogListPage: the page in the view
     """
     try:
-        return blog_service.get_all_blogs()
+        page = await blog_service.get_all_blogs(
+            cursor, limit, view, include == "author", session=session
+        )
+        return not_modified(
+            request, response, _page_etag(page)
+        ) or model_response(page, response)
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Blog not found"
         )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+
+
+@blog.get("/search")
+async def search_blogs(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+) -> BlogSearchPage:
+    """
+    Search the blogs containing every word of ``q`` in their title or
+    content, best match first
+
+    Args:
+        q (str): words to search
+        cursor (Optional[str]): next_cursor of the previous page
+        limit (int): maximum number of blogs in the page
+        session (AsyncSession): session of the request
+
+    Returns:
+        BlogSearchPage: BlogSearchPage object
+    """
+    try:
+        return model_response(
+            await blog_service.search_blogs(q, cursor, limit, session=session)
+        )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+
+
+@blog.get("/export", response_class=StreamingResponse)
+async def export_blogs(format: Literal["ndjson", "json"] = "ndjson"):
+    """
+    Export all blogs, oldest first
+
+    The blogs are streamed from the database in batches, so the export
+    does not hold the whole table in memory.
+
+    Args:
+        format (Literal["ndjson", "json"]): one JSON object per line, or a
+            single JSON array
+
+    Returns:
+        StreamingResponse: the exported blogs
+    """
+    return StreamingResponse(
+        blog_service.export_blogs(format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="blogs.{format}"'
+        },
+    )
 
 
 @blog.post("/", status_code=status.HTTP_201_CREATED)
-async def create_blog(blog: BlogCreate) -> BlogOut:
+async def create_blog(
+    blog: BlogCreate, session: AsyncSession = Depends(get_session)
+) -> BlogOut:
     """
     Create a new blog
 
     Args:
         blog (BlogCreate): BlogCreate object
+        session (AsyncSession): session of the request
 
     Returns:
         BlogOut: BlogOut object
     """
     try:
-        return blog_service.create_blog(blog)
+        return model_response(
+            await blog_service.create_blog(blog, session=session),
+            status_code=status.HTTP_201_CREATED,
+        )
     except Duplicate as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
         )
 
 
+@blog.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def create_blogs(
+    blogs: BlogBulkCreate, session: AsyncSession = Depends(get_session)
+) -> BlogBulkOut:
+    """
+    Create many blogs in one transaction
+
+    Args:
+        blogs (BlogBulkCreate): BlogBulkCreate object
+        session (AsyncSession): session of the request
+
+    Returns:
+        BlogBulkOut: ids of the created blogs, in request order
+    """
+    return await blog_service.create_blogs(blogs, session=session)
+
+
+@blog.post("/batch")
+async def read_blogs(
+    batch: BlogBatchGet, session: AsyncSession = Depends(get_session)
+) -> BlogBatchOut:
+    """
+    Get many blogs by id at once
+
+    Args:
+        batch (BlogBatchGet): BlogBatchGet object
+        session (AsyncSession): session of the request
+
+    Returns:
+        BlogBatchOut: the blogs in request order, null for the ids not
+            found
+    """
+    return model_response(
+        await blog_service.get_blogs_by_ids(batch, session=session)
+    )
+
+
 @blog.get("/{blog_id}")
-async def read_blog(blog_id: str) -> BlogOut:
+async def read_blog(
+    blog_id: str,
+    request: Request,
+    response: Response,
+    include: Optional[BlogInclude] = None,
+    session: AsyncSession = Depends(get_session),
+) -> BlogOut | BlogWithAuthor:
     """
-    Get a blog by id
+    Get a blog by id, or 304 if the client has it
+
+    The ETag of a blog alone is its version, to send in If-Match to update
+    it. The ETag of a blog with its author also changes with the author,
+    whose changes have no modification time to send in Last-Modified.
 
     Args:
         blog_id (str): id of the blog
+        request (Request): the request
+        response (Response): the response
+        include (Optional[BlogInclude]): ``author`` to embed the author of
+            the blog
+        session (AsyncSession): session of the request
 
     Returns:
-        BlogOut: BlogOut object
+        BlogOut | BlogWithAuthor: BlogOut or BlogWithAuthor object
     """
     try:
-        return blog_service.get_blog_by_id(blog_id)
+        blog = await blog_service.get_blog_by_id(
+            blog_id, include == "author", session=session
+        )
+        if include == "author":
+            tag, last_modified = etag(*_etag_parts(blog)), None
+        else:
+            tag, last_modified = version_etag(blog.version), blog.time_updated
+        return not_modified(
+            request, response, tag, last_modified
+        ) or model_response(blog, response)
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Blog not found"
@@ -75,55 +304,109 @@ async def read_blog(blog_id: str) -> BlogOut:
 
 
 @blog.get("/user/{user_id}")
-async def read_blog_by_user(user_id: str) -> list[BlogOut]:
+async def read_blog_by_user(
+    user_id: str,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    view: BlogView = "full",
+    include: Optional[BlogInclude] = None,
+    session: AsyncSession = Depends(get_session),
+) -> BlogListPage:
     """
-    Get a blog by user
+    Get a page of blogs by user, newest first, or 304 if the client has it
 
     Args:
         user_id (str): id of the user
+        request (Request): the request
+        response (Response): the response
+        cursor (Optional[str]): next_cursor of the previous page
+        limit (int): maximum number of blogs in the page
+        view (BlogView): ``full`` blogs, or ``summary`` with an excerpt
+            instead of the content
+        include (Optional[BlogInclude]): ``author`` to embed the author of
+            each blog
+        session (AsyncSession): session of the request
 
     Returns:
-        List[BlogOut]: List of BlogOut objects
+        BlogListPage: the page in the view
     """
     try:
-        return blog_service.get_blogs_by_user_id(user_id)
+        page = await blog_service.get_blogs_by_user_id(
+            user_id,
+            cursor,
+            limit,
+            view,
+            include == "author",
+            session=session,
+        )
+        return not_modified(
+            request, response, _page_etag(page)
+        ) or model_response(page, response)
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Blog not found"
         )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
 
 
 @blog.patch("/{blog_id}")
-async def update_blog(blog_id: str, blog: BlogUpdate) -> BlogOut:
+async def update_blog(
+    blog_id: str,
+    blog: BlogUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
+) -> BlogOut:
     """
-    Update a blog
+    Update a blog, only if it still has the ETag sent in If-Match, if any
 
     Args:
         blog_id (str): id of the blog
         blog (BlogUpdate): BlogUpdate object
+        response (Response): the response
+        if_match (Optional[str]): ETags of the versions the update is based
+            on
+        session (AsyncSession): session of the request
 
     Returns:
         BlogOut: BlogOut object
     """
     blog.id = blog_id
     try:
-        return blog_service.update_blog(blog)
+        u_blog = await blog_service.update_blog(
+            blog, if_match_versions(if_match), session=session
+        )
+        response.headers["ETag"] = version_etag(u_blog.version)
+        return model_response(u_blog, response)
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Blog not found"
         )
+    except PreconditionFailed as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Blog was modified",
+        )
 
 
 @blog.delete("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_blog(blog_id: str):
+async def delete_blog(
+    blog_id: str, session: AsyncSession = Depends(get_session)
+):
     """
     Delete a blog
 
     Args:
         blog_id (str): id of the blog
+        session (AsyncSession): session of the request
     """
     try:
-        blog_service.delete_blog(blog_id)
+        await blog_service.delete_blog(blog_id, session=session)
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Blog not found"
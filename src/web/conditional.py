@@ -0,0 +1,178 @@
+"""
+Conditional requests
+
+This module contains the helpers for conditional requests (RFC 9110): the
+read endpoints send validators with every response, an ``ETag`` and, for
+single rows, a ``Last-Modified``, and answer a request whose validators
+still match with an empty ``304 Not Modified`` instead of the body. Rows
+with a version counter have the version as their entity tag, which writes
+send back in ``If-Match`` to update only the version they were based on.
+
+Validators are computed from a few attributes of the rows (ids, versions,
+update times, role names), never from the serialized body, so revalidating a
+response served from the response cache costs neither a query nor a
+serialization.
+"""
+
+import hashlib
+from datetime import UTC, datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request, Response, status
+
+
+def etag(*parts: Any) -> str:
+    """
+    Get a strong entity tag from the parts defining a representation
+
+    Args:
+        parts (Any): values that change whenever the representation does,
+            e.g. the id and time_updated of a row
+
+    Returns:
+        str: quoted entity tag
+    """
+    digest = hashlib.blake2b(
+        "\x1f".join(map(str, parts)).encode(), digest_size=16
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def version_etag(version: int) -> str:
+    """
+    Get the strong entity tag of a versioned row
+
+    Args:
+        version (int): version of the row
+
+    Returns:
+        str: quoted entity tag, e.g. ``"3"``
+    """
+    return f'"{version}"'
+
+
+def if_match_versions(header: Optional[str]) -> Optional[list[int]]:
+    """
+    Get the versions an ``If-Match`` header allows a write on
+
+    If-Match uses the strong comparison, so weak tags match no version.
+
+    Args:
+        header (Optional[str]): value of the header
+
+    Returns:
+        Optional[list[int]]: versions of the entity tags in the header,
+            possibly none, or None when the header is absent or ``*``
+    """
+    if header is None or header.strip() == "*":
+        return None
+    versions = []
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith('"') and candidate.endswith('"'):
+            try:
+                versions.append(int(candidate[1:-1]))
+            except ValueError:
+                pass
+    return versions
+
+
+def http_date(time: datetime) -> str:
+    """
+    Format a naive UTC time as an HTTP date
+
+    Args:
+        time (datetime): naive UTC time, as stored in the database
+
+    Returns:
+        str: HTTP date, e.g. ``Mon, 01 Jan 2024 00:00:00 GMT``
+    """
+    return format_datetime(time.replace(tzinfo=UTC), usegmt=True)
+
+
+def _etag_matches(header: str, tag: str) -> bool:
+    """
+    Check an ``If-None-Match`` header against an entity tag, with the weak
+    comparison the header calls for
+
+    Args:
+        header (str): value of the header
+        tag (str): entity tag of the current representation
+
+    Returns:
+        bool: whether the client already has the representation
+    """
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == tag
+        for candidate in header.split(",")
+    )
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    """
+    Check an ``If-Modified-Since`` header against a modification time
+
+    Args:
+        header (str): value of the header
+        last_modified (datetime): naive UTC modification time
+
+    Returns:
+        bool: whether the representation is unchanged since the header's
+            date; False when the date cannot be parsed
+    """
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # HTTP dates have a one second resolution
+    return last_modified.replace(
+        tzinfo=UTC, microsecond=0
+    ) <= since.astimezone(UTC)
+
+
+def not_modified(
+    request: Request,
+    response: Response,
+    tag: str,
+    last_modified: Optional[datetime] = None,
+) -> Optional[Response]:
+    """
+    Set the validators of a response and evaluate the request's
+    preconditions
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since``, which is
+    only evaluated when the request has no ``If-None-Match``.
+
+    Args:
+        request (Request): the request
+        response (Response): response whose headers the body is sent with
+        tag (str): entity tag of the representation
+        last_modified (Optional[datetime]): naive UTC modification time of
+            the representation, None when it has none
+
+    Returns:
+        Optional[Response]: a ``304 Not Modified`` response to send instead
+            of the body, or None when the body must be sent
+    """
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        unchanged = _etag_matches(if_none_match, tag)
+    elif if_modified_since is not None and last_modified is not None:
+        unchanged = _not_modified_since(if_modified_since, last_modified)
+    else:
+        unchanged = False
+    if unchanged:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    return None
@@ -0,0 +1,60 @@
+"""
+Model responses
+
+This module contains the response class of the endpoints returning models.
+
+FastAPI validates the value an endpoint returns against its response model,
+dumps it to a dict of JSON types and encodes the dict with ``json.dumps``.
+The services build the response models from trusted database rows, so the
+endpoints return a ``ModelResponse`` instead, which is encoded straight to
+bytes by the model's compiled pydantic-core serializer, with no validation
+and no intermediate dict. The response model of the route is still used for
+the OpenAPI schema.
+"""
+
+from typing import Mapping, Optional
+
+from fastapi import Response, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class ModelResponse(JSONResponse):
+    """
+    JSON response rendered from a pydantic model
+    """
+
+    def render(self, content: BaseModel) -> bytes:
+        """
+        Serialize the model to JSON
+
+        Args:
+            content (BaseModel): the model
+
+        Returns:
+            bytes: the JSON of the model
+        """
+        return content.__pydantic_serializer__.to_json(content)
+
+
+def model_response(
+    content: BaseModel,
+    response: Optional[Response] = None,
+    status_code: int = status.HTTP_200_OK,
+) -> ModelResponse:
+    """
+    Get the response sending a model
+
+    Args:
+        content (BaseModel): the model
+        response (Optional[Response]): response injected in the endpoint,
+            whose headers, e.g. validators, are sent with the model
+        status_code (int): status code of the response
+
+    Returns:
+        ModelResponse: ModelResponse object
+    """
+    headers: Optional[Mapping[str, str]] = (
+        response.headers if response is not None else None
+    )
+    return ModelResponse(content, status_code=status_code, headers=headers)
@@ -4,14 +4,72 @@ User API
 This module contains the user API
 """
 
-from fastapi import APIRouter, HTTPException, status
-from errors.errors import Duplicate, Missing
-from model.user import UserCreate, UserOut, UserUpdate
+from typing import AsyncIterator, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from pydantic import ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from data import get_session
+from data.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from errors.errors import Busy, Duplicate, InvalidCursor, Missing
+from model.user import (
+    UserBatchGet,
+    UserBatchOut,
+    UserCreate,
+    UserImportResult,
+    UserOut,
+    UserPage,
+    UserUpdate,
+)
 from service import user as user_service
+from web.conditional import etag, not_modified
+from web.responses import model_response
 
 user = APIRouter(prefix="/user", tags=["user"])
 
 
+def _user_etag(user: UserOut) -> str:
+    """
+    Get the entity tag of a user
+
+    The role name is part of it: renaming a role changes the user's
+    representation without touching the user row.
+
+    Args:
+        user (UserOut): UserOut object
+
+    Returns:
+        str: entity tag
+    """
+    return etag(user.id, user.time_updated, user.role)
+
+
+def _user_response(
+    request: Request, response: Response, user: UserOut
+) -> Response:
+    """
+    Get the response to a GET of a user
+
+    Args:
+        request (Request): the request
+        response (Response): the response
+        user (UserOut): UserOut object
+
+    Returns:
+        Response: the user, or a 304 response if the client has it
+    """
+    return not_modified(
+        request, response, _user_etag(user), user.time_updated
+    ) or model_response(user, response)
+
+
 @user.get("/")
 async def user_root():
     """
@@ -21,29 +79,141 @@ async def user_root():
 
 
 @user.get("/all")
-async def read_all_users() -> list[UserOut]:
+async def read_all_users(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+) -> UserPage:
+    """
+    Get a page of users, newest first, or 304 if the client has it
+
+    Args:
+        request (Request): the request
+        response (Response): the response
+        cursor (Optional[str]): next_cursor of the previous page
+        limit (int): maximum number of users in the page
+        session (AsyncSession): session of the request
+
+    Returns:
+        UserPage: UserPage object
+    """
+    try:
+        page = await user_service.get_all_users(cursor, limit, session=session)
+        tag = etag(*map(_user_etag, page.items), page.next_cursor)
+        return not_modified(request, response, tag) or model_response(
+            page, response
+        )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+
+
+async def _read_ndjson_users(request: Request) -> AsyncIterator[UserCreate]:
+    """
+    Parse a streamed NDJSON request body into users, line by line
+
+    Args:
+        request (Request): the request
+
+    Yields:
+        UserCreate: UserCreate object
+    """
+    buffer = b""
+    line_number = 0
+
+    def parse(line: bytes) -> UserCreate:
+        try:
+            return UserCreate.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid user on line {line_number}: "
+                f"{e.errors()[0]['msg']}",
+            )
+
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield parse(line)
+    if buffer.strip():
+        line_number += 1
+        yield parse(buffer)
+
+
+@user.post("/import", status_code=status.HTTP_201_CREATED)
+async def import_users(request: Request) -> UserImportResult:
+    """
+    Import users from an NDJSON body, one UserCreate object per line
+
+    The body is read as it arrives and imported in batches, each in its own
+    transaction: users whose username is taken are skipped, and an invalid
+    line stops the import after the batches before it. 503 when the
+    allowed number of imports is already running.
+
+    Args:
+        request (Request): the request
+
+    Returns:
+        UserImportResult: UserImportResult object
     """
-    Get all users
+    try:
+        return await user_service.import_users(_read_ndjson_users(request))
+    except Busy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
+
+
+@user.post("/batch")
+async def read_users(
+    batch: UserBatchGet, session: AsyncSession = Depends(get_session)
+) -> UserBatchOut:
+    """
+    Get many users by id at once
+
+    Args:
+        batch (UserBatchGet): UserBatchGet object
+        session (AsyncSession): session of the request
 
     Returns:
-        List[UserOut]: List of UserOut objects
+        UserBatchOut: the users in request order, null for the ids not
+            found
     """
-    return user_service.get_all_users()
+    return model_response(
+        await user_service.get_users_by_ids(batch, session=session)
+    )
 
 
 @user.get("/{user_id}")
-async def read_user(user_id: str) -> UserOut:
+async def read_user(
+    user_id: str,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+) -> UserOut:
     """
-    Get a user by id
+    Get a user by id, or 304 if the client has it
 
     Args:
         user_id (str): id of the user
+        request (Request): the request
+        response (Response): the response
+        session (AsyncSession): session of the request
 
     Returns:
         UserOut: UserOut object
     """
     try:
-        return user_service.get_user_by_id(user_id)
+        return _user_response(
+            request,
+            response,
+            await user_service.get_user_by_id(user_id, session=session),
+        )
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -51,18 +221,30 @@ async def read_user(user_id: str) -> UserOut:
 
 
 @user.get("/username/{username}")
-async def read_user_by_username(username: str) -> UserOut:
+async def read_user_by_username(
+    username: str,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+) -> UserOut:
     """
-    Get a user by username
+    Get a user by username, or 304 if the client has it
 
     Args:
         username (str): username of the user
+        request (Request): the request
+        response (Response): the response
+        session (AsyncSession): session of the request
 
     Returns:
         UserOut: UserOut object
     """
     try:
-        return user_service.get_user_by_username(username)
+        return _user_response(
+            request,
+            response,
+            await user_service.get_user_by_username(username, session=session),
+        )
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -70,42 +252,63 @@ async def read_user_by_username(username: str) -> UserOut:
 
 
 @user.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-async def create_user(user_create: UserCreate) -> UserOut:
+async def create_user(
+    user_create: UserCreate, session: AsyncSession = Depends(get_session)
+) -> UserOut:
     """
     Create a new user
 
     Args:
         user_create (UserCreate): UserCreate object
+        session (AsyncSession): session of the request
 
     Returns:
         UserOut: UserOut object
     """
     try:
-        return user_service.create_user(user_create)
+        return model_response(
+            await user_service.create_user(user_create, session=session),
+            status_code=status.HTTP_201_CREATED,
+        )
     except Duplicate as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists",
         )
+    except Busy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
 
 
 @user.patch(
     "/{user_id}", response_model=UserOut, status_code=status.HTTP_200_OK
 )
-async def update_user(user_id: str, user_update: UserUpdate) -> UserOut:
+async def update_user(
+    user_id: str,
+    user_update: UserUpdate,
+    session: AsyncSession = Depends(get_session),
+) -> UserOut:
     """
     Update a user
 
     Args:
         user_id (str): id of the user
         user_update (UserUpdate): UserUpdate object
+        session (AsyncSession): session of the request
 
     Returns:
         UserOut: UserOut object
     """
     user_update.id = user_id
     try:
-        return user_service.update_user(user_update)
+        return model_response(
+            await user_service.update_user(user_update, session=session)
+        )
+    except Busy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
     except (Missing, Duplicate) as e:
         if isinstance(e, Missing):
             raise HTTPException(
@@ -124,15 +327,18 @@ async def update_user(user_id: str, user_update: UserUpdate) -> UserOut:
 
 
 @user.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(user_id: str):
+async def delete_user(
+    user_id: str, session: AsyncSession = Depends(get_session)
+):
     """
     Delete a user
 
     Args:
         user_id (str): id of the user
+        session (AsyncSession): session of the request
     """
     try:
-        return user_service.delete_user(user_id)
+        return await user_service.delete_user(user_id, session=session)
     except Missing as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"